@@ -13,74 +13,30 @@ bl_info = {
 import re
 import addon_utils
 import bpy
+from bpy.app.handlers import persistent
 from . cameras import *
 from . dem import *
 from . lightfields import *
 from . plane import *
 from . properties import *
-from . util import clear_scene
+from . pipeline import load_lfr_data, render_range_integral_image, render_range_integral_tiled, render_sequence_frame, render_sequence_video, get_focus_values, render_focal_stack, render_sliding_window_sequence
+from . image_cache import image_cache
+from . prefetch import frame_prefetcher
+from . parallel import render_sequence_parallel
+from . trace import tracer, traced
+from . frame_updates import frame_update_scheduler
+from . proxies import get_proxy_cache_path, proxy_builder
+from . autofocus import auto_focus
+from . poses import clear_scene_pose_tables
+from . time_index import get_frame_time_label, get_time_window_frames, get_timestamp_index, parse_time_input
 
 class LoadLFRDataOperator(bpy.types.Operator):
     bl_idname = "wm.load_data"
     bl_label = "Load LFR Data"
 
+    @traced("LoadLFRDataOperator.execute")
     def execute(self, context):
-        bpy.data.scenes["Scene"].render.use_lock_interface = True
-
-        if pre_frame_change_handler in bpy.app.handlers.frame_change_pre:
-            bpy.app.handlers.frame_change_pre.remove(pre_frame_change_handler)
-
-        clear_scene()
-        bpy.ops.outliner.orphans_purge(do_local_ids=True, do_linked_ids=True, do_recursive=True) #slight memory clean up
-        purge_all_addon_property_data(context)
-
-        lfr_prp = context.scene.lfr_properties
-        lfr_prp.view_range_of_images = False
-
-        correctly_set_or_overwrite_path_strings(lfr_prp)
-
-        lfr_prp.dem_mesh_obj = import_dem(lfr_prp.dem_path, rotation=(0, 0, 0)) #euler rotation
-
-        cameras_collection = lfr_prp.cameras
-        cameras_collection.clear()
-
-        # Add a new camera data item to the collection
-        cameras_data = parse_poses(lfr_prp.json_path, lfr_prp.every_nth_frame)
-
-        #takes the camera dataset and loads it into the lfr_properties.cameras (cameras_collection)
-        if (cameras_data is not None):
-            for camData in cameras_data:
-                camQuaternion = [camData["quaternion"].x, camData["quaternion"].y, camData["quaternion"].z, camData["quaternion"].w]
-                camTimeStamp = camData["timestamp"].isoformat()
-                pos = camData["position"]
-
-                # 0 = X, 1 = Y, 2 = Z
-                # blender uses XZY 
-                z_temp = pos[2]
-                pos[2] = pos[1]
-                pos[1] = z_temp * -1
-
-                new_camera = cameras_collection.add()
-                new_camera.fovy = camData["fovy"]
-                new_camera.aspect = camData["aspect"]
-                new_camera.near = camData["near"]
-                new_camera.far = camData["far"]
-                new_camera.location = pos
-                new_camera.quaternion = camQuaternion
-                new_camera.image_file = camData["image_file"]
-                new_camera.timestamp = camTimeStamp
-
-            if (context.scene.frame_current > len(cameras_collection)-1): 
-                bpy.context.scene.frame_set(1)
-
-            init_startup_objs(self, context) # generates main camera and potentially a projection plane
-            create_curve_data_and_key_frames(lfr_prp) # rendering camera gets generated inside
-            bpy.app.handlers.frame_change_pre.append(pre_frame_change_handler) 
-            bpy.context.scene.frame_set(1)
-
-            bpy.ops.object.mode_set(mode="OBJECT")    
-            bpy.ops.object.select_all(action='DESELECT') # deselect everything
-            bpy.data.objects[lfr_prp.cam_obj.name].select_set(True) # have camera selected after loading
+        load_lfr_data(context)
         return {'FINISHED'}
 
 def render_cleanup_memory(scene):
@@ -101,22 +57,47 @@ class RenderRangeOfImagesOperator(bpy.types.Operator):
         lfr_prp = context.scene.lfr_properties
         current_frame_number = context.scene.frame_current-1
 
-        lfr_prp.view_range_of_images = False
-
-        #----
-        if pre_frame_change_handler in bpy.app.handlers.frame_change_pre:
-            bpy.app.handlers.frame_change_pre.remove(pre_frame_change_handler)
+        if lfr_prp.tiled_integration and lfr_prp.integration_engine != 'RENDER':
+            self.report({'WARNING'}, f"Tiled integration only works with the Blender Render engine, rendering the whole image with {lfr_prp.integration_engine}")
+        elif lfr_prp.tiled_integration:
+            # the tiles are written as they finish, the whole image never is in memory
+            result_path = render_range_integral_tiled(context, current_frame_number, lfr_prp.render_path + "combined_range_image")
+            self.report({'INFO'}, f"Tiled integral image written to {result_path}")
+            return {'FINISHED'}
 
-        apply_images_and_positions_to_planes_from_range(lfr_prp, current_frame_number)
-        offset_proj_cameras_with_focus(lfr_prp, current_frame_number) #reposition cameras depending on focus
-        result_image = combine_images(lfr_prp)
-        bpy.app.handlers.frame_change_pre.append(pre_frame_change_handler) 
-        #----
+        result_image = render_range_integral_image(context, current_frame_number)
         save_image_to_disk(lfr_prp.render_path, "combined_range_image.png", result_image, True)
-        delete_temp_objects_of_range_rendering(lfr_prp)
+        bpy.data.images.remove(result_image, do_unlink=True) # already on disk, frame changes no longer purge orphaned images
         
         return {'FINISHED'}
 
+class RenderFocalStackOperator(bpy.types.Operator):
+    bl_idname = "wm.render_focal_stack"
+    bl_label = "Render Focal Stack"
+
+    def execute(self, context):
+        lfr_prp = context.scene.lfr_properties
+        current_frame_number = context.scene.frame_current-1
+
+        focus_values = get_focus_values(lfr_prp.focal_stack_start, lfr_prp.focal_stack_end, lfr_prp.focal_stack_steps)
+        file_paths = render_focal_stack(context, current_frame_number, focus_values, lfr_prp.render_path)
+        self.report({'INFO'}, f"{len(file_paths)} focal stack images written to {lfr_prp.render_path}")
+        return {'FINISHED'}
+
+class AutoFocusOperator(bpy.types.Operator):
+    bl_idname = "wm.auto_focus"
+    bl_label = "Auto Focus"
+
+    def execute(self, context):
+        lfr_prp = context.scene.lfr_properties
+        current_frame_number = context.scene.frame_current-1
+
+        roi = tuple(lfr_prp.autofocus_roi) if lfr_prp.autofocus_use_roi else None
+        best_focus, scores = auto_focus(context, current_frame_number, lfr_prp.focal_stack_start, lfr_prp.focal_stack_end, roi)
+        lfr_prp.focus = best_focus
+        self.report({'INFO'}, f"Focus set to {best_focus:.3f} ({len(scores)} candidates)")
+        return {'FINISHED'}
+
 class RenderFromCurrentKeyFrameOperator(bpy.types.Operator):
     bl_idname = "wm.render_from_keyframe"
     bl_label = "Render From Current KeyFrame"
@@ -127,30 +108,50 @@ class RenderFromCurrentKeyFrameOperator(bpy.types.Operator):
         end_key_Frame = context.scene.frame_end
         print("rendering...")
 
-        if lfr_props.render_as_animation is True:
-            bpy.context.scene.render.image_settings.file_format = 'FFMPEG'
-            bpy.context.scene.render.ffmpeg.format = 'MPEG4'
-            bpy.context.scene.render.ffmpeg.codec = 'H264'
-            bpy.context.scene.render.filepath = lfr_props.render_path + "Render_Result_Video.mp4"
+        if lfr_props.sliding_window_integral:
+            try:
+                file_paths = render_sliding_window_sequence(context, current_frame_number, end_key_Frame, lambda i: f"Integral_Result_{i}.png")
+            except ValueError as error:
+                self.report({'ERROR'}, str(error))
+                return {'CANCELLED'}
+            finally:
+                bpy.context.scene.frame_set(current_frame_number) #set back to initial key-frame
 
-            # Iterate through the keyframes and render them
-            for i in range(current_frame_number, end_key_Frame):
-                bpy.context.scene.frame_set(i)
-                bpy.ops.render.render(animation=True)
+            self.report({'INFO'}, f"Rendered {len(file_paths)} integral images")
+            return {'FINISHED'}
+
+        if lfr_props.render_as_animation is True:
+            render_sequence_video(bpy.context.scene, current_frame_number, end_key_Frame, lfr_props.render_path + "Render_Result_Video.mp4")
         else:
             bpy.context.scene.render.image_settings.file_format = 'JPEG'
 
+            if lfr_props.render_workers > 1:
+                # every worker opens a copy of this file and renders one chunk of the frames
+                file_format = bpy.context.scene.render.image_settings.file_format
+
+                def name_for_frame(i):
+                    if lfr_props.save_rend_images:
+                        return f"Render_Result_{i}." + file_format
+                    return "Render_Result." + file_format
+
+                collected, missing_count = render_sequence_parallel(context, current_frame_number, end_key_Frame - 1, lfr_props.render_workers, name_for_frame)
+                bpy.context.scene.frame_set(current_frame_number) #set back to initial key-frame
+                if missing_count:
+                    self.report({'ERROR'}, f"{missing_count} frames are missing, render workers failed (see the console)")
+                    return {'CANCELLED'}
+                return {'FINISHED'}
+
             if lfr_props.save_rend_images is False:
                 if has_file_with_extension(lfr_props.render_path) is False:
                     bpy.context.scene.render.filepath = lfr_props.render_path + "Render_Result." + bpy.context.scene.render.image_settings.file_format 
 
             # Iterate through the keyframes and render them
             for i in range(current_frame_number, end_key_Frame):
-                bpy.context.scene.frame_set(i)
+                filepath = bpy.context.scene.render.filepath
                 if lfr_props.save_rend_images:
-                    bpy.context.scene.render.filepath = lfr_props.render_path + f"Render_Result_{i}." + bpy.context.scene.render.image_settings.file_format
+                    filepath = lfr_props.render_path + f"Render_Result_{i}." + bpy.context.scene.render.image_settings.file_format
 
-                bpy.ops.render.render(write_still=True)
+                render_sequence_frame(bpy.context.scene, i, filepath)
 
         print("done rendering")
         bpy.context.scene.frame_set(current_frame_number) #set back to initial key-frame
@@ -211,6 +212,95 @@ class ClearRenderFolderOperator(bpy.types.Operator):
         
         return {'FINISHED'}
 
+class JumpToTimeOperator(bpy.types.Operator):
+    bl_idname = "wm.jump_to_time"
+    bl_label = "Jump To Time"
+
+    def execute(self, context):
+        lfr_prp = context.scene.lfr_properties
+        index = get_timestamp_index(lfr_prp)
+        try:
+            frame = index.find_nearest_frame(parse_time_input(lfr_prp.time_target, index))
+        except ValueError as error:
+            self.report({'ERROR'}, str(error))
+            return {'CANCELLED'}
+
+        if frame is None:
+            self.report({'ERROR'}, "The recording has no timestamps.")
+            return {'CANCELLED'}
+
+        context.scene.frame_set(frame)
+        return {'FINISHED'}
+
+class PreviewTimeWindowOperator(bpy.types.Operator):
+    bl_idname = "wm.preview_time_window"
+    bl_label = "Preview Time Window"
+
+    def execute(self, context):
+        lfr_prp = context.scene.lfr_properties
+        try:
+            frames = get_time_window_frames(lfr_prp, lfr_prp.time_target, lfr_prp.time_window_seconds)
+        except ValueError as error:
+            self.report({'ERROR'}, str(error))
+            return {'CANCELLED'}
+
+        if len(frames) == 0:
+            self.report({'WARNING'}, "No frames in the time window.")
+            return {'CANCELLED'}
+
+        # the timeline preview range, the scene's own frame range stays untouched
+        context.scene.use_preview_range = True
+        context.scene.frame_preview_start = frames[0]
+        context.scene.frame_preview_end = frames[-1]
+        context.scene.frame_set(frames[0])
+        self.report({'INFO'}, f"Previewing frames {frames[0]} - {frames[-1]}")
+        return {'FINISHED'}
+
+class RenderTimeWindowOperator(bpy.types.Operator):
+    bl_idname = "wm.render_time_window"
+    bl_label = "Render Time Window"
+
+    def execute(self, context):
+        lfr_props = context.scene.lfr_properties
+        current_frame_number = context.scene.frame_current
+        try:
+            frames = get_time_window_frames(lfr_props, lfr_props.time_target, lfr_props.time_window_seconds)
+        except ValueError as error:
+            self.report({'ERROR'}, str(error))
+            return {'CANCELLED'}
+
+        bpy.context.scene.render.image_settings.file_format = 'JPEG'
+        file_format = bpy.context.scene.render.image_settings.file_format
+        print("rendering...")
+        for i in frames:
+            render_sequence_frame(bpy.context.scene, i, lfr_props.render_path + f"Render_Result_{i}." + file_format)
+
+        print("done rendering")
+        bpy.context.scene.frame_set(current_frame_number) #set back to initial frame
+        self.report({'INFO'}, f"Rendered {len(frames)} frames of the time window")
+        return {'FINISHED'}
+
+class ExportTraceOperator(bpy.types.Operator):
+    bl_idname = "wm.export_lfr_trace"
+    bl_label = "Export Trace"
+
+    def execute(self, context):
+        lfr_prp = context.scene.lfr_properties
+        render_path = lfr_prp.render_path or bpy.context.scene.render.filepath
+        trace_path = os.path.join(os.path.dirname(render_path), "lfr_trace.json")
+
+        event_count = tracer.export_chrome_trace(trace_path)
+        self.report({'INFO'}, f"Exported {event_count} spans to {trace_path} (open in chrome://tracing or ui.perfetto.dev)")
+        return {'FINISHED'}
+
+class ClearTraceOperator(bpy.types.Operator):
+    bl_idname = "wm.clear_lfr_trace"
+    bl_label = "Clear Trace"
+
+    def execute(self, context):
+        tracer.clear()
+        return {'FINISHED'}
+
 #---------------------------------
 
 class LFRPanel(bpy.types.Panel):
@@ -235,6 +325,16 @@ class LFRPanel(bpy.types.Panel):
         row.prop(addon_props, "view_range_of_images", text="View range of images?")
         row = layout.row()
         row.operator("wm.render_image_range", text="Render Range of Images")
+        row = layout.row(align=True)
+        row.prop(addon_props, "focal_stack_start", text="Focus From")
+        row.prop(addon_props, "focal_stack_end", text="To")
+        row.prop(addon_props, "focal_stack_steps", text="Steps")
+        row = layout.row(align=True)
+        row.operator("wm.render_focal_stack", text="Render Focal Stack")
+        row.operator("wm.auto_focus", text="Auto Focus")
+        row = layout.row(align=True)
+        row.prop(addon_props, "autofocus_use_roi", text="Region")
+        row.prop(addon_props, "autofocus_roi", text="")
         layout.operator("wm.render_from_keyframe", text="Render Images From Current KeyFrame")
 
 
@@ -258,49 +358,142 @@ class AdditionalOptionsPanel(bpy.types.Panel):
         row = layout.row(align=True)
         row.prop(addon_props, "save_rend_images", text="Save Rendered Images Individually?") 
         row.prop(addon_props, "render_as_animation", text="Render as video?")
+        row.prop(addon_props, "sliding_window_integral", text="Sliding Window Integral")
         row.operator("wm.open_render_folder", text="Open Render Folder")
         row.operator("wm.clear_render_folder", text="Clear Render Folder Content")
         row = layout.row(align=False)
         layout.prop(addon_props, "man_render_path", text="Set Render Folder")  
         layout.prop(addon_props, "man_dem_path", text="Set DEM File Path Manually") 
         layout.prop(addon_props, "man_json_path", text="Set JSON File Path Manually") 
+        layout.prop(addon_props, "render_workers", text="Render Workers")
+        layout.prop(addon_props, "integration_engine", text="Integration Engine")
+        row = layout.row(align=True)
+        row.prop(addon_props, "view_selection", text="Views")
+        row.prop(addon_props, "view_direction_weight", text="Direction Weight")
+        row = layout.row(align=True)
+        row.active = addon_props.integration_engine == 'RENDER' # the other engines ignore it
+        row.prop(addon_props, "tiled_integration", text="Tiled Integration")
+        row.prop(addon_props, "tile_size", text="Tile Size")
+        layout.prop(addon_props, "image_cache_budget_mb", text="Image Cache Budget (MB)")
+        layout.prop(addon_props, "prefetch_frames", text="Prefetch Frames")
+        layout.prop(addon_props, "proxy_resolution", text="Viewport Image Resolution")
+        layout.prop(addon_props, "proxy_cache_path", text="Proxy Cache Folder")
+        proxies_built, proxy_count = proxy_builder.progress(get_proxy_cache_path(addon_props)) if addon_props.cameras_path else (0, 0)
+        if proxy_count:
+            layout.label(text=f"Proxies: {proxies_built}/{proxy_count} images")
+        layout.label(text=f"Image cache: {image_cache.hits} hits, {image_cache.misses} misses, {image_cache.used_bytes // (1024 * 1024)} MB")
      
+class TimePanel(bpy.types.Panel):
+    bl_label = "Time"
+    bl_idname = "PT_Bambi_LFR_Time_Panel"
+    bl_space_type = "VIEW_3D"
+    bl_region_type = "UI"
+    bl_category = "Time"
+    bl_parent_id = "PT_Bambi_LFR"
+    bl_options = {"DEFAULT_CLOSED"}
+
+    def draw(self, context):
+        layout = self.layout
+        addon_props = context.scene.lfr_properties
+        layout.prop(addon_props, "time_target", text="Time")
+        layout.prop(addon_props, "time_window_seconds", text="Window (s)")
+        row = layout.row(align=True)
+        row.operator("wm.jump_to_time", text="Jump")
+        row.operator("wm.preview_time_window", text="Preview Window")
+        row.operator("wm.render_time_window", text="Render Window")
+
+        frame_time = get_frame_time_label(addon_props, context.scene.frame_current)
+        if frame_time:
+            layout.label(text=f"Frame time: {frame_time}")
+
+class TracingPanel(bpy.types.Panel):
+    bl_label = "Tracing"
+    bl_idname = "PT_Bambi_LFR_Trace_Panel"
+    bl_space_type = "VIEW_3D"
+    bl_region_type = "UI"
+    bl_category = "Tracing"
+    bl_parent_id = "PT_Bambi_LFR"
+    bl_options = {"DEFAULT_CLOSED"}
+
+    def draw(self, context):
+        layout = self.layout
+        addon_props = context.scene.lfr_properties
+        row = layout.row(align=True)
+        row.prop(addon_props, "trace_enabled", text="Record Trace")
+        row.operator("wm.export_lfr_trace", text="Export Trace")
+        row.operator("wm.clear_lfr_trace", text="Clear")
+
+        layout.label(text=f"{min(tracer.event_count, tracer.capacity)} spans recorded")
+        column = layout.column(align=True)
+        for name, (count, p50, p95, total) in tracer.summary().items():
+            column.label(text=f"{name}: {count}x  p50 {p50:.1f} ms  p95 {p95:.1f} ms")
+
+@persistent
+def reset_pose_tables_handler(*args):
+    # after loading a file, undo and redo the pose tables have to come from the restored pose_blob
+    clear_scene_pose_tables()
+
 def register():
     addon_utils.enable('io_import_images_as_planes', default_set=True, persistent=True, handle_error=None)
     bpy.utils.register_class(RangeMeshPropertyGroup)
-    bpy.utils.register_class(CameraDataPropertyGroup)
     bpy.utils.register_class(ImagePropertyGroup)
     bpy.utils.register_class(LFRProperties)
     bpy.types.Scene.lfr_properties = bpy.props.PointerProperty(type=LFRProperties)
     bpy.utils.register_class(LoadLFRDataOperator)
     bpy.utils.register_class(RenderRangeOfImagesOperator)
+    bpy.utils.register_class(RenderFocalStackOperator)
+    bpy.utils.register_class(AutoFocusOperator)
     bpy.utils.register_class(OpenRenderFolderOperator)
     bpy.utils.register_class(ClearRenderFolderOperator)
     bpy.utils.register_class(RenderFromCurrentKeyFrameOperator)
     bpy.utils.register_class(LFRPanel)
     bpy.utils.register_class(AdditionalOptionsPanel)
+    bpy.utils.register_class(JumpToTimeOperator)
+    bpy.utils.register_class(PreviewTimeWindowOperator)
+    bpy.utils.register_class(RenderTimeWindowOperator)
+    bpy.utils.register_class(ExportTraceOperator)
+    bpy.utils.register_class(ClearTraceOperator)
+    bpy.utils.register_class(TimePanel)
+    bpy.utils.register_class(TracingPanel)
 
     bpy.app.handlers.frame_change_pre.append(pre_frame_change_handler)
+    for handlers in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        handlers.append(reset_pose_tables_handler)
 
 
 def unregister():        
     addon_utils.disable('io_import_images_as_planes', default_set=False, handle_error=None)
 
     bpy.utils.unregister_class(RangeMeshPropertyGroup)
-    bpy.utils.unregister_class(CameraDataPropertyGroup)
     bpy.utils.unregister_class(ImagePropertyGroup)
     bpy.utils.unregister_class(LFRProperties)
     del bpy.types.Scene.lfr_properties
     bpy.utils.unregister_class(LoadLFRDataOperator)
     bpy.utils.unregister_class(RenderRangeOfImagesOperator)
+    bpy.utils.unregister_class(RenderFocalStackOperator)
+    bpy.utils.unregister_class(AutoFocusOperator)
     bpy.utils.unregister_class(OpenRenderFolderOperator)
     bpy.utils.unregister_class(ClearRenderFolderOperator)
     bpy.utils.unregister_class(RenderFromCurrentKeyFrameOperator)
     bpy.utils.unregister_class(LFRPanel)
     bpy.utils.unregister_class(AdditionalOptionsPanel)
+    bpy.utils.unregister_class(JumpToTimeOperator)
+    bpy.utils.unregister_class(PreviewTimeWindowOperator)
+    bpy.utils.unregister_class(RenderTimeWindowOperator)
+    bpy.utils.unregister_class(ExportTraceOperator)
+    bpy.utils.unregister_class(ClearTraceOperator)
+    bpy.utils.unregister_class(TimePanel)
+    bpy.utils.unregister_class(TracingPanel)
 
     if pre_frame_change_handler in bpy.app.handlers.frame_change_pre:
         bpy.app.handlers.frame_change_pre.remove(pre_frame_change_handler)
+    for handlers in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        if reset_pose_tables_handler in handlers:
+            handlers.remove(reset_pose_tables_handler)
+
+    frame_update_scheduler.cancel()
+    frame_prefetcher.shutdown()
+    proxy_builder.shutdown()
 
 if __name__ == "__main__":
     register()
\ No newline at end of file
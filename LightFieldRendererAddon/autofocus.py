@@ -0,0 +1,114 @@
+import bpy
+import numpy as np
+from . pipeline import focus_range_renderer, get_focus_values
+from . trace import span, traced
+
+# Coarse-to-fine focus search. Every candidate focus is integrated (see focus_range_renderer, the
+# range is only loaded once) and scored by the variance of the Laplacian of its luminance, an
+# in-focus integral image has the sharpest edges. Each pass samples the interval around the best
+# focus of the previous pass, the early passes run at a reduced resolution and only integrate every
+# n-th view of the range (a smaller aperture, the sharpness peak stays at the same focus).
+# The final focus is interpolated between the best candidate of the last pass and its neighbours.
+# Cost with K views: NUMPY about 5 full resolution integrations (its cost follows the pixel count),
+# RENDER renders 9*K/4 + 5*K/2 + 3*K = about 7.75*K single views (MULTIVIEW: the same in batches of 16),
+# there the per render scene sync dominates the low resolution passes, so about 8 full integrations.
+
+AUTOFOCUS_PASSES = ((25, 9, 4), (50, 5, 2), (100, 3, 1)) # (resolution percentage, candidates, view stride)
+
+def image_to_luminance(image):
+    # bpy image -> (height, width) luminance and alpha, rows bottom-up like blender stores them
+    width, height = image.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    pixels = pixels.reshape((height, width, 4))
+    luminance = pixels[:, :, 0] * 0.2126 + pixels[:, :, 1] * 0.7152 + pixels[:, :, 2] * 0.0722
+    return luminance, pixels[:, :, 3]
+
+def crop_to_roi(values, roi):
+    # roi = (min x, min y, max x, max y) relative to the image size, origin bottom-left
+    height, width = values.shape
+    x0 = int(roi[0] * width)
+    y0 = int(roi[1] * height)
+    x1 = max(x0 + 3, int(roi[2] * width))
+    y1 = max(y0 + 3, int(roi[3] * height))
+    return values[y0:y1, x0:x1]
+
+def laplacian_variance(luminance, alpha=None, roi=None):
+    if roi is not None:
+        luminance = crop_to_roi(luminance, roi)
+        if alpha is not None:
+            alpha = crop_to_roi(alpha, roi)
+
+    if luminance.shape[0] < 3 or luminance.shape[1] < 3:
+        return 0.0
+
+    # 4-neighbour Laplacian of the inner pixels
+    laplacian = (luminance[:-2, 1:-1] + luminance[2:, 1:-1] + luminance[1:-1, :-2] + luminance[1:-1, 2:]
+                 - 4.0 * luminance[1:-1, 1:-1])
+
+    if alpha is not None:
+        # the border of the covered area is an edge at every focus, only fully covered neighbourhoods count
+        covered = alpha > 0.5
+        covered = (covered[1:-1, 1:-1] & covered[:-2, 1:-1] & covered[2:, 1:-1]
+                   & covered[1:-1, :-2] & covered[1:-1, 2:])
+        laplacian = laplacian[covered]
+
+    if laplacian.size == 0:
+        return 0.0
+    return float(laplacian.var())
+
+def score_focus_image(image, roi=None):
+    luminance, alpha = image_to_luminance(image)
+    return laplacian_variance(luminance, alpha, roi)
+
+def parabola_peak_offset(left, center, right):
+    # peak of the parabola through three equally spaced scores, in steps relative to the center
+    curvature = left - 2.0 * center + right
+    if curvature >= 0.0:
+        return 0.0
+    return float(np.clip(0.5 * (left - right) / curvature, -0.5, 0.5))
+
+def search_focus(score_focus, focus_start, focus_end, passes=AUTOFOCUS_PASSES):
+    # score_focus(focus, resolution percentage, view stride) -> sharpness, returns the best focus and all scores
+    scores = []
+    low, high = min(focus_start, focus_end), max(focus_start, focus_end)
+    best_focus = low
+
+    for resolution_percentage, candidates, view_stride in passes:
+        focus_values = get_focus_values(low, high, candidates)
+        pass_scores = [score_focus(focus, resolution_percentage, view_stride) for focus in focus_values]
+        scores.extend((resolution_percentage, focus, score) for focus, score in zip(focus_values, pass_scores))
+
+        best_index = int(np.argmax(pass_scores))
+        best_focus = focus_values[best_index]
+        step = (high - low) / max(1, candidates - 1)
+        # the next pass samples between the neighbours of the best candidate
+        low = max(min(focus_start, focus_end), best_focus - step)
+        high = min(max(focus_start, focus_end), best_focus + step)
+
+    if 0 < best_index < len(pass_scores) - 1:
+        best_focus += parabola_peak_offset(*pass_scores[best_index - 1:best_index + 2]) * step
+
+    return best_focus, scores
+
+@traced("auto_focus")
+def auto_focus(context, start_keyframe_index, focus_start, focus_end, roi=None, passes=AUTOFOCUS_PASSES):
+    render_settings = context.scene.render
+    original_percentage = render_settings.resolution_percentage
+
+    try:
+        with focus_range_renderer(context, start_keyframe_index) as render_focus:
+            def score_focus(focus, resolution_percentage, view_stride):
+                render_settings.resolution_percentage = max(1, original_percentage * resolution_percentage // 100)
+                with span("auto_focus.candidate"):
+                    result_image = render_focus(focus, view_stride)
+                    score = score_focus_image(result_image, roi)
+                bpy.data.images.remove(result_image, do_unlink=True)
+                print(f"auto focus: focus {focus:.3f} at {resolution_percentage}% -> {score:.6f}")
+                return score
+
+            best_focus, scores = search_focus(score_focus, focus_start, focus_end, passes)
+    finally:
+        render_settings.resolution_percentage = original_percentage
+
+    return best_focus, scores
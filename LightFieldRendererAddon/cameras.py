@@ -1,151 +1,149 @@
-from datetime import datetime
-import json
-from math import radians
 import bpy
 from mathutils import *
+import numpy as np
 
-from . plane import create_giant_projection_plane
+from . plane import create_range_projection_plane, update_projection_material_tex
+from . image_cache import image_cache
+from . poses import load_pose_table, get_pose_table
+from . trace import traced
 
 from . util import *
 
-try:
-    from dateutil import parser
-except ImportError:
-    print("python-dateutil is not installed. Installing...")
-    try:
-        import pip
-        pip.main(["install", "python-dateutil"])
-        from dateutil import parser
-        print("python-dateutil has been successfully installed.")
-    except ImportError:
-        print("Failed to install python-dateutil. Please install it manually.")
-        raise
-
+@traced("parse_poses")
 def parse_poses(posesUrl, nth_frame):
+    # columnar pose table, cached next to the json file (see poses.py)
+    return load_pose_table(posesUrl, nth_frame)
 
-    with open(posesUrl, 'r') as file:
-        poses = json.load(file)
 
-    frames = None
-    if "images" in poses:
-        frames = poses["images"]
-    elif "frames" in poses:
-        frames = poses["frames"]
-    else:
-        print("No 'images' or 'frames' found in poses")
-        return
-    
-    cameras = []
+def create_curve_data_and_key_frames(lfr_props):
+    poses = get_pose_table(lfr_props)
+    camera_obj = lfr_props.cam_obj
+    camera_count = len(poses)
 
-    i = 0
+    locations = np.asarray(poses.locations, dtype=np.float32)
+    quaternions = poses.quaternions
+    fovys = poses.fovy
 
-    total_frames = len(frames)/nth_frame
+    path = create_camera_path(locations)
 
-    for i in range(0, len(frames), nth_frame):
-        pose = frames[i]
-        quat = Quaternion()
+    bpy.context.scene.frame_end = camera_count
 
-        if "rotation" not in pose or "location" not in pose or "imagefile" not in pose:
-            continue
+    eulers = np.empty((camera_count, 3), dtype=np.float32)
+    for i in range(camera_count):
+        eulers[i] = Quaternion(quaternions[i]).to_euler()
 
-        if len(pose["rotation"]) == 4:
-            # Assume we have a quaternion
-            quat.x, quat.y, quat.z, quat.w = pose["rotation"]
-        elif len(pose["rotation"]) == 3:
-            # Assume we have Euler angles
+    # Set keyframes for the camera location, rotation and focal length (not FOV) in bulk
+    frames = np.arange(1, camera_count + 1, dtype=np.float32)
+    camera_obj.rotation_mode = 'XYZ'
+    camera_action = get_or_create_action(camera_obj, "LFR_CameraAction")
+    for axis in range(3):
+        add_fcurve_keyframes(camera_action, "location", axis, frames, locations[:, axis], "Object Transforms")
+        add_fcurve_keyframes(camera_action, "rotation_euler", axis, frames, eulers[:, axis], "Object Transforms")
 
-            # IMPORTANT: very likely needs to be changed
-            pose["rotation"][1] = pose["rotation"][1] + 180 # hot fix ---------------------------------------<<<
-            pose["rotation"][2] = pose["rotation"][2] - 90 # hot fix ---------------------------------------<<<
+    lens_action = get_or_create_action(camera_obj.data, "LFR_LensAction")
+    add_fcurve_keyframes(lens_action, "lens", 0, frames, fovys)
 
-            euler_angles_radians = [radians(angle) for angle in pose["rotation"]]
-            euler = Euler(euler_angles_radians, 'XYZ')
-            quat = euler.to_quaternion()
+    camera_obj.location = locations[0]
+    camera_obj.rotation_euler = eulers[0]
+    camera_obj.data.lens = fovys[0]
 
-        if "fovy" not in pose:
-            print(f"Pose {i} has no 'fovy' property!")
-            raise ValueError(f"Pose {i} has no 'fovy' property!")
+    # slight offset so that when viewing the cameras perspective in the viewport
+    # we wont see clippings of the red line (even if visible, the red path is excluded during rendering)
+    path.location = (path.location.x, path.location.y - 1.0, path.location.z)
 
-        if isinstance(pose["fovy"], list):
-            pose["fovy"] = pose["fovy"][0]
+def create_camera_path(locations, decimate_ratio=0.3):
+    # keeps roughly decimate_ratio of the camera positions, first and last position are always kept
+    step = max(int(round(1 / decimate_ratio)), 1)
+    path_points = locations[::step]
+    if (len(locations) - 1) % step != 0:
+        path_points = np.vstack((path_points, locations[-1:]))
 
-        if not isinstance(pose["fovy"], (int, float)):
-            print(f"Pose {i} has no numeric 'fovy' property!")
-            raise ValueError(f"Pose {i} has no numeric 'fovy' property!")
+    curve_data = bpy.data.curves.new(name="LFR_Path", type='CURVE')
+    curve_data.dimensions = '3D'
+    spline = curve_data.splines.new('POLY')
+    spline.points.add(len(path_points) - 1) # a new spline already has one point
 
-        # Remove the colon from the timezone offset
-        parsed_date = parser.parse(pose["timestamp"])
+    coords = np.ones((len(path_points), 4), dtype=np.float32) # x, y, z, w
+    coords[:, :3] = path_points
+    spline.points.foreach_set("co", coords.reshape(-1))
 
-        # Define the format string without %z
-        format_string = '%Y-%m-%dT%H:%M:%S.%f'
+    path = bpy.data.objects.new("LFR_Path", curve_data)
+    link_obj(bpy.context.scene.collection, path)    
+    path.hide_render = True
 
+    # Create red material
+    material = bpy.data.materials.new(name="RedMaterial")
+    material.diffuse_color = (1, 0, 0, 1)  # Set the color to red
 
-        camera = {
-            "fovy": pose["fovy"],
-            "aspect": 1.0,
-            "near": 0.5,
-            "far": 100,
-            "position": pose["location"],
-            "quaternion": quat,
-            "image_file": pose["imagefile"],
-            "timestamp": parsed_date
-        }
+    curve_data.materials.append(material)
+    curve_data.bevel_depth = 0.1 # Set the thickness (bevel depth) of the curve
+    return path
 
-        cameras.append(camera)
+def get_or_create_action(id_data, action_name):
+    animation_data = id_data.animation_data_create()
+    if animation_data.action is None:
+        animation_data.action = bpy.data.actions.new(name=action_name)
+    return animation_data.action
 
-        #print(i/nth_frame, " out of ", total_frames)
+def add_fcurve_keyframes(action, data_path, index, frames, values, action_group=""):
+    fcurve = action.fcurves.find(data_path, index=index)
+    if fcurve is not None:
+        action.fcurves.remove(fcurve)
 
-    return cameras
+    fcurve = action.fcurves.new(data_path, index=index, action_group=action_group)
+    fcurve.keyframe_points.add(len(frames))
 
+    co = np.empty((len(frames), 2), dtype=np.float32) # frame, value pairs
+    co[:, 0] = frames
+    co[:, 1] = values
+    fcurve.keyframe_points.foreach_set("co", co.reshape(-1))
+    fcurve.update() # sorts the points and recalculates the handles
+    return fcurve
 
-def create_curve_data_and_key_frames(lfr_props):
-    cameras_collection = lfr_props.cameras
-    camera_obj = lfr_props.cam_obj
+def get_range_plane_location(lfr_props, camera_number):
+    # range planes are layered slightly in front of each other
+    base_location = lfr_props.projection_mesh_obj.location
+    return (base_location.x, base_location.y - (0.01 * camera_number), base_location.z)
 
-    # Create a path
-    first_cam_location = cameras_collection[0].location
-    bpy.ops.curve.primitive_bezier_curve_add(enter_editmode=False, align='WORLD', location=first_cam_location)
+def bind_range_object_to_pose(lfr_props, range_obj_set, full_image_path, camera_number):
+    poses = get_pose_table(lfr_props)
+    proj_cam = range_obj_set.proj_cam
+    proj_cam.location = poses.locations[camera_number]
+    range_obj_set.original_location = proj_cam.location
+    proj_cam.rotation_mode = 'QUATERNION'
+    proj_cam.rotation_quaternion = poses.quaternions[camera_number]
+    proj_cam.data.lens = poses.fovy[camera_number]  # Set the focal length (not FOV)
 
-    path = bpy.context.active_object
-    path.name = "LFR_Path"
-    link_obj(bpy.context.scene.collection, path)    
-    path.hide_render = True
+    range_obj_set.mesh.location = get_range_plane_location(lfr_props, camera_number)
+    update_projection_material_tex(range_obj_set.material, image_cache.get(full_image_path))
 
-    # Create red material
-    material = bpy.data.materials.new(name="RedMaterial")
-    material.diffuse_color = (1, 0, 0, 1)  # Set the color to red
+def acquire_pooled_range_object(lfr_props, full_image_path, camera_number):
+    pool = lfr_props.pooled_range_objects
 
-    path_data = path.data
-    path_data.materials.append(material)
-    path_data.bevel_depth = 0.1 # Set the thickness (bevel depth) of the curve
-
-
-    bpy.context.scene.frame_end = len(cameras_collection)
-
-    # Set keyframes for the camera location
-    for i, camera_data in enumerate(cameras_collection):
-        frame = i + 1
-        # Add a control point for the path
-        bpy.ops.object.mode_set(mode='EDIT') # currently selected object is path
-        bpy.ops.curve.vertex_add(location=camera_data.location)
-        bpy.ops.curve.decimate(ratio=0.3)     # Add Simplify Curve modifier
-        bpy.ops.object.mode_set(mode='OBJECT')
-        bpy.context.scene.frame_set(frame)
-
-        camera_obj.location = camera_data.location
-        camera_obj.rotation_mode = 'XYZ'
-        camera_obj.rotation_euler = Quaternion(camera_data.quaternion).to_euler()
-        camera_obj.data.lens = camera_data.fovy  # Set the focal length (not FOV)
-         
-        camera_obj.keyframe_insert(data_path="location", index=-1)
-        camera_obj.keyframe_insert(data_path="rotation_euler", index=-1)
-        camera_obj.data.keyframe_insert(data_path="lens", index=-1)  # Keyframe for focal length
-    
-    # slight offset so that when viewing the cameras perspective in the viewport
-    # we wont see clippings of the red line (even if visible, the red path is excluded during rendering)
-    path.location = (path.location.x, path.location.y - 1.0, path.location.z)
+    while len(pool) > 0:
+        pooled = pool[len(pool) - 1]
+
+        if pooled.mesh and pooled.proj_cam and pooled.material: # could have been deleted by the user
+            range_obj_set = lfr_props.range_objects.add()
+            copy_range_object_entry(pooled, range_obj_set)
+            pool.remove(len(pool) - 1)
+
+            bind_range_object_to_pose(lfr_props, range_obj_set, full_image_path, camera_number)
+            set_range_object_hidden(range_obj_set, False)
+            return range_obj_set.proj_cam
 
+        pool.remove(len(pool) - 1)
+
+    return None
+
+@traced("create_and_prep_new_camera")
 def create_and_prep_new_camera(lfr_props, full_image_path, full_mask_path, camera_number):
+    if camera_number != 0:
+        # only append a new projection group if none is left in the pool
+        pooled_camera = acquire_pooled_range_object(lfr_props, full_image_path, camera_number)
+        if pooled_camera:
+            return pooled_camera
+
     current_blend_directory = os.path.dirname(os.path.abspath(__file__)) 
     append_content_from_blend_file(os.path.abspath(current_blend_directory + '/Assets/projection_material.blend'), 'Collection', 'ProjectionGroup') # import the camera group from the blend file
 
@@ -157,8 +155,7 @@ def create_and_prep_new_camera(lfr_props, full_image_path, full_mask_path, camer
         projection_plane = lfr_props.projection_mesh_obj
     else:
         range_obj_set = lfr_props.range_objects.add()
-        range_obj_set.mesh = create_giant_projection_plane(lfr_props.dem_mesh_obj)
-        range_obj_set.mesh.location = (range_obj_set.mesh.location.x, range_obj_set.mesh.location.y - (0.01 * camera_number), range_obj_set.mesh.location.z)
+        range_obj_set.mesh = create_range_projection_plane(lfr_props.projection_mesh_obj, get_range_plane_location(lfr_props, camera_number))
 
     view_origin_obj = None
     view_direction_obj = None
@@ -179,11 +176,12 @@ def create_and_prep_new_camera(lfr_props, full_image_path, full_mask_path, camer
             camera_obj.name = 'Camera_' + camera_number_str
             if range_obj_set:
                 range_obj_set.proj_cam = camera_obj
-                range_obj_set.proj_cam.location = lfr_props.cameras[camera_number].location
+                poses = get_pose_table(lfr_props)
+                range_obj_set.proj_cam.location = poses.locations[camera_number]
                 range_obj_set.original_location = camera_obj.location
                 range_obj_set.proj_cam.rotation_mode = 'QUATERNION'
-                range_obj_set.proj_cam.rotation_quaternion = lfr_props.cameras[camera_number].quaternion
-                range_obj_set.proj_cam.data.lens = lfr_props.cameras[camera_number].fovy  # Set the focal length (not FOV)
+                range_obj_set.proj_cam.rotation_quaternion = poses.quaternions[camera_number]
+                range_obj_set.proj_cam.data.lens = poses.fovy[camera_number]  # Set the focal length (not FOV)
             
         if ('ViewDirection' in obj.name):
             obj.name = 'ViewDirection_' + camera_number_str
@@ -208,14 +206,15 @@ def create_and_prep_new_camera(lfr_props, full_image_path, full_mask_path, camer
     # if (len(projection_plane.data.materials) >= 2): # -------------- really important, 1x assigned material means len of 1!
     #     new_material = projection_plane.data.materials[0].copy()
     # else:
-    new_material = get_material_from_blend_file('Assets\projection_material.blend', 'ProjectionMaterial')
+    new_material = get_material_from_blend_file(os.path.join('Assets', 'projection_material.blend'), 'ProjectionMaterial')
 
     if projection_plane:
         projection_plane.data.materials.append(new_material)
         projection_plane.active_material_index = len(projection_plane.material_slots) - 1
     else:
-        range_obj_set.mesh.data.materials.append(new_material)
-        range_obj_set.mesh.active_material_index = len(range_obj_set.mesh.material_slots) - 1
+        range_obj_set.mesh.material_slots[0].material = new_material # object-linked, the mesh is shared
+        range_obj_set.mesh.active_material_index = 0
+        range_obj_set.material = new_material
         
     new_material.name = camera_number_str
 
@@ -253,11 +252,12 @@ def create_and_prep_new_camera(lfr_props, full_image_path, full_mask_path, camer
 
         
     if (base_color_texture_node.image):
-        bpy.data.images.remove(base_color_texture_node.image, do_unlink=True)
+        if not image_cache.owns(base_color_texture_node.image): # placeholder image of the asset
+            bpy.data.images.remove(base_color_texture_node.image, do_unlink=True)
         base_color_texture_node.image = None
 
-    loaded_img = bpy.data.images.load(full_image_path)
-    loaded_mask_img = bpy.data.images.load(full_mask_path)
+    loaded_img = image_cache.get(full_image_path)
+    loaded_mask_img = image_cache.get(full_mask_path) # the mask is shared by all cameras
 
     base_color_texture_node.image = loaded_img
     mask_texture_node.image = loaded_mask_img
@@ -308,10 +308,10 @@ def create_and_prep_new_camera(lfr_props, full_image_path, full_mask_path, camer
     return camera_obj
 
 def create_main_camera(lfr_props):
-    cameras_collection = lfr_props.cameras
+    poses = get_pose_table(lfr_props)
     current_frame_number = bpy.context.scene.frame_current
     cameras_path = lfr_props.cameras_path
-    full_img_path = cameras_path + cameras_collection[current_frame_number-1].image_file
+    full_img_path = cameras_path + poses.image_file(current_frame_number-1)
     mask_img_path = lfr_props.img_mask
     camera_obj = create_and_prep_new_camera(lfr_props, full_img_path, mask_img_path, 0)
     camera_obj.name = 'MainCamera'
@@ -0,0 +1,220 @@
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import bpy
+import numpy as np
+
+# In-memory access to render results. The "Render Result" image has no readable pixels,
+# the compositor Viewer node however keeps a copy of the last render in the "Viewer Node" image.
+# Viewer pixels are scene linear, they get the scene's view transform applied like a saved file
+# would (DisplayTransform). Other view transforms than Standard need OpenColorIO's python module
+# (bundled with Blender), without it the pixels are only sRGB encoded.
+
+try:
+    import PyOpenColorIO as OCIO
+except ImportError:
+    OCIO = None
+
+CAPTURE_VIEWER_NAME = "LFR_CaptureViewer"
+VIEWER_IMAGE_NAME = "Viewer Node"
+
+def linear_to_srgb(pixels):
+    # RGB channels only, alpha stays linear
+    rgb = np.clip(pixels[..., :3], 0.0, 1.0)
+    srgb = np.empty_like(pixels)
+    srgb[..., :3] = np.where(rgb <= 0.0031308, rgb * 12.92, 1.055 * np.power(rgb, 1.0 / 2.4) - 0.055)
+    srgb[..., 3] = pixels[..., 3]
+    return srgb
+
+def srgb_to_linear(pixels):
+    # RGB channels only, alpha stays linear
+    rgb = pixels[..., :3]
+    linear = pixels.copy()
+    linear[..., :3] = np.where(rgb <= 0.04045, rgb / 12.92, np.power((rgb + 0.055) / 1.055, 2.4))
+    return linear
+
+def get_ocio_config():
+    config_path = os.environ.get("OCIO") or bpy.utils.system_resource('DATAFILES', path="colormanagement/config.ocio")
+    return OCIO.Config.CreateFromFile(config_path)
+
+class DisplayTransform:
+    # scene linear -> display values of the scene's color management settings, the settings are
+    # read on creation (main thread), apply can run on any thread
+    def __init__(self, scene):
+        view_settings = scene.view_settings
+        self.exposure_scale = 2.0 ** view_settings.exposure
+        self.gamma = view_settings.gamma
+        self.processor = None
+
+        if view_settings.view_transform == 'Standard' and view_settings.look == 'None':
+            return # the sRGB curve of linear_to_srgb
+        if OCIO is None:
+            print(f"OpenColorIO is not available, captured renders use the Standard view transform instead of {view_settings.view_transform}.")
+            return
+
+        try:
+            config = get_ocio_config()
+            transform = OCIO.DisplayViewTransform(src=OCIO.ROLE_SCENE_LINEAR, display=scene.display_settings.display_device,
+                                                  view=view_settings.view_transform)
+            if view_settings.look != 'None':
+                # blender shows looks as "<view> - <look>"
+                look = view_settings.look.split(" - ", 1)[-1]
+                transform = OCIO.GroupTransform([OCIO.LookTransform(src=OCIO.ROLE_SCENE_LINEAR, dst=OCIO.ROLE_SCENE_LINEAR, looks=look), transform])
+            self.processor = config.getProcessor(transform).getDefaultCPUProcessor()
+        except Exception as e: # OCIO raises its own exception types
+            print(f"Could not set up the view transform {view_settings.view_transform}: {e}, captured renders use Standard.")
+            self.processor = None
+
+    def apply(self, pixels):
+        # RGBA float32 (..., 4), returns new display encoded pixels in 0..1, alpha stays linear
+        rgba = np.ascontiguousarray(pixels, dtype=np.float32).copy()
+        if self.exposure_scale != 1.0:
+            rgba[..., :3] *= self.exposure_scale
+
+        if self.processor is None:
+            rgba = linear_to_srgb(rgba)
+        else:
+            self.processor.applyRGBA(rgba)
+            np.clip(rgba[..., :3], 0.0, 1.0, out=rgba[..., :3])
+
+        if self.gamma != 1.0:
+            np.power(rgba[..., :3], 1.0 / self.gamma, out=rgba[..., :3])
+        return rgba
+
+def to_straight_srgb(pixels, display_transform=None):
+    # the values a saved and reloaded RGBA PNG would have: straight alpha, display encoded
+    rgba = pixels.reshape((-1, 4))
+    alpha = rgba[:, 3:4]
+    straight = rgba.copy()
+    np.divide(rgba[:, :3], alpha, out=straight[:, :3], where=alpha > 0) # render results are premultiplied
+    if display_transform is None:
+        return linear_to_srgb(straight)
+    return display_transform.apply(straight)
+
+def to_rgba8_top_down(pixels, width, height, display_transform=None):
+    # flat bottom-up float RGBA (blender layout) -> top-down 8 bit rows (video/image file layout)
+    rgba = pixels.reshape((height, width, 4))
+    display = linear_to_srgb(rgba) if display_transform is None else display_transform.apply(rgba)
+    return np.ascontiguousarray((display[::-1] * 255.0 + 0.5).astype(np.uint8))
+
+class RenderCapture:
+    def __init__(self, scene):
+        self.scene = scene
+        self.pixels = None
+        self.width = 0
+        self.height = 0
+        self.display_transform = DisplayTransform(scene)
+        self.setup_viewer_node()
+
+    def setup_viewer_node(self):
+        # the compositor settings and nodes of the scene are restored by close()
+        scene = self.scene
+        self.original_use_nodes = scene.use_nodes
+        self.original_use_compositing = scene.render.use_compositing
+        self.original_node_names = set() if scene.node_tree is None else {node.name for node in scene.node_tree.nodes}
+        self.original_active_node = None if scene.node_tree is None else scene.node_tree.nodes.active
+
+        scene.use_nodes = True
+        scene.render.use_compositing = True
+        tree = scene.node_tree
+
+        viewer = tree.nodes.get(CAPTURE_VIEWER_NAME)
+        if viewer is None:
+            render_layers = next((node for node in tree.nodes if node.type == 'R_LAYERS'), None)
+            if render_layers is None:
+                render_layers = tree.nodes.new('CompositorNodeRLayers')
+
+            viewer = tree.nodes.new('CompositorNodeViewer')
+            viewer.name = CAPTURE_VIEWER_NAME
+            viewer.location = (render_layers.location[0] + 300, render_layers.location[1] - 300)
+            viewer.use_alpha = True
+            tree.links.new(render_layers.outputs['Image'], viewer.inputs['Image'])
+            tree.links.new(render_layers.outputs['Alpha'], viewer.inputs['Alpha'])
+
+        tree.nodes.active = viewer # only the active viewer writes into the Viewer Node image
+
+    def render(self):
+        # renders the current frame, returns flat bottom-up RGBA float32 (scene linear)
+        # the buffer is reused by the next render, copy it if it has to be kept
+        bpy.ops.render.render(write_still=False)
+
+        viewer_image = bpy.data.images[VIEWER_IMAGE_NAME]
+        width, height = viewer_image.size[0], viewer_image.size[1]
+        if self.pixels is None or width != self.width or height != self.height:
+            self.width = width
+            self.height = height
+            self.pixels = np.empty(width * height * 4, dtype=np.float32)
+
+        viewer_image.pixels.foreach_get(self.pixels)
+        return self.pixels
+
+    def close(self):
+        # removes the capture viewer (and the nodes use_nodes created) again
+        scene = self.scene
+        tree = scene.node_tree
+        if tree is not None:
+            for node in list(tree.nodes):
+                if node.name not in self.original_node_names:
+                    tree.nodes.remove(node)
+            if self.original_active_node is not None and self.original_active_node.name in tree.nodes:
+                tree.nodes.active = self.original_active_node
+
+        scene.render.use_compositing = self.original_use_compositing
+        scene.use_nodes = self.original_use_nodes
+
+class VideoPipeWriter:
+    # streams raw RGBA frames into an ffmpeg process, a writer thread converts and pipes the
+    # frames while the main thread renders the next one
+
+    def __init__(self, filepath, width, height, fps, max_queued_frames=4, display_transform=None):
+        ffmpeg_path = shutil.which("ffmpeg")
+        if ffmpeg_path is None:
+            print("ffmpeg was not found on the PATH, it is required for rendering videos.")
+            raise ValueError("ffmpeg was not found on the PATH, it is required for rendering videos.")
+
+        self.width = width
+        self.height = height
+        self.display_transform = display_transform
+        self.error = None
+        self.frames = queue.Queue(maxsize=max_queued_frames) # bounds the memory if encoding is slower than rendering
+
+        command = [ffmpeg_path, "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+                   "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", # yuv420p needs even dimensions
+                   "-c:v", "libx264", "-pix_fmt", "yuv420p", "-crf", "18",
+                   filepath]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        self.thread = threading.Thread(target=self.write_frames, daemon=True)
+        self.thread.start()
+
+    def write_frames(self):
+        while True:
+            pixels = self.frames.get()
+            if pixels is None:
+                break
+            if self.error is not None:
+                continue # keep draining so that write_frame never blocks
+
+            try:
+                self.process.stdin.write(to_rgba8_top_down(pixels, self.width, self.height, self.display_transform).tobytes())
+            except (BrokenPipeError, OSError) as e:
+                self.error = e
+
+    def write_frame(self, pixels):
+        if self.error is not None:
+            raise ValueError(f"Video encoding failed: {self.error}")
+        self.frames.put(pixels.copy())
+
+    def close(self):
+        self.frames.put(None)
+        self.thread.join()
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+        return_code = self.process.wait()
+        if self.error is not None or return_code != 0:
+            raise ValueError(f"Video encoding failed (ffmpeg exit code {return_code}): {self.error}")
@@ -3,9 +3,11 @@ import os
 import bmesh
 import bpy
 from mathutils import *
+from . trace import traced
 D = bpy.data
 C = bpy.context
 
+@traced("import_dem")
 def import_dem(dem_path, rotation):
 
     if not dem_path.lower().endswith((".glb", ".gltf")):
@@ -0,0 +1,127 @@
+from contextlib import contextmanager
+import time
+import bpy
+from . lightfields import get_image_depending_on_frame, move_range_of_projections_and_apply_new_images
+from . plane import create_giant_projection_plane, update_projection_material_tex
+from . poses import get_pose_table
+from . prefetch import frame_prefetcher
+from . trace import traced
+
+# Frame change work is coalesced while scrubbing: the frame change handler only records the
+# requested frame, a timer applies the latest requested frame (older requests are dropped).
+# The cheap preview (main projection image) is applied right away, the range of projections
+# only after no new frame was requested for SETTLE_DELAY seconds.
+# Renders and background mode need the scene to be complete after frame_set, there the work
+# is done synchronously in the handler (see synchronous_frame_updates).
+# Only the interactive (timer) updates use the proxy images (see proxies.py).
+
+SETTLE_DELAY = 0.15 # seconds without a new frame request until the full update runs
+
+@traced("apply_frame_preview")
+def apply_frame_preview(scene, current_frame_number, use_proxies=False):
+    lfr_prp = scene.lfr_properties
+    if not (current_frame_number >= 1 and current_frame_number < len(get_pose_table(lfr_prp))):
+        return False
+
+    if (lfr_prp.cam_obj):
+        bpy.ops.object.transform_apply(location=True)
+
+    if lfr_prp.projection_mesh_obj:
+        #img_tex = applyImagesAndPositionsToPlanesFromRange(lfr_prp, current_frame_number)
+        img_tex = get_image_depending_on_frame(lfr_prp, current_frame_number, use_proxies)
+        update_projection_material_tex(lfr_prp.projection_mesh_obj.data.materials[0], img_tex)
+        frame_prefetcher.schedule(lfr_prp, current_frame_number, use_proxies) # decode the upcoming frames in the background
+    else:
+        lfr_prp.projection_mesh_obj = create_giant_projection_plane(lfr_prp.dem_mesh_obj)
+        return False
+
+    return True
+
+@traced("apply_frame_range")
+def apply_frame_range(scene, current_frame_number, use_proxies=False):
+    lfr_prp = scene.lfr_properties
+    if lfr_prp.view_range_of_images and lfr_prp.projection_mesh_obj:
+        move_range_of_projections_and_apply_new_images(lfr_prp, current_frame_number, use_proxies)
+
+def apply_frame_update(scene, current_frame_number):
+    if apply_frame_preview(scene, current_frame_number):
+        apply_frame_range(scene, current_frame_number)
+
+class FrameUpdateScheduler:
+    def __init__(self, settle_delay=SETTLE_DELAY):
+        self.settle_delay = settle_delay
+        self.synchronous_depth = 0
+        self.requested = None # (scene name, frame) of the latest request, not previewed yet
+        self.unsettled = None # (scene name, frame) that still needs the full update
+        self.last_request_time = 0.0
+        self.timer = self.run # bpy.app.timers identifies timers by the function object
+
+    def is_synchronous(self):
+        if self.synchronous_depth > 0 or bpy.app.background:
+            return True
+        # Blender's own animation render (Render > Render Animation)
+        return hasattr(bpy.app, "is_job_running") and bpy.app.is_job_running('RENDER')
+
+    def request(self, scene, current_frame_number):
+        self.requested = (scene.name, current_frame_number)
+        self.last_request_time = time.perf_counter()
+        if not bpy.app.timers.is_registered(self.timer):
+            bpy.app.timers.register(self.timer, first_interval=0.0)
+
+    def run(self):
+        # timer callback, the return value is the delay until the next call (None stops the timer)
+        if self.requested is not None:
+            scene_name, frame = self.requested
+            self.requested = None
+            scene = bpy.data.scenes.get(scene_name)
+            if scene is not None and apply_frame_preview(scene, frame, True):
+                self.unsettled = (scene_name, frame)
+            return self.settle_delay
+
+        if self.unsettled is None:
+            return None
+
+        waited = time.perf_counter() - self.last_request_time
+        if waited < self.settle_delay:
+            return self.settle_delay - waited
+
+        scene_name, frame = self.unsettled
+        self.unsettled = None
+        scene = bpy.data.scenes.get(scene_name)
+        if scene is not None and scene.frame_current == frame:
+            apply_frame_range(scene, frame, True)
+        return None
+
+    def flush(self):
+        # applies a pending update right away
+        if self.requested is not None:
+            scene_name, frame = self.requested
+            self.requested = None
+            scene = bpy.data.scenes.get(scene_name)
+            if scene is not None and apply_frame_preview(scene, frame, True):
+                self.unsettled = (scene_name, frame)
+
+        if self.unsettled is not None:
+            scene_name, frame = self.unsettled
+            self.unsettled = None
+            scene = bpy.data.scenes.get(scene_name)
+            if scene is not None:
+                apply_frame_range(scene, frame, True)
+
+    def cancel(self):
+        self.requested = None
+        self.unsettled = None
+        if bpy.app.timers.is_registered(self.timer):
+            bpy.app.timers.unregister(self.timer)
+
+frame_update_scheduler = FrameUpdateScheduler()
+
+@contextmanager
+def synchronous_frame_updates():
+    # frame_set inside of the block leaves a completely updated scene behind (render loops)
+    frame_update_scheduler.flush()
+    frame_update_scheduler.synchronous_depth += 1
+    try:
+        yield
+    finally:
+        frame_update_scheduler.synchronous_depth -= 1
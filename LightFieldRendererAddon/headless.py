@@ -0,0 +1,136 @@
+import argparse
+import importlib
+import os
+import sys
+import bpy
+
+# Command line entry point for unattended rendering, e.g. on headless render nodes:
+#
+#   blender -b -P LightFieldRendererAddon/headless.py -- --folder /data/recording/ --output /data/out/ \
+#       --frame-start 1 --frame-end 100 --range 10 --focus 2.5 --res-x 1024 --res-y 1024
+#
+# --mode range writes one integral image per frame (like "Render Range of Images"),
+# --mode sequence renders the main camera per frame (like "Render Images From Current KeyFrame").
+# --no-load renders the recording that is already loaded in the opened .blend file (blender -b scene.blend -P ...).
+
+PROGRESS_PREFIX = "LFR_PROGRESS"
+
+def get_script_args(argv):
+    # blender passes everything after "--" on to the script
+    if "--" in argv:
+        return argv[argv.index("--") + 1:]
+    return []
+
+def create_arg_parser():
+    arg_parser = argparse.ArgumentParser(prog="blender -b -P headless.py --", description="Light field renderer batch rendering")
+    arg_parser.add_argument("--folder", default="", help="recording folder (images, mask and matched_poses.json)")
+    arg_parser.add_argument("--no-load", action="store_true", help="keep the recording loaded in the opened .blend file")
+    arg_parser.add_argument("--dem", default="", help="DEM file, overrides <folder>/../Data/dem/*.glb")
+    arg_parser.add_argument("--json", default="", help="poses file, overrides <folder>/matched_poses.json")
+    arg_parser.add_argument("--output", default="", help="output directory (default: the add-on's Pics folder)")
+    arg_parser.add_argument("--mode", choices=("range", "sequence"), default="range")
+    arg_parser.add_argument("--engine", choices=("RENDER", "NUMPY", "MULTIVIEW"), default=None, help="integration engine for --mode range")
+    arg_parser.add_argument("--frame-start", type=int, default=1)
+    arg_parser.add_argument("--frame-end", type=int, default=None, help="last frame (inclusive), default: last pose")
+    arg_parser.add_argument("--every-nth", type=int, default=None, help="use every n-th pose of the recording")
+    arg_parser.add_argument("--range", type=int, default=None, help="amount of frames to interpolate")
+    arg_parser.add_argument("--focus", type=float, default=None)
+    arg_parser.add_argument("--res-x", type=int, default=None)
+    arg_parser.add_argument("--res-y", type=int, default=None)
+    arg_parser.add_argument("--tile-size", type=int, default=None, help="render range images tile by tile (written as .tif, or .npy without OpenImageIO)")
+    return arg_parser
+
+def import_addon():
+    # the script is run as __main__, so the add-on package has to be imported by its folder name
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(package_dir))
+    addon = importlib.import_module(os.path.basename(package_dir))
+
+    if not hasattr(bpy.types.Scene, "lfr_properties"):
+        addon.register()
+
+    return addon
+
+def apply_args_to_properties(args, lfr_prp):
+    if not args.no_load:
+        lfr_prp.folder_path = args.folder
+        lfr_prp.man_dem_path = args.dem
+        lfr_prp.man_json_path = args.json
+        lfr_prp.man_render_path = args.output
+
+    if args.every_nth is not None:
+        lfr_prp.every_nth_frame = args.every_nth
+    if args.range is not None:
+        lfr_prp.range_to_interpolate = args.range
+    if args.res_x is not None:
+        lfr_prp.rend_res_x = args.res_x
+    if args.res_y is not None:
+        lfr_prp.rend_res_y = args.res_y
+    if args.engine is not None:
+        lfr_prp.integration_engine = args.engine
+    if args.tile_size is not None:
+        lfr_prp.tiled_integration = True
+        lfr_prp.tile_size = args.tile_size
+    if lfr_prp.tiled_integration and lfr_prp.integration_engine != 'RENDER':
+        print(f"Tiled integration only works with the RENDER engine, rendering whole images with {lfr_prp.integration_engine}.")
+        lfr_prp.tiled_integration = False
+
+def report_progress(done, total, frame, filepath):
+    # one parseable line per finished frame (read by the parallel renderer)
+    print(f"{PROGRESS_PREFIX} {done} {total} {frame} {filepath}", flush=True)
+
+def run(args):
+    addon = import_addon()
+    pipeline = importlib.import_module(addon.__name__ + ".pipeline")
+
+    context = bpy.context
+    scene = context.scene
+    lfr_prp = scene.lfr_properties
+    apply_args_to_properties(args, lfr_prp)
+
+    if args.no_load:
+        pose_table = pipeline.get_pose_table(lfr_prp)
+    else:
+        pose_table = pipeline.load_lfr_data(context)
+
+    if pose_table is None or len(pose_table) == 0:
+        raise ValueError(f"No poses could be loaded from {lfr_prp.json_path}")
+
+    if args.focus is not None:
+        lfr_prp.focus = args.focus
+
+    output_path = lfr_prp.render_path
+    if args.output:
+        output_path = os.path.join(args.output, "")
+        os.makedirs(output_path, exist_ok=True)
+
+    frame_end = args.frame_end if args.frame_end is not None else scene.frame_end
+    frames = list(range(args.frame_start, frame_end + 1))
+
+    for done, frame in enumerate(frames, start=1):
+        if args.mode == "range" and lfr_prp.tiled_integration:
+            scene.frame_set(frame)
+            file_path = pipeline.render_range_integral_tiled(context, frame - 1, output_path + f"combined_range_image_{frame:06d}")
+            file_name = os.path.basename(file_path)
+        elif args.mode == "range":
+            scene.frame_set(frame)
+            file_name = f"combined_range_image_{frame:06d}.png"
+            result_image = pipeline.render_range_integral_image(context, frame - 1)
+            pipeline.save_image_to_disk(output_path, file_name, result_image, False)
+            bpy.data.images.remove(result_image, do_unlink=True)
+        else:
+            scene.render.image_settings.file_format = 'JPEG'
+            file_name = f"Render_Result_{frame:06d}.jpg"
+            pipeline.render_sequence_frame(scene, frame, output_path + file_name)
+
+        report_progress(done, len(frames), frame, output_path + file_name)
+
+def main():
+    arg_parser = create_arg_parser()
+    args = arg_parser.parse_args(get_script_args(sys.argv))
+    if not args.no_load and not args.folder:
+        arg_parser.error("--folder is required unless --no-load is given")
+    run(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+from collections import OrderedDict
+import bpy
+
+# Reuses loaded image datablocks while scrubbing through a recording.
+# Images are keyed by their path, the least recently used ones get removed
+# as soon as the byte budget is exceeded and they are not assigned anywhere anymore.
+
+def get_image_byte_size(img):
+    width, height = img.size[0], img.size[1]
+    bytes_per_channel = 4 if img.is_float else 1
+    return width * height * img.channels * bytes_per_channel
+
+def is_valid_image(img):
+    try:
+        img.name
+        return True
+    except ReferenceError: # datablock got removed outside of the cache (e.g. orphans purge)
+        return False
+
+class ImageCache:
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.entries = OrderedDict() # path -> (image, byte size)
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, img_path):
+        img = self.lookup(img_path)
+        if img is not None:
+            return img
+
+        return self.insert(img_path, bpy.data.images.load(img_path, check_existing=False))
+
+    def lookup(self, img_path):
+        entry = self.entries.get(img_path)
+
+        if entry is not None:
+            if is_valid_image(entry[0]):
+                self.entries.move_to_end(img_path)
+                self.hits += 1
+                return entry[0]
+
+            self.forget(img_path)
+
+        self.misses += 1
+        return None
+
+    def insert(self, img_path, img):
+        if img_path in self.entries:
+            self.release(img_path)
+
+        byte_size = get_image_byte_size(img)
+        self.entries[img_path] = (img, byte_size)
+        self.used_bytes += byte_size
+        self.trim(keep=img)
+        return img
+
+    def owns(self, img):
+        if img is None:
+            return False
+
+        return any(entry[0] == img for entry in self.entries.values())
+
+    def forget(self, img_path):
+        entry = self.entries.pop(img_path, None)
+        if entry is not None:
+            self.used_bytes -= entry[1]
+
+    def release(self, img_path):
+        entry = self.entries.get(img_path)
+        self.forget(img_path)
+
+        if entry is not None and is_valid_image(entry[0]):
+            bpy.data.images.remove(entry[0], do_unlink=True)
+
+    def trim(self, keep=None):
+        if self.used_bytes <= self.budget_bytes:
+            return
+
+        # oldest entries first, images that are still assigned to a material stay
+        for img_path, (img, byte_size) in list(self.entries.items()):
+            if self.used_bytes <= self.budget_bytes:
+                break
+
+            if not is_valid_image(img):
+                self.forget(img_path)
+                continue
+
+            if img == keep or img.users > 0:
+                continue
+
+            self.release(img_path)
+            self.evictions += 1
+
+    def set_budget(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.trim()
+
+    def clear(self):
+        for img_path in list(self.entries.keys()):
+            self.release(img_path)
+
+        self.used_bytes = 0
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+image_cache = ImageCache(2048 * 1024 * 1024)
+
+def on_image_cache_budget_change(self, context):
+    image_cache.set_budget(self.image_cache_budget_mb * 1024 * 1024)
@@ -0,0 +1,297 @@
+from math import floor
+import bpy
+from mathutils import *
+import numpy as np
+from . cameras import create_range_render_camera, set_current_camera_rendering_resolution
+from . capture import DisplayTransform, srgb_to_linear
+from . image_cache import image_cache
+from . lightfields import ImageAccumulator, get_range_frame_indices
+from . poses import get_pose_table
+
+# CPU light field integration straight from the pose table, the DEM and the source images.
+# Follows the scene conventions of the render path: "up" is the negative blender Y axis
+# (focus and the range render camera are offset along Y) and every projection camera
+# gets its fovy applied as focal length in mm.
+
+class HeightField:
+    def __init__(self, heights, x_min, z_min, cell_size_x, cell_size_z):
+        self.heights = heights # [z, x] grid of terrain heights (-Y in blender)
+        self.x_min = x_min
+        self.z_min = z_min
+        self.cell_size_x = cell_size_x
+        self.cell_size_z = cell_size_z
+        self.h_min = float(np.min(heights))
+        self.h_max = float(np.max(heights))
+
+    def sample(self, x, z):
+        # bilinear height lookup, positions outside of the DEM return nan
+        res_z, res_x = self.heights.shape
+        gx = (x - self.x_min) / self.cell_size_x
+        gz = (z - self.z_min) / self.cell_size_z
+
+        inside = (gx >= 0) & (gx <= res_x - 1) & (gz >= 0) & (gz <= res_z - 1)
+        gx = np.clip(gx, 0, res_x - 1.001)
+        gz = np.clip(gz, 0, res_z - 1.001)
+        ix = gx.astype(np.int32)
+        iz = gz.astype(np.int32)
+        fx = gx - ix
+        fz = gz - iz
+
+        h = self.heights
+        top = h[iz, ix] * (1 - fx) + h[iz, ix + 1] * fx
+        bottom = h[iz + 1, ix] * (1 - fx) + h[iz + 1, ix + 1] * fx
+        result = top * (1 - fz) + bottom * fz
+        result[~inside] = np.nan
+        return result
+
+def build_height_field(dem_obj, max_resolution=2048):
+    mesh = dem_obj.data
+    vertex_count = len(mesh.vertices)
+
+    co = np.empty(vertex_count * 3, dtype=np.float64)
+    mesh.vertices.foreach_get("co", co)
+    co = co.reshape((-1, 3))
+
+    matrix_world = np.array(dem_obj.matrix_world)
+    world_co = co @ matrix_world[:3, :3].T + matrix_world[:3, 3]
+
+    x = world_co[:, 0]
+    z = world_co[:, 2]
+    heights = -world_co[:, 1]
+
+    # roughly one cell per DEM vertex
+    res = int(min(max(np.sqrt(vertex_count), 64), max_resolution))
+    x_min, x_max = float(x.min()), float(x.max())
+    z_min, z_max = float(z.min()), float(z.max())
+    cell_size_x = max(x_max - x_min, 1e-6) / (res - 1)
+    cell_size_z = max(z_max - z_min, 1e-6) / (res - 1)
+
+    ix = np.rint((x - x_min) / cell_size_x).astype(np.int64)
+    iz = np.rint((z - z_min) / cell_size_z).astype(np.int64)
+    flat_index = iz * res + ix
+
+    height_sum = np.bincount(flat_index, weights=heights, minlength=res * res)
+    height_count = np.bincount(flat_index, minlength=res * res)
+
+    grid = np.full(res * res, np.nan)
+    filled = height_count > 0
+    grid[filled] = height_sum[filled] / height_count[filled]
+    grid = grid.reshape((res, res))
+
+    fill_height_field_holes(grid)
+    return HeightField(grid, x_min, z_min, cell_size_x, cell_size_z)
+
+def fill_height_field_holes(grid, max_iterations=64):
+    # grows the known heights into empty cells (DEMs that are sparser than the grid)
+    for iteration in range(max_iterations):
+        holes = np.isnan(grid)
+        if not holes.any():
+            return
+
+        padded = np.pad(grid, 1, constant_values=np.nan)
+        neighbours = np.stack((padded[:-2, 1:-1], padded[2:, 1:-1], padded[1:-1, :-2], padded[1:-1, 2:]))
+        neighbour_count = np.sum(~np.isnan(neighbours), axis=0)
+        neighbour_sum = np.nansum(neighbours, axis=0)
+
+        fillable = holes & (neighbour_count > 0)
+        grid[fillable] = neighbour_sum[fillable] / neighbour_count[fillable]
+
+    grid[np.isnan(grid)] = np.nanmin(grid)
+
+def get_camera_rays(camera_obj, width, height):
+    # one ray per pixel, pixels are ordered bottom-up like blender image pixels
+    frame = [np.array(corner) for corner in camera_obj.data.view_frame(scene=bpy.context.scene)]
+    top_right, bottom_right, bottom_left, top_left = frame
+
+    u = (np.arange(width, dtype=np.float64) + 0.5) / width
+    v = (np.arange(height, dtype=np.float64) + 0.5) / height
+    uu, vv = np.meshgrid(u, v)
+    uu = uu.reshape(-1, 1)
+    vv = vv.reshape(-1, 1)
+    local_points = bottom_left + uu * (bottom_right - bottom_left) + vv * (top_left - bottom_left)
+
+    matrix_world = np.array(camera_obj.matrix_world.normalized())
+    rotation = matrix_world[:3, :3]
+    location = matrix_world[:3, 3]
+
+    if camera_obj.data.type == 'ORTHO':
+        origins = local_points @ rotation.T + location
+        directions = np.tile(rotation @ np.array((0.0, 0.0, -1.0)), (len(origins), 1))
+    else:
+        origins = np.tile(location, (len(local_points), 1))
+        directions = local_points @ rotation.T
+
+    directions /= np.linalg.norm(directions, axis=1)[:, None]
+    return origins, directions
+
+def intersect_height_field(height_field, origins, directions, steps=128, refinements=8):
+    # vectorized ray marching against the height field followed by a bisection refinement
+    # returns the hit distance per ray, nan for rays that miss the DEM
+    ray_count = len(origins)
+    hit_distance = np.full(ray_count, np.nan)
+
+    dir_y = directions[:, 1]
+    descending = dir_y > 1e-9 # height = -y, so only rays with positive y can hit the terrain from above
+    safe_dir_y = np.where(descending, dir_y, 1.0)
+
+    t_enter = np.maximum((-height_field.h_max - origins[:, 1]) / safe_dir_y, 0.0)
+    t_exit = (-height_field.h_min - origins[:, 1]) / safe_dir_y
+
+    active = np.nonzero(descending & (t_exit > t_enter))[0]
+    t_previous = t_enter[active]
+
+    def height_above_terrain(ray_indices, t):
+        points = origins[ray_indices] + directions[ray_indices] * t[:, None]
+        terrain = height_field.sample(points[:, 0], points[:, 2])
+        return -points[:, 1] - terrain # nan outside the DEM
+
+    for step in range(1, steps + 1):
+        if len(active) == 0:
+            break
+
+        t = t_enter[active] + (t_exit[active] - t_enter[active]) * (step / steps)
+        below = height_above_terrain(active, t) <= 0
+
+        hit_rays = active[below]
+        if len(hit_rays):
+            low = t_previous[below]
+            high = t[below]
+
+            for refinement in range(refinements):
+                middle = (low + high) * 0.5
+                middle_below = height_above_terrain(hit_rays, middle) <= 0
+                high = np.where(middle_below, middle, high)
+                low = np.where(middle_below, low, middle)
+
+            hit_distance[hit_rays] = high
+
+        active = active[~below]
+        t_previous = t[~below]
+
+    return hit_distance
+
+def load_image_pixels(img_path, to_linear=False):
+    # 8 bit sRGB color images are converted to scene linear like blender's image textures do
+    img = image_cache.get(img_path)
+    width, height = img.size[0], img.size[1]
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    img.pixels.foreach_get(pixels)
+    pixels = pixels.reshape((height, width, 4))
+
+    if to_linear and not img.is_float and img.colorspace_settings.name == 'sRGB':
+        return srgb_to_linear(pixels)
+    return pixels
+
+class RangeSources:
+    # decoded source images (scene linear) and mask of a range, reused by several integrations
+    def __init__(self, lfr_props, frame_indices):
+        poses = get_pose_table(lfr_props)
+        self.mask_pixels = None
+        if lfr_props.img_mask:
+            self.mask_pixels = load_image_pixels(lfr_props.img_mask)
+
+        self.pixels = {}
+        for frame_number in frame_indices:
+            self.pixels[frame_number] = load_image_pixels(lfr_props.cameras_path + poses.image_file(frame_number), True)
+
+def sample_image_bilinear(pixels, u, v):
+    height, width = pixels.shape[0], pixels.shape[1]
+    x = np.clip(u * width - 0.5, 0, width - 1.001)
+    y = np.clip(v * height - 0.5, 0, height - 1.001)
+    ix = x.astype(np.int32)
+    iy = y.astype(np.int32)
+    fx = (x - ix)[:, None]
+    fy = (y - iy)[:, None]
+
+    bottom = pixels[iy, ix] * (1 - fx) + pixels[iy, ix + 1] * fx
+    top = pixels[iy + 1, ix] * (1 - fx) + pixels[iy + 1, ix + 1] * fx
+    return bottom * (1 - fy) + top * fy
+
+def project_points_into_view(points, location, rotation_matrix, lens, sensor_width, width, height):
+    # pinhole projection like a blender camera with sensor fit AUTO, uv origin is bottom-left
+    camera_space = (points - location) @ rotation_matrix
+    depth = -camera_space[:, 2]
+    in_front = depth > 1e-6
+    safe_depth = np.where(in_front, depth, 1.0)
+
+    focal_px = lens / sensor_width * max(width, height)
+    u = 0.5 + focal_px * camera_space[:, 0] / safe_depth / width
+    v = 0.5 + focal_px * camera_space[:, 1] / safe_depth / height
+
+    visible = in_front & (u >= 0) & (u < 1) & (v >= 0) & (v < 1)
+    return u, v, visible
+
+def get_integration_camera(lfr_props, frame_indices, focus=None):
+    if lfr_props.man_rend_cam is not None:
+        return lfr_props.man_rend_cam
+
+    if lfr_props.range_render_cam is not None:
+        bpy.data.objects.remove(lfr_props.range_render_cam, do_unlink=True)
+
+    # same placement as the range render camera of combine_images, looking along the middle view
+    poses = get_pose_table(lfr_props)
+    half_index = frame_indices[int(floor(len(frame_indices) / 2))]
+    half_location = poses.locations[half_index]
+    if focus is None:
+        focus = lfr_props.focus
+    offset_cam_position = (half_location[0], half_location[1] + focus - 100, half_location[2])
+    lfr_props.range_render_cam = create_range_render_camera(offset_cam_position, Quaternion(poses.quaternions[half_index]).to_euler())
+    set_current_camera_rendering_resolution(lfr_props)
+    return lfr_props.range_render_cam
+
+def integrate_range_numpy(lfr_props, start_keyframe_index, height_field=None, focus=None, view_stride=1, sources=None):
+    frame_indices = get_range_frame_indices(lfr_props, start_keyframe_index)
+    if len(frame_indices) == 0:
+        raise ValueError("At least one image is required for blending.")
+
+    if focus is None:
+        focus = lfr_props.focus
+    camera_obj = get_integration_camera(lfr_props, frame_indices, focus)
+    render_settings = bpy.context.scene.render
+    width = int(render_settings.resolution_x * render_settings.resolution_percentage / 100)
+    height = int(render_settings.resolution_y * render_settings.resolution_percentage / 100)
+
+    if height_field is None:
+        height_field = build_height_field(lfr_props.dem_mesh_obj)
+
+    origins, directions = get_camera_rays(camera_obj, width, height)
+    hit_distance = intersect_height_field(height_field, origins, directions)
+    hit_rays = np.nonzero(~np.isnan(hit_distance))[0]
+    points = origins[hit_rays] + directions[hit_rays] * hit_distance[hit_rays, None]
+    del origins, directions
+
+    frame_indices = frame_indices[::view_stride] # the camera stays on the middle of the whole range
+    if sources is None:
+        sources = RangeSources(lfr_props, frame_indices)
+
+    # projection cameras are instances of the same asset as the main camera
+    sensor_width = 36.0
+    if lfr_props.cam_obj is not None:
+        sensor_width = lfr_props.cam_obj.data.sensor_width
+
+    poses = get_pose_table(lfr_props)
+    display_transform = DisplayTransform(bpy.context.scene)
+    accumulator = ImageAccumulator(width, height)
+    view_pixels = np.zeros((width * height, 4), dtype=np.float32)
+
+    for frame_number in frame_indices:
+        location = poses.locations[frame_number] + np.array((0.0, focus, 0.0))
+        rotation_matrix = np.array(Quaternion(poses.quaternions[frame_number]).to_matrix())
+
+        source_pixels = sources.pixels[frame_number]
+        src_height, src_width = source_pixels.shape[0], source_pixels.shape[1]
+        u, v, visible = project_points_into_view(points, location, rotation_matrix, poses.fovy[frame_number], sensor_width, src_width, src_height)
+
+        samples = sample_image_bilinear(source_pixels, u[visible], v[visible])
+        weights = samples[:, 3]
+        if sources.mask_pixels is not None:
+            weights = weights * sample_image_bilinear(sources.mask_pixels, u[visible], v[visible])[:, 0]
+
+        view_pixels.fill(0)
+        visible_rays = hit_rays[visible]
+        view_pixels[visible_rays, :3] = samples[:, :3]
+        view_pixels[visible_rays, 3] = weights
+        # blended as display values like the rendered views of the other engines
+        accumulator.add_pixels(display_transform.apply(view_pixels))
+
+    return accumulator.to_image()
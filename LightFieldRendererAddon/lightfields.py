@@ -4,76 +4,91 @@ from mathutils import *
 import numpy as np
 from . cameras import create_and_prep_new_camera, create_range_render_camera, set_current_camera_rendering_resolution
 from . plane import *
+from . prefetch import get_frame_image
+from . poses import get_pose_table
+from . capture import RenderCapture, to_straight_srgb
+from . trace import span, traced
+from . proxies import get_view_image_path
+from . tiles import TiledImageWriter, check_tile_size, get_tiles, set_render_border
+from . view_index import get_nearest_frame_indices
 
 import bpy
 import numpy as np
 
-def apply_images_and_positions_to_planes_from_range(lfr_prp, start_keyframe_index): 
+def get_range_frame_indices(lfr_prp, start_keyframe_index):
+    # frame indices of the views that belong to the range starting after start_keyframe_index
+    if lfr_prp.view_selection == 'NEAREST':
+        return get_nearest_frame_indices(lfr_prp, start_keyframe_index, lfr_prp.range_to_interpolate)
 
-    cameras_data_arr = lfr_prp.cameras
-    cameras_path = lfr_prp.cameras_path
+    camera_count = len(get_pose_table(lfr_prp))
     frame_range = lfr_prp.range_to_interpolate
     end_index = start_keyframe_index + frame_range
-    actual_img_count = end_index
 
-    if end_index > len(cameras_data_arr):
-        actual_img_count = len(cameras_data_arr) - start_keyframe_index
-        end_index = len(cameras_data_arr)-1
+    if end_index > camera_count:
+        end_index = camera_count-1
 
+    frame_indices = []
     j = 1
     for entry in range(start_keyframe_index, end_index):
-        #print(start_keyframe_index, "+ ", j)
         frame_number = start_keyframe_index + j
-        camData = cameras_data_arr[frame_number]
-        img_path = cameras_path + camData.image_file
-        create_and_prep_new_camera(lfr_prp, img_path, lfr_prp.img_mask, frame_number)
+        if frame_number >= camera_count:
+            break
 
+        frame_indices.append(frame_number)
         j = j + 1
 
         if j >= end_index:
             break
 
-def move_range_of_projections_and_apply_new_images(lfr_props, start_keyframe_index):
+    return frame_indices
+
+def apply_images_and_positions_to_planes_from_range(lfr_prp, start_keyframe_index, use_proxies=False): 
+
+    poses = get_pose_table(lfr_prp)
+
+    for frame_number in get_range_frame_indices(lfr_prp, start_keyframe_index):
+        img_path = get_view_image_path(lfr_prp, poses.image_file(frame_number), use_proxies)
+        create_and_prep_new_camera(lfr_prp, img_path, lfr_prp.img_mask, frame_number)
+
+def move_range_of_projections_and_apply_new_images(lfr_props, start_keyframe_index, use_proxies=False):
     range_objects = lfr_props.range_objects
     frame_range = len(range_objects)
-    cameras_data_arr = lfr_props.cameras
-    cameras_path = lfr_props.cameras_path
+    poses = get_pose_table(lfr_props)
 
     end_index = start_keyframe_index + frame_range
     actual_img_count = end_index
 
-    if end_index > len(cameras_data_arr):
-        actual_img_count = len(cameras_data_arr) - start_keyframe_index
-        end_index = len(cameras_data_arr)
+    if end_index > len(poses):
+        actual_img_count = len(poses) - start_keyframe_index
+        end_index = len(poses)
+
+    frame_indices = range(start_keyframe_index, end_index)
+    if lfr_props.view_selection == 'NEAREST':
+        frame_indices = get_nearest_frame_indices(lfr_props, start_keyframe_index, frame_range)
 
     j = 0
-    for i in range(start_keyframe_index, end_index):
-        camData = cameras_data_arr[i]
-
-        img_path = cameras_path + camData.image_file
-        frame = bpy.data.images.load(img_path)
-        range_objects[j].original_location = camData.location
-        range_objects[j].proj_cam.location = camData.location
-        update_projection_material_tex(range_objects[j].mesh.data.materials[0], frame)
+    for i in frame_indices:
+        img_path = get_view_image_path(lfr_props, poses.image_file(i), use_proxies)
+        frame = get_frame_image(img_path)
+        range_objects[j].original_location = poses.locations[i]
+        range_objects[j].proj_cam.location = poses.locations[i]
+        update_projection_material_tex(range_objects[j].material, frame)
         
         j = j + 1
 
-def get_image_depending_on_frame(lfr_prp, index): #simple sinlge image application
-    cameras_data_arr = lfr_prp.cameras
-    cameras_path = lfr_prp.cameras_path
+def get_image_depending_on_frame(lfr_prp, index, use_proxies=False): #simple sinlge image application
+    poses = get_pose_table(lfr_prp)
 
-    if index > len(cameras_data_arr):
-        index = len(cameras_data_arr)
+    if index >= len(poses):
+        index = len(poses)-1
 
-    camData = cameras_data_arr[index]
-    img_path = cameras_path + camData.image_file
+    img_path = get_view_image_path(lfr_prp, poses.image_file(index), use_proxies)
     
-    return bpy.data.images.load(img_path)
+    return get_frame_image(img_path)
 
-def combine_images(lfr_props):
+def prepare_range_render(lfr_props):
     range_objects = lfr_props.range_objects
     print(len(range_objects))
-    cameras_data_arr = lfr_props.cameras
 
     half_index = int(floor(len(range_objects) / 2))
     half_cam = range_objects[half_index].proj_cam
@@ -95,8 +110,6 @@ def combine_images(lfr_props):
     bpy.context.scene.render.image_settings.file_format = 'PNG'
     bpy.context.scene.render.image_settings.color_mode = 'RGBA'
     bpy.context.scene.render.image_settings.compression = 0  # No compression for lossless PNG
-    result_image = None
-    rendered_images = []
 
     lfr_props.projection_mesh_obj.hide_render = True  
     lfr_props.dem_mesh_obj.hide_render = True  
@@ -114,97 +127,215 @@ def combine_images(lfr_props):
     if bpy.data.images.get('Render Result.001'):
         bpy.data.images.remove(bpy.data.images.get('Render Result.001'), do_unlink=True) 
 
-    if lfr_props.save_rend_images is False:
-        if has_file_with_extension(lfr_props.render_path) is False:
-            bpy.context.scene.render.filepath = lfr_props.render_path + "Render_Result." + bpy.context.scene.render.image_settings.file_format 
-
-    print("rendering...")
-    # Iterate through all mesh objects in the scene
-    i = 0
-    for entry in range_objects:
-        i = i + 1
-
-        if lfr_props.save_rend_images:
-            bpy.context.scene.render.filepath = lfr_props.render_path + f"Render_Result_{i}." + bpy.context.scene.render.image_settings.file_format
+def finish_range_render(lfr_props):
+    lfr_props.dem_mesh_obj.hide_render = False 
+    lfr_props.dem_mesh_obj.hide_viewport = False  
+    lfr_props.projection_mesh_obj.hide_render = False  #unhide the main projection mesh  
+    lfr_props.projection_mesh_obj.hide_viewport = False  
 
-        entry.mesh.hide_viewport = False  
-        entry.mesh.hide_render = False
-        # Render the scene to get pixel values
-        bpy.ops.render.render(write_still=True)
-            
-        # Access the 'Render Result' image
-        img_path = bpy.context.scene.render.filepath
-        rendered_image = bpy.data.images.load(img_path)
+@traced("combine_images")
+def combine_images(lfr_props, view_stride=1):
+    range_objects = lfr_props.range_objects
+    prepare_range_render(lfr_props)
+    accumulator = None
 
-        if rendered_image:
-            copied_image = bpy.data.images.new(name="CopiedImage_" + str(i), width=rendered_image.size[0], height=rendered_image.size[1])
-            copied_image.pixels = rendered_image.pixels[:]
-            copied_image.update()
-            rendered_images.append(rendered_image)
+    capture = RenderCapture(bpy.context.scene)
 
-        entry.mesh.hide_render = True 
-        entry.mesh.hide_viewport = True  
+    print("rendering...")
+    try:
+        # Iterate through all mesh objects in the scene
+        i = 0
+        for entry in range_objects:
+            i = i + 1
+            if (i - 1) % view_stride != 0: # skipped views stay hidden
+                continue
+
+            entry.mesh.hide_viewport = False  
+            entry.mesh.hide_render = False
+            # Render the scene and read its pixels straight from memory
+            with span("combine_images.render_view"):
+                pixels = capture.render()
+
+            # the individual views only end up on disk if requested
+            if lfr_props.save_rend_images:
+                bpy.data.images['Render Result'].save_render(filepath=lfr_props.render_path + f"Render_Result_{i}." + bpy.context.scene.render.image_settings.file_format)
+
+            if accumulator is None:
+                accumulator = ImageAccumulator(capture.width, capture.height)
+            accumulator.add_pixels(to_straight_srgb(pixels, capture.display_transform)) # same values as the previously reloaded PNGs
+
+            entry.mesh.hide_render = True 
+            entry.mesh.hide_viewport = True
+    finally:
+        capture.close()
 
     print("done rendering")
-    lfr_props.dem_mesh_obj.hide_render = False 
-    lfr_props.dem_mesh_obj.hide_viewport = False  
-    lfr_props.projection_mesh_obj.hide_render = False  #unhide the main projection mesh  
-    lfr_props.projection_mesh_obj.hide_viewport = False  
+    finish_range_render(lfr_props)
+
+    if accumulator is None:
+        raise ValueError("At least one image is required for blending.")
 
-    result_image = blend_images(rendered_images, 0.5)
+    result_image = accumulator.to_image()
     
     return result_image
 
+@traced("combine_images_tiled")
+def combine_images_tiled(lfr_props, filepath, tile_size):
+    # every tile gets rendered for all views (render border) and is written out when complete,
+    # the memory only depends on the tile size
+    range_objects = lfr_props.range_objects
+    if len(range_objects) == 0:
+        raise ValueError("At least one image is required for blending.")
+
+    prepare_range_render(lfr_props)
+    tile_size = max(16, tile_size - tile_size % 16) # tiled TIFFs need multiples of 16
+    render_settings = bpy.context.scene.render
+    width = int(render_settings.resolution_x * render_settings.resolution_percentage / 100)
+    height = int(render_settings.resolution_y * render_settings.resolution_percentage / 100)
+
+    previous_border = (render_settings.use_border, render_settings.use_crop_to_border, render_settings.border_min_x,
+                       render_settings.border_max_x, render_settings.border_min_y, render_settings.border_max_y)
+    render_settings.use_border = True
+    render_settings.use_crop_to_border = True
+
+    capture = RenderCapture(bpy.context.scene)
+    writer = TiledImageWriter(filepath, width, height, tile_size)
+    tiles = get_tiles(width, height, tile_size)
+
+    print(f"rendering {len(tiles)} tiles...")
+    try:
+        for tile_index, (x0, y0, x1, y1) in enumerate(tiles):
+            set_render_border(render_settings, width, height, x0, y0, x1, y1)
+            accumulator = ImageAccumulator(x1 - x0, y1 - y0)
+
+            for entry in range_objects:
+                entry.mesh.hide_viewport = False  
+                entry.mesh.hide_render = False
+                with span("combine_images_tiled.render_view"):
+                    pixels = capture.render()
+                check_tile_size(capture.width, capture.height, x1 - x0, y1 - y0)
+                accumulator.add_pixels(to_straight_srgb(pixels, capture.display_transform))
+                entry.mesh.hide_render = True 
+                entry.mesh.hide_viewport = True  
+
+            if accumulator.non_transparent_count > 0:
+                tile_pixels = accumulator.result_pixels()
+            else:
+                tile_pixels = np.zeros((x1 - x0) * (y1 - y0) * 4, dtype=np.float32)
+            writer.write_tile(x0, y0, x1, y1, tile_pixels)
+            print(f"tile {tile_index + 1}/{len(tiles)} done")
+    finally:
+        writer.close()
+        capture.close()
+        (render_settings.use_border, render_settings.use_crop_to_border, render_settings.border_min_x,
+         render_settings.border_max_x, render_settings.border_min_y, render_settings.border_max_y) = previous_border
+        finish_range_render(lfr_props)
+
+    print("done rendering")
+    return writer.filepath
+
+class ImageAccumulator:
+    # running alpha weighted sum of views, the pixels of a view are only needed while adding it
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        pixel_count = width * height
+
+        self.rgb_values = np.zeros((pixel_count, 3), dtype=np.float32)
+        self.alpha_values = np.zeros(pixel_count, dtype=np.float32)
+        self.non_transparent_count = 0
+
+        # preallocated buffers that get reused for every added view
+        self.frame_buffer = np.empty(pixel_count * 4, dtype=np.float32)
+        self.weighted_buffer = np.empty((pixel_count, 3), dtype=np.float32)
+
+    def add_image(self, img):
+        if img.size[0] != self.width or img.size[1] != self.height:
+            raise ValueError(f"Image '{img.name}' has a different size than the accumulator!")
+
+        img.pixels.foreach_get(self.frame_buffer)
+        return self.add_pixels(self.frame_buffer)
+
+    def add_pixels(self, pixels):
+        img_array = pixels.reshape((-1, 4))
+        alpha_channel = img_array[:, 3]
+
+        # fully transparent views don't contribute to the blend
+        if not alpha_channel.any():
+            return False
+
+        np.multiply(img_array[:, :3], alpha_channel[:, None], out=self.weighted_buffer)
+        self.rgb_values += self.weighted_buffer
+        self.alpha_values += alpha_channel
+        self.non_transparent_count += 1
+        return True
+
+    # a view's contribution kept for later removal (sliding window, see render_sliding_window_sequence):
+    # alpha weighted rgb and alpha as float16, None for fully transparent views
+    @staticmethod
+    def to_contribution(pixels):
+        img_array = pixels.reshape((-1, 4))
+        alpha_channel = img_array[:, 3]
+        if not alpha_channel.any():
+            return None
+
+        return (img_array[:, :3] * alpha_channel[:, None]).astype(np.float16), alpha_channel.astype(np.float16)
+
+    def add_contribution(self, contribution):
+        if contribution is None:
+            return False
+
+        self.rgb_values += contribution[0]
+        self.alpha_values += contribution[1]
+        self.non_transparent_count += 1
+        return True
+
+    def subtract_contribution(self, contribution):
+        # the exact values that add_contribution added, only float32 rounding of the sums stays behind
+        if contribution is None:
+            return False
+
+        self.rgb_values -= contribution[0]
+        self.alpha_values -= contribution[1]
+        self.non_transparent_count -= 1
+        return True
+
+    def clear(self):
+        self.rgb_values.fill(0)
+        self.alpha_values.fill(0)
+        self.non_transparent_count = 0
+
+    def result_pixels(self, alpha_scale=1.0):
+        if self.non_transparent_count == 0:
+            raise ValueError("All images are fully transparent, nothing to blend.")
+
+        # Avoid division by zero
+        alpha_values = self.alpha_values.copy()
+        alpha_values[alpha_values == 0] = 1
+
+        result_pixels = np.empty((self.width * self.height, 4), dtype=np.float32)
+        np.divide(self.rgb_values, alpha_values[:, None], out=result_pixels[:, :3])
+        np.divide(alpha_values, self.non_transparent_count, out=result_pixels[:, 3])
+        if alpha_scale != 1.0:
+            np.minimum(result_pixels[:, 3] * alpha_scale, 1.0, out=result_pixels[:, 3])
+
+        return result_pixels.reshape(-1)
+
+    def to_image(self, name='BlendedImage', alpha_scale=1.0):
+        result_image = bpy.data.images.new(name=name, width=self.width, height=self.height, alpha=True)
+        result_image.pixels.foreach_set(self.result_pixels(alpha_scale))
+        result_image.update()
+        return result_image
+
+@traced("blend_images")
 def blend_images(images, mean_alpha):
     if len(images) == 0:
         raise ValueError("At least one image is required for blending.")
 
     # Get the dimensions of the first image
-    width, height = images[0].size[0], images[0].size[1]
-
-    # Create a new image to store the blended result
-    result_image = bpy.data.images.new(name='BlendedImage', width=width, height=height, alpha=True)
-
-    # Initialize arrays to store RGB and alpha values separately
-    rgb_values = np.zeros((height, width, 3), dtype=np.float32)
-    alpha_values = np.zeros((height, width), dtype=np.float32)
+    accumulator = ImageAccumulator(images[0].size[0], images[0].size[1])
 
-    # Count non-transparent images for normalization
-    non_transparent_count = 0
-
-    # Loop through pixels and blend images
     for img in images:
-        img_array = np.array(img.pixels[:])
-        img_array = img_array.reshape((height, width, 4))
-
-        # Check if the pixel is fully transparent
-        alpha_channel = img_array[:, :, 3]
-        is_fully_transparent = np.all(alpha_channel == 0)
-
-        if not is_fully_transparent:
-            rgb_values += img_array[:, :, :3] * alpha_channel[:, :, None]
-            alpha_values += alpha_channel
-            non_transparent_count += 1
-
-    # Avoid division by zero
-    alpha_values[alpha_values == 0] = 1  # Set zero values to 1 to avoid division by zero
-
-    # Calculate the mean alpha value for blending
-    mean_alpha_value = mean_alpha / non_transparent_count
-
-    # Calculate the mean RGB values for blending
-    rgb_values /= alpha_values[:, :, None]
-
-    # Apply mean alpha value to the blended result
-    alpha_values /= non_transparent_count
-
-    # Combine RGB and alpha values
-    result_pixels = np.dstack((rgb_values, alpha_values)).flatten()
-
-    # Set the pixels of the result image
-    result_image.pixels = result_pixels
-
-    # Update the result image
-    result_image.update()
+        accumulator.add_image(img)
 
-    return result_image
\ No newline at end of file
+    return accumulator.to_image()
@@ -0,0 +1,239 @@
+import bpy
+from mathutils import *
+import numpy as np
+from . capture import RenderCapture, to_straight_srgb
+from . image_cache import image_cache
+from . trace import span
+from . integration import get_integration_camera
+from . lightfields import ImageAccumulator, get_range_frame_indices
+from . plane import create_range_projection_plane
+from . poses import get_pose_table
+
+# Single-pass integration: one material on one DEM shaped plane samples the images of K views.
+# Every view gets the node layout of the ProjectionMaterial (MainTexture, MaskTexture,
+# ViewOriginCoords, ViewDirectionCoords) plus the scaled right/up axes of its camera,
+# the visibility weighted average of all views is computed inside the node tree.
+
+# image samplers per material, bigger ranges are split into several passes
+MULTIVIEW_MAX_VIEWS = 16
+
+def new_node(nodes, node_type, name, location, label=None):
+    node = nodes.new(node_type)
+    node.name = name
+    node.label = label if label else name
+    node.location = location
+    return node
+
+def new_math_node(nodes, operation, name, location, value=None):
+    node = new_node(nodes, 'ShaderNodeMath', name, location)
+    node.operation = operation
+    if value is not None:
+        node.inputs[1].default_value = value
+    return node
+
+def new_vector_math_node(nodes, operation, name, location):
+    node = new_node(nodes, 'ShaderNodeVectorMath', name, location)
+    node.operation = operation
+    return node
+
+def build_multiview_material(view_count, name="LFR_MultiViewMaterial"):
+    material = bpy.data.materials.new(name=name)
+    material.use_nodes = True
+    material.blend_method = 'BLEND'
+    node_tree = material.node_tree
+    nodes = node_tree.nodes
+    links = node_tree.links
+    nodes.clear()
+
+    geometry = new_node(nodes, 'ShaderNodeNewGeometry', "Geometry", (-1600, 0))
+
+    color_sum = None
+    weight_sum = None
+
+    for k in range(view_count):
+        y = -k * 700
+        view_origin = new_node(nodes, 'ShaderNodeCombineXYZ', f"ViewOriginCoords_{k}", (-1600, y - 200))
+        view_direction = new_node(nodes, 'ShaderNodeCombineXYZ', f"ViewDirectionCoords_{k}", (-1400, y - 200))
+        view_right = new_node(nodes, 'ShaderNodeCombineXYZ', f"ViewRightCoords_{k}", (-1400, y - 400))
+        view_up = new_node(nodes, 'ShaderNodeCombineXYZ', f"ViewUpCoords_{k}", (-1400, y - 600))
+
+        # position relative to the view, projected onto the camera axes
+        offset = new_vector_math_node(nodes, 'SUBTRACT', f"ViewOffset_{k}", (-1200, y))
+        links.new(geometry.outputs['Position'], offset.inputs[0])
+        links.new(view_origin.outputs['Vector'], offset.inputs[1])
+
+        depth = new_vector_math_node(nodes, 'DOT_PRODUCT', f"ViewDepth_{k}", (-1000, y))
+        right = new_vector_math_node(nodes, 'DOT_PRODUCT', f"ViewRight_{k}", (-1000, y - 150))
+        up = new_vector_math_node(nodes, 'DOT_PRODUCT', f"ViewUp_{k}", (-1000, y - 300))
+        for dot_node, axis_node in ((depth, view_direction), (right, view_right), (up, view_up)):
+            links.new(offset.outputs['Vector'], dot_node.inputs[0])
+            links.new(axis_node.outputs['Vector'], dot_node.inputs[1])
+
+        # perspective divide, the math node divides safely (0 for a depth of 0)
+        u_divide = new_math_node(nodes, 'DIVIDE', f"ViewUDivide_{k}", (-800, y - 150))
+        v_divide = new_math_node(nodes, 'DIVIDE', f"ViewVDivide_{k}", (-800, y - 300))
+        links.new(right.outputs['Value'], u_divide.inputs[0])
+        links.new(depth.outputs['Value'], u_divide.inputs[1])
+        links.new(up.outputs['Value'], v_divide.inputs[0])
+        links.new(depth.outputs['Value'], v_divide.inputs[1])
+
+        u_center = new_math_node(nodes, 'ADD', f"ViewU_{k}", (-600, y - 150), 0.5)
+        v_center = new_math_node(nodes, 'ADD', f"ViewV_{k}", (-600, y - 300), 0.5)
+        links.new(u_divide.outputs[0], u_center.inputs[0])
+        links.new(v_divide.outputs[0], v_center.inputs[0])
+
+        uv = new_node(nodes, 'ShaderNodeCombineXYZ', f"ViewUV_{k}", (-400, y - 200))
+        links.new(u_center.outputs[0], uv.inputs['X'])
+        links.new(v_center.outputs[0], uv.inputs['Y'])
+
+        # CLIP returns a transparent sample outside of the image
+        main_texture = new_node(nodes, 'ShaderNodeTexImage', f"MainTexture_{k}", (-200, y), "MainTexture")
+        main_texture.extension = 'CLIP'
+        mask_texture = new_node(nodes, 'ShaderNodeTexImage', f"MaskTexture_{k}", (-200, y - 300), "MaskTexture")
+        mask_texture.extension = 'CLIP'
+        links.new(uv.outputs['Vector'], main_texture.inputs['Vector'])
+        links.new(uv.outputs['Vector'], mask_texture.inputs['Vector'])
+
+        # weight = in front of the camera * inside the image * mask
+        in_front = new_math_node(nodes, 'GREATER_THAN', f"ViewInFront_{k}", (-800, y), 0.0)
+        links.new(depth.outputs['Value'], in_front.inputs[0])
+        inside = new_math_node(nodes, 'MULTIPLY', f"ViewInside_{k}", (100, y - 100))
+        links.new(in_front.outputs[0], inside.inputs[0])
+        links.new(main_texture.outputs['Alpha'], inside.inputs[1])
+        weight = new_math_node(nodes, 'MULTIPLY', f"ViewWeight_{k}", (300, y - 100))
+        links.new(inside.outputs[0], weight.inputs[0])
+        links.new(mask_texture.outputs['Color'], weight.inputs[1])
+
+        weighted_color = new_vector_math_node(nodes, 'SCALE', f"ViewWeightedColor_{k}", (500, y))
+        links.new(main_texture.outputs['Color'], weighted_color.inputs[0])
+        links.new(weight.outputs[0], weighted_color.inputs['Scale'])
+
+        if color_sum is None:
+            color_sum = weighted_color.outputs['Vector']
+            weight_sum = weight.outputs[0]
+        else:
+            color_add = new_vector_math_node(nodes, 'ADD', f"ColorSum_{k}", (700, y))
+            links.new(color_sum, color_add.inputs[0])
+            links.new(weighted_color.outputs['Vector'], color_add.inputs[1])
+            color_sum = color_add.outputs['Vector']
+
+            weight_add = new_math_node(nodes, 'ADD', f"WeightSum_{k}", (700, y - 150))
+            links.new(weight_sum, weight_add.inputs[0])
+            links.new(weight.outputs[0], weight_add.inputs[1])
+            weight_sum = weight_add.outputs[0]
+
+    # weighted average of all views, coverage is relative to the maximum amount of views per pass
+    safe_weight = new_math_node(nodes, 'MAXIMUM', "SafeWeightSum", (900, 0), 1e-6)
+    links.new(weight_sum, safe_weight.inputs[0])
+    inverse_weight = new_math_node(nodes, 'DIVIDE', "InverseWeightSum", (1100, 0))
+    inverse_weight.inputs[0].default_value = 1.0
+    links.new(safe_weight.outputs[0], inverse_weight.inputs[1])
+
+    average_color = new_vector_math_node(nodes, 'SCALE', "AverageColor", (1300, 0))
+    links.new(color_sum, average_color.inputs[0])
+    links.new(inverse_weight.outputs[0], average_color.inputs['Scale'])
+
+    coverage = new_math_node(nodes, 'DIVIDE', "Coverage", (1300, -200), float(MULTIVIEW_MAX_VIEWS))
+    coverage.use_clamp = True
+    links.new(weight_sum, coverage.inputs[0])
+
+    emission = new_node(nodes, 'ShaderNodeEmission', "Emission", (1500, 0))
+    links.new(average_color.outputs['Vector'], emission.inputs['Color'])
+    transparent = new_node(nodes, 'ShaderNodeBsdfTransparent', "Transparent", (1500, -200))
+
+    mix = new_node(nodes, 'ShaderNodeMixShader', "CoverageMix", (1700, 0))
+    links.new(coverage.outputs[0], mix.inputs[0])
+    links.new(transparent.outputs[0], mix.inputs[1])
+    links.new(emission.outputs[0], mix.inputs[2])
+
+    output = new_node(nodes, 'ShaderNodeOutputMaterial', "MaterialOutput", (1900, 0))
+    links.new(mix.outputs[0], output.inputs['Surface'])
+
+    return material
+
+def set_combine_xyz(node, vector):
+    node.inputs['X'].default_value = vector[0]
+    node.inputs['Y'].default_value = vector[1]
+    node.inputs['Z'].default_value = vector[2]
+
+def bind_multiview_material_view(material, view_index, location, quaternion, lens, sensor_width, img, mask_img):
+    # the camera matrix of a view, right/up are pre-scaled so that u = right / depth + 0.5
+    nodes = material.node_tree.nodes
+    rotation_matrix = np.array(Quaternion(quaternion).to_matrix())
+    width, height = img.size[0], img.size[1]
+    focal_px = lens / sensor_width * max(width, height) # sensor fit AUTO
+
+    set_combine_xyz(nodes[f"ViewOriginCoords_{view_index}"], location)
+    set_combine_xyz(nodes[f"ViewDirectionCoords_{view_index}"], -rotation_matrix[:, 2])
+    set_combine_xyz(nodes[f"ViewRightCoords_{view_index}"], rotation_matrix[:, 0] * focal_px / width)
+    set_combine_xyz(nodes[f"ViewUpCoords_{view_index}"], rotation_matrix[:, 1] * focal_px / height)
+
+    nodes[f"MainTexture_{view_index}"].image = img
+    nodes[f"MaskTexture_{view_index}"].image = mask_img
+
+def integrate_range_multiview(lfr_props, start_keyframe_index, focus=None, view_stride=1):
+    frame_indices = get_range_frame_indices(lfr_props, start_keyframe_index)
+    if len(frame_indices) == 0:
+        raise ValueError("At least one image is required for blending.")
+
+    if focus is None:
+        focus = lfr_props.focus
+
+    bpy.context.scene.camera = get_integration_camera(lfr_props, frame_indices, focus)
+    frame_indices = frame_indices[::view_stride] # the camera stays on the middle of the whole range
+
+    sensor_width = 36.0
+    if lfr_props.cam_obj is not None:
+        sensor_width = lfr_props.cam_obj.data.sensor_width
+    mask_img = image_cache.get(lfr_props.img_mask)
+
+    capture = RenderCapture(bpy.context.scene)
+
+    lfr_props.projection_mesh_obj.hide_render = True
+    lfr_props.dem_mesh_obj.hide_render = True
+    # uncovered pixels have to stay transparent instead of showing the world color
+    film_transparent = bpy.context.scene.render.film_transparent
+    bpy.context.scene.render.film_transparent = True
+
+    print("rendering...")
+    try:
+        accumulator = render_multiview_batches(lfr_props, frame_indices, focus, sensor_width, mask_img, capture)
+    finally:
+        capture.close()
+        bpy.context.scene.render.film_transparent = film_transparent
+        lfr_props.dem_mesh_obj.hide_render = False
+        lfr_props.projection_mesh_obj.hide_render = False  #unhide the main projection mesh
+    print("done rendering")
+
+    # a batch's alpha is its weight sum / MULTIVIEW_MAX_VIEWS, the accumulator averages it over the batches.
+    # Rescaled to weight sum / view count, the coverage the RENDER engine produces
+    alpha_scale = accumulator.non_transparent_count * MULTIVIEW_MAX_VIEWS / len(frame_indices)
+    return accumulator.to_image(alpha_scale=alpha_scale)
+
+def render_multiview_batches(lfr_props, frame_indices, focus, sensor_width, mask_img, capture):
+    poses = get_pose_table(lfr_props)
+    accumulator = None
+    for batch_start in range(0, len(frame_indices), MULTIVIEW_MAX_VIEWS):
+        batch = frame_indices[batch_start:batch_start + MULTIVIEW_MAX_VIEWS]
+        material = build_multiview_material(len(batch))
+
+        for view_index, frame_number in enumerate(batch):
+            location = poses.locations[frame_number] + np.array((0.0, focus, 0.0))
+            img = image_cache.get(lfr_props.cameras_path + poses.image_file(frame_number))
+            bind_multiview_material_view(material, view_index, location, poses.quaternions[frame_number],
+                                         poses.fovy[frame_number], sensor_width, img, mask_img)
+
+        plane = create_range_projection_plane(lfr_props.projection_mesh_obj, lfr_props.projection_mesh_obj.location)
+        plane.material_slots[0].material = material
+
+        # one render for the whole batch
+        with span("integrate_range_multiview.render_batch"):
+            pixels = capture.render()
+        if accumulator is None:
+            accumulator = ImageAccumulator(capture.width, capture.height)
+        accumulator.add_pixels(to_straight_srgb(pixels, capture.display_transform))
+
+        bpy.data.objects.remove(plane, do_unlink=True)
+        bpy.data.materials.remove(material, do_unlink=True)
+
+    return accumulator
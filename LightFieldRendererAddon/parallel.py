@@ -0,0 +1,155 @@
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import bpy
+
+# Frame parallel sequence rendering: the frame range is split into contiguous chunks and every
+# chunk is rendered by its own background Blender process (headless.py --no-load) that opens a
+# copy of the current .blend file, so every worker loads the recording only once.
+
+PROGRESS_PREFIX = "LFR_PROGRESS" # printed by headless.py
+HEADLESS_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "headless.py")
+
+def split_frame_range(frame_start, frame_end, chunk_count):
+    # contiguous chunks [start, end] (inclusive), neighbouring frames share their images in the cache
+    frame_count = frame_end - frame_start + 1
+    chunk_count = max(1, min(chunk_count, frame_count))
+    chunk_size, remainder = divmod(frame_count, chunk_count)
+
+    chunks = []
+    start = frame_start
+    for i in range(chunk_count):
+        end = start + chunk_size - 1 + (1 if i < remainder else 0)
+        chunks.append((start, end))
+        start = end + 1
+    return chunks
+
+def parse_progress_line(line):
+    # "LFR_PROGRESS <done> <total> <frame> <file>" -> (frame, file), None for any other output
+    if not line.startswith(PROGRESS_PREFIX):
+        return None
+
+    parts = line.rstrip("\n").split(" ", 4)
+    if len(parts) != 5:
+        return None
+    return int(parts[3]), parts[4]
+
+def build_worker_command(blend_path, frame_start, frame_end, output_path, threads):
+    # --factory-startup keeps user add-ons out of the workers, headless.py registers this add-on itself
+    return [bpy.app.binary_path, "-b", "--factory-startup", "-t", str(threads), blend_path,
+            "-P", HEADLESS_SCRIPT, "--",
+            "--no-load", "--mode", "sequence",
+            "--frame-start", str(frame_start), "--frame-end", str(frame_end),
+            "--output", output_path]
+
+class ParallelRenderJob:
+    def __init__(self, frame_start, frame_end, worker_count, output_path):
+        self.frame_start = frame_start
+        self.frame_end = frame_end
+        self.worker_count = worker_count
+        self.output_path = output_path
+        self.work_path = None
+        self.processes = []
+        self.reader_threads = []
+        self.progress = queue.Queue() # (frame, file) of finished frames
+        self.outputs = {} # frame -> file
+
+    @property
+    def frame_count(self):
+        return self.frame_end - self.frame_start + 1
+
+    def start(self):
+        self.work_path = tempfile.mkdtemp(prefix="lfr_parallel_")
+        blend_path = os.path.join(self.work_path, "scene.blend")
+        bpy.ops.wm.save_as_mainfile(filepath=blend_path, copy=True, check_existing=False)
+
+        chunks = split_frame_range(self.frame_start, self.frame_end, self.worker_count)
+        threads = max(1, (os.cpu_count() or 1) // len(chunks)) # keep the workers from oversubscribing the cores
+
+        for chunk_start, chunk_end in chunks:
+            command = build_worker_command(blend_path, chunk_start, chunk_end, self.work_path, threads)
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       text=True, bufsize=1)
+            reader = threading.Thread(target=self.read_worker_output, args=(process,), daemon=True)
+            reader.start()
+            self.processes.append(process)
+            self.reader_threads.append(reader)
+
+    def read_worker_output(self, process):
+        for line in process.stdout:
+            parsed = parse_progress_line(line)
+            if parsed is not None:
+                self.progress.put(parsed)
+        process.stdout.close()
+
+    def poll(self):
+        # collects the finished frames, returns True while workers are still running
+        while True:
+            try:
+                frame, file_path = self.progress.get_nowait()
+            except queue.Empty:
+                break
+            self.outputs[frame] = file_path
+
+        return any(process.poll() is None for process in self.processes) or any(reader.is_alive() for reader in self.reader_threads)
+
+    def failed_workers(self):
+        return [process for process in self.processes if process.poll() not in (None, 0)]
+
+    def collect_outputs(self, name_for_frame):
+        # moves the worker outputs into the render folder in frame order, later frames overwrite
+        # earlier ones when they map to the same name (like the single process render does)
+        self.poll() # frames that were reported after the last poll
+        collected = []
+        for frame in sorted(self.outputs.keys()):
+            target_path = os.path.join(self.output_path, name_for_frame(frame))
+            shutil.move(self.outputs[frame], target_path)
+            collected.append(target_path)
+        return collected
+
+    def cancel(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+
+    def cleanup(self):
+        self.cancel()
+        for process in self.processes:
+            process.wait()
+        if self.work_path is not None:
+            shutil.rmtree(self.work_path, ignore_errors=True)
+            self.work_path = None
+
+def render_sequence_parallel(context, frame_start, frame_end, worker_count, name_for_frame):
+    # returns the collected files and the amount of frames that are missing (failed workers)
+    lfr_props = context.scene.lfr_properties
+    job = ParallelRenderJob(frame_start, frame_end, worker_count, lfr_props.render_path)
+    window_manager = context.window_manager
+
+    print(f"rendering {job.frame_count} frames with {worker_count} worker processes...")
+    window_manager.progress_begin(0, job.frame_count)
+    try:
+        job.start()
+        reported = 0
+        while job.poll():
+            if len(job.outputs) != reported:
+                reported = len(job.outputs)
+                window_manager.progress_update(reported)
+                print(f"rendered {reported}/{job.frame_count} frames")
+            time.sleep(0.2)
+
+        failed = job.failed_workers()
+        collected = job.collect_outputs(name_for_frame)
+        missing_count = job.frame_count - len(job.outputs)
+        if failed or missing_count:
+            print(f"{len(failed)} render worker(s) failed, {len(job.outputs)}/{job.frame_count} frames were rendered")
+    finally:
+        window_manager.progress_end()
+        job.cleanup()
+
+    print("done rendering")
+    return collected, missing_count
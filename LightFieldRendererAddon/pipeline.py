@@ -0,0 +1,281 @@
+from contextlib import contextmanager
+import bpy
+from . cameras import *
+from . dem import *
+from . integration import integrate_range_numpy, build_height_field, RangeSources
+from . multiview import integrate_range_multiview
+from . lightfields import *
+from . plane import *
+from . properties import *
+from . util import *
+from . poses import get_pose_table, set_pose_table
+from . image_cache import image_cache
+from . capture import RenderCapture, VideoPipeWriter, to_straight_srgb
+from . frame_updates import frame_update_scheduler, synchronous_frame_updates
+from . proxies import proxy_builder
+from . view_index import get_view_index
+from . trace import span
+from . time_index import get_timestamp_index
+
+# the load -> integrate -> write steps shared by the panel operators and the headless entry point (headless.py)
+
+def load_lfr_data(context):
+    context.scene.render.use_lock_interface = True
+
+    if pre_frame_change_handler in bpy.app.handlers.frame_change_pre:
+        bpy.app.handlers.frame_change_pre.remove(pre_frame_change_handler)
+    frame_update_scheduler.cancel() # pending updates refer to the previous recording
+    proxy_builder.cancel()
+
+    clear_scene()
+    bpy.ops.outliner.orphans_purge(do_local_ids=True, do_linked_ids=True, do_recursive=True) #slight memory clean up
+    purge_all_addon_property_data(context)
+
+    lfr_prp = context.scene.lfr_properties
+    lfr_prp.view_range_of_images = False
+    image_cache.set_budget(lfr_prp.image_cache_budget_mb * 1024 * 1024)
+
+    correctly_set_or_overwrite_path_strings(lfr_prp)
+
+    lfr_prp.dem_mesh_obj = import_dem(lfr_prp.dem_path, rotation=(0, 0, 0)) #euler rotation
+
+    pose_table = parse_poses(lfr_prp.json_path, lfr_prp.every_nth_frame)
+
+    #takes the camera dataset and keeps it as the scene's pose table (see get_pose_table)
+    if (pose_table is not None):
+        set_pose_table(lfr_prp, pose_table)
+        get_view_index(lfr_prp) # spatial index for view_selection 'NEAREST'
+        get_timestamp_index(lfr_prp) # time lookups (jump to time, time windows)
+
+        if (context.scene.frame_current > len(pose_table)-1): 
+            bpy.context.scene.frame_set(1)
+
+        init_startup_objs(None, context) # generates main camera and potentially a projection plane
+        create_curve_data_and_key_frames(lfr_prp) # rendering camera gets generated inside
+        bpy.app.handlers.frame_change_pre.append(pre_frame_change_handler) 
+        bpy.context.scene.frame_set(1)
+
+        bpy.ops.object.mode_set(mode="OBJECT")    
+        bpy.ops.object.select_all(action='DESELECT') # deselect everything
+        bpy.data.objects[lfr_prp.cam_obj.name].select_set(True) # have camera selected after loading
+
+    return pose_table
+
+def render_range_integral_image(context, start_keyframe_index):
+    lfr_prp = context.scene.lfr_properties
+    lfr_prp.view_range_of_images = False
+
+    if lfr_prp.integration_engine == 'NUMPY':
+        # no projection groups needed, works straight from the pose table
+        return integrate_range_numpy(lfr_prp, start_keyframe_index)
+
+    if lfr_prp.integration_engine == 'MULTIVIEW':
+        return integrate_range_multiview(lfr_prp, start_keyframe_index)
+
+    #----
+    if pre_frame_change_handler in bpy.app.handlers.frame_change_pre:
+        bpy.app.handlers.frame_change_pre.remove(pre_frame_change_handler)
+
+    apply_images_and_positions_to_planes_from_range(lfr_prp, start_keyframe_index)
+    offset_proj_cameras_with_focus(lfr_prp, start_keyframe_index) #reposition cameras depending on focus
+    result_image = combine_images(lfr_prp)
+    bpy.app.handlers.frame_change_pre.append(pre_frame_change_handler) 
+    #----
+    delete_temp_objects_of_range_rendering(lfr_prp)
+
+    return result_image
+
+def render_range_integral_tiled(context, start_keyframe_index, filepath):
+    # same as the RENDER engine of render_range_integral_image, but the result goes straight to disk
+    lfr_prp = context.scene.lfr_properties
+    if lfr_prp.integration_engine != 'RENDER':
+        raise ValueError(f"Tiled integration only works with the Blender Render engine, not {lfr_prp.integration_engine}.")
+    lfr_prp.view_range_of_images = False
+
+    if pre_frame_change_handler in bpy.app.handlers.frame_change_pre:
+        bpy.app.handlers.frame_change_pre.remove(pre_frame_change_handler)
+
+    try:
+        apply_images_and_positions_to_planes_from_range(lfr_prp, start_keyframe_index)
+        offset_proj_cameras_with_focus(lfr_prp, start_keyframe_index) #reposition cameras depending on focus
+        result_path = combine_images_tiled(lfr_prp, filepath, lfr_prp.tile_size)
+    finally:
+        bpy.app.handlers.frame_change_pre.append(pre_frame_change_handler) 
+        delete_temp_objects_of_range_rendering(lfr_prp)
+
+    return result_path
+
+def get_focus_values(focus_start, focus_end, steps):
+    if steps < 1:
+        raise ValueError("A focal stack needs at least one step.")
+    if steps == 1:
+        return [focus_start]
+    return [focus_start + (focus_end - focus_start) * i / (steps - 1) for i in range(steps)]
+
+def get_focal_stack_file_name(index, focus):
+    return f"focal_stack_{index:03d}_{focus:.3f}.png"
+
+@contextmanager
+def focus_range_renderer(context, start_keyframe_index):
+    # the range is loaded once, the yielded function renders its integral image for any focus,
+    # between the calls only the projection cameras move (offset_proj_cameras_with_focus).
+    # With a view_stride > 1 only every n-th view of the range is integrated
+    lfr_prp = context.scene.lfr_properties
+    lfr_prp.view_range_of_images = False
+
+    if lfr_prp.integration_engine == 'NUMPY':
+        # the terrain and the decoded images are shared, only the cameras and their rays depend on the focus
+        height_field = build_height_field(lfr_prp.dem_mesh_obj)
+        sources = RangeSources(lfr_prp, get_range_frame_indices(lfr_prp, start_keyframe_index))
+        yield lambda focus, view_stride=1: integrate_range_numpy(lfr_prp, start_keyframe_index, height_field, focus, view_stride, sources)
+        return
+
+    if lfr_prp.integration_engine == 'MULTIVIEW':
+        yield lambda focus, view_stride=1: integrate_range_multiview(lfr_prp, start_keyframe_index, focus, view_stride)
+        return
+
+    def render_focus(focus, view_stride=1):
+        offset_proj_cameras_with_focus(lfr_prp, start_keyframe_index, focus)
+        return combine_images(lfr_prp, view_stride)
+
+    #----
+    if pre_frame_change_handler in bpy.app.handlers.frame_change_pre:
+        bpy.app.handlers.frame_change_pre.remove(pre_frame_change_handler)
+
+    try:
+        apply_images_and_positions_to_planes_from_range(lfr_prp, start_keyframe_index)
+        yield render_focus
+    finally:
+        offset_proj_cameras_with_focus(lfr_prp, start_keyframe_index) # back to the focus of the panel
+        bpy.app.handlers.frame_change_pre.append(pre_frame_change_handler) 
+        delete_temp_objects_of_range_rendering(lfr_prp)
+    #----
+
+def render_focal_stack(context, start_keyframe_index, focus_values, output_path):
+    file_paths = []
+    with focus_range_renderer(context, start_keyframe_index) as render_focus:
+        for index, focus in enumerate(focus_values):
+            result_image = render_focus(focus)
+            file_name = get_focal_stack_file_name(index, focus)
+            save_image_to_disk(output_path, file_name, result_image, False)
+            bpy.data.images.remove(result_image, do_unlink=True)
+            file_paths.append(output_path + file_name)
+            print(f"focal stack {index + 1}/{len(focus_values)}: focus {focus:.3f}")
+
+    return file_paths
+
+def render_view_contribution(lfr_prp, capture, frame_number):
+    # binds one pooled projection group to the view, renders it alone and puts it back into the pool
+    poses = get_pose_table(lfr_prp)
+    create_and_prep_new_camera(lfr_prp, lfr_prp.cameras_path + poses.image_file(frame_number), lfr_prp.img_mask, frame_number)
+    offset_proj_cameras_with_focus(lfr_prp, frame_number)
+    entry = lfr_prp.range_objects[len(lfr_prp.range_objects) - 1]
+    entry.mesh.hide_viewport = False
+    entry.mesh.hide_render = False
+
+    try:
+        pixels = to_straight_srgb(capture.render(), capture.display_transform)
+    finally:
+        delete_temp_objects_of_range_rendering(lfr_prp)
+    return pixels
+
+def render_sliding_window_sequence(context, frame_start, frame_end, name_for_frame):
+    # integral image of every frame's range seen from the fixed manual render camera. Consecutive
+    # ranges share most of their views, every view is rendered once when it enters the window and its
+    # cached contribution gets subtracted again when it leaves, about one render per output frame
+    scene = context.scene
+    lfr_prp = scene.lfr_properties
+    if lfr_prp.man_rend_cam is None:
+        raise ValueError("Sliding window rendering needs a fixed render camera (manual rendering camera).")
+
+    lfr_prp.view_range_of_images = False
+    if pre_frame_change_handler in bpy.app.handlers.frame_change_pre:
+        bpy.app.handlers.frame_change_pre.remove(pre_frame_change_handler)
+    delete_temp_objects_of_range_rendering(lfr_prp)
+
+    scene.camera = lfr_prp.man_rend_cam
+    scene.render.image_settings.file_format = 'PNG'
+    scene.render.image_settings.color_mode = 'RGBA'
+    lfr_prp.projection_mesh_obj.hide_render = True
+    lfr_prp.projection_mesh_obj.hide_viewport = True
+    lfr_prp.dem_mesh_obj.hide_render = True
+    lfr_prp.dem_mesh_obj.hide_viewport = True
+
+    # the cached contributions of a whole window have to fit into the image cache budget
+    width = int(scene.render.resolution_x * scene.render.resolution_percentage / 100)
+    height = int(scene.render.resolution_y * scene.render.resolution_percentage / 100)
+    window_bytes = lfr_prp.range_to_interpolate * width * height * 4 * 2 # float16 RGBA per view
+    if window_bytes > lfr_prp.image_cache_budget_mb * 1024 * 1024:
+        raise ValueError(f"Sliding window rendering needs {window_bytes // (1024 * 1024)} MB for {lfr_prp.range_to_interpolate} views, "
+                         f"more than the image cache budget of {lfr_prp.image_cache_budget_mb} MB.")
+
+    capture = RenderCapture(scene)
+    accumulator = None
+    contributions = {} # frame number -> contribution of the views inside of the window (ImageAccumulator.to_contribution)
+    file_paths = []
+    updates_since_rebuild = 0
+
+    try:
+        for output_frame in range(frame_start, frame_end):
+            window = get_range_frame_indices(lfr_prp, output_frame - 1) # same range as the range render of that frame
+            window_set = set(window)
+
+            for frame_number in [frame for frame in contributions if frame not in window_set]:
+                accumulator.subtract_contribution(contributions.pop(frame_number))
+                updates_since_rebuild += 1
+
+            for frame_number in window:
+                if frame_number in contributions:
+                    continue
+                with span("sliding_window.render_view"):
+                    pixels = render_view_contribution(lfr_prp, capture, frame_number)
+                if accumulator is None:
+                    accumulator = ImageAccumulator(capture.width, capture.height)
+                contributions[frame_number] = ImageAccumulator.to_contribution(pixels)
+                accumulator.add_contribution(contributions[frame_number])
+
+            if accumulator is None:
+                raise ValueError("At least one image is required for blending.")
+
+            # subtracting leaves float rounding behind, re-summed from the cache once the window turned over
+            if updates_since_rebuild >= max(1, len(window)):
+                accumulator.clear()
+                for contribution in contributions.values():
+                    accumulator.add_contribution(contribution)
+                updates_since_rebuild = 0
+
+            result_image = accumulator.to_image()
+            save_image_to_disk(lfr_prp.render_path, name_for_frame(output_frame), result_image, False)
+            bpy.data.images.remove(result_image, do_unlink=True)
+            file_paths.append(lfr_prp.render_path + name_for_frame(output_frame))
+            print(f"sliding window frame {output_frame}: {len(window)} views")
+    finally:
+        capture.close()
+        finish_range_render(lfr_prp)
+        bpy.app.handlers.frame_change_pre.append(pre_frame_change_handler) 
+
+    return file_paths
+
+def render_sequence_frame(scene, frame, filepath):
+    with synchronous_frame_updates():
+        scene.frame_set(frame)
+    scene.render.filepath = filepath
+    bpy.ops.render.render(write_still=True)
+
+def render_sequence_video(scene, frame_start, frame_end, filepath):
+    # every frame is rendered once and streamed to the encoder, no intermediate files
+    capture = RenderCapture(scene)
+    writer = None
+    try:
+        for frame in range(frame_start, frame_end):
+            with synchronous_frame_updates():
+                scene.frame_set(frame)
+            pixels = capture.render()
+            if writer is None:
+                writer = VideoPipeWriter(filepath, capture.width, capture.height, scene.render.fps / scene.render.fps_base,
+                                         display_transform=capture.display_transform)
+            writer.write_frame(pixels)
+    finally:
+        capture.close()
+        if writer is not None:
+            writer.close()
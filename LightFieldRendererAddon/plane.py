@@ -3,6 +3,8 @@ import time
 import bpy
 from mathutils import *
 from . util import *
+from . image_cache import image_cache
+from . trace import traced
 D = bpy.data
 C = bpy.context
 
@@ -36,16 +38,22 @@ def create_giant_projection_plane(source_obj):
         new_obj.data.update()
         return new_obj
 
-def update_projection_material_tex(material, img_texture): 
-
+def create_range_projection_plane(source_obj, location):
+    # range planes share the mesh of the main projection plane, only their object transform
+    # and their object-linked material differ, so an extra view does not copy the DEM again
+    new_obj = bpy.data.objects.new("Plane", source_obj.data)
+    bpy.context.collection.objects.link(new_obj)
+    new_obj.matrix_world = source_obj.matrix_world.copy()
+    new_obj.location = location
 
-    for image_data in bpy.data.images:
-        if image_data == img_texture:
-            continue
+    if len(new_obj.material_slots) == 0:
+        source_obj.data.materials.append(None)
 
-        if image_data.users == 0:
-            bpy.data.images.remove(image_data, do_unlink=True)
+    new_obj.material_slots[0].link = 'OBJECT'
+    return new_obj
 
+@traced("update_projection_material_tex")
+def update_projection_material_tex(material, img_texture): 
     nodes = material.node_tree.nodes # Get the shader nodes of the material
     base_color_texture_node = None
 
@@ -57,6 +65,9 @@ def update_projection_material_tex(material, img_texture):
     # Assign the new image
     base_color_texture_node.image = img_texture
 
+    # images that are no longer assigned become evictable, only the cache's own images get removed
+    image_cache.trim(keep=img_texture)
+
     # if is_rendering() is False:
     #     bpy.ops.outliner.orphans_purge(do_local_ids=True, do_linked_ids=True, do_recursive=True) #memory cleanup during brushing
     # # Iterate through all image data blocks
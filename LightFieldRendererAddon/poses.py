@@ -0,0 +1,301 @@
+import base64
+from datetime import datetime, timezone
+import io
+import json
+import os
+import struct
+import zipfile
+import numpy as np
+
+try:
+    from dateutil import parser
+except ImportError:
+    print("python-dateutil is not installed. Installing...")
+    try:
+        import pip
+        pip.main(["install", "python-dateutil"])
+        from dateutil import parser
+        print("python-dateutil has been successfully installed.")
+    except ImportError:
+        print("Failed to install python-dateutil. Please install it manually.")
+        raise
+
+POSE_CACHE_VERSION = 1
+POSE_CACHE_SUFFIX = ".lfrcache.npz"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+class PoseTable:
+    # columnar pose data, locations are already converted to blender coordinates
+    aspect = 1.0
+    near = 0.5
+    far = 100
+
+    def __init__(self, locations, quaternions, fovy, timestamps, image_index, image_names):
+        self.locations = locations      # (n, 3) float64
+        self.quaternions = quaternions  # (n, 4) float32, stored as x, y, z, w like the json
+        self.fovy = fovy                # (n,) float32
+        self.timestamps = timestamps    # (n,) int64 epoch nanoseconds (UTC)
+        self.image_index = image_index  # (n,) int32 into image_names
+        self.image_names = image_names  # interned image file names
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 3)), np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32),
+                   np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32), np.array([""], dtype=str))
+
+    def __len__(self):
+        return len(self.fovy)
+
+    def image_file(self, index):
+        return str(self.image_names[self.image_index[index]])
+
+    def take(self, indices):
+        # slices stay views of the (memory mapped) columns, index arrays create copies
+        return PoseTable(self.locations[indices], self.quaternions[indices], self.fovy[indices],
+                         self.timestamps[indices], self.image_index[indices], self.image_names)
+
+def parse_timestamp_ns(timestamp):
+    try:
+        parsed_date = datetime.fromisoformat(timestamp)
+    except ValueError:
+        parsed_date = parser.parse(timestamp) # slower, but understands every format
+
+    if parsed_date.tzinfo is None:
+        parsed_date = parsed_date.replace(tzinfo=timezone.utc)
+
+    delta = parsed_date - EPOCH # integer arithmetic, floats would lose the sub-microsecond part
+    return (delta.days * 86400 + delta.seconds) * 1_000_000_000 + delta.microseconds * 1000
+
+def timestamp_ns_to_iso(timestamp_ns):
+    return datetime.fromtimestamp(int(timestamp_ns) // 1000 / 1_000_000, tz=timezone.utc).isoformat()
+
+def euler_xyz_to_quaternions(euler_degrees):
+    # vectorized mathutils.Euler(..., 'XYZ').to_quaternion(), returns x, y, z, w columns
+    half = np.radians(euler_degrees) * 0.5
+    cx, cy, cz = np.cos(half[:, 0]), np.cos(half[:, 1]), np.cos(half[:, 2])
+    sx, sy, sz = np.sin(half[:, 0]), np.sin(half[:, 1]), np.sin(half[:, 2])
+
+    return np.stack((
+        sx * cy * cz - cx * sy * sz,
+        cx * sy * cz + sx * cy * sz,
+        cx * cy * sz - sx * sy * cz,
+        cx * cy * cz + sx * sy * sz,
+    ), axis=1)
+
+def parse_pose_json(posesUrl):
+    # parses all frames, rows that miss rotation, location or imagefile are flagged invalid
+    with open(posesUrl, 'r') as file:
+        poses = json.load(file)
+
+    frames = None
+    if "images" in poses:
+        frames = poses["images"]
+    elif "frames" in poses:
+        frames = poses["frames"]
+    else:
+        print("No 'images' or 'frames' found in poses")
+        return None
+
+    frame_count = len(frames)
+    valid = np.zeros(frame_count, dtype=bool)
+    json_locations = np.zeros((frame_count, 3), dtype=np.float64)
+    quaternions = np.zeros((frame_count, 4), dtype=np.float64)
+    quaternions[:, 3] = 1.0
+    fovy = np.zeros(frame_count, dtype=np.float32)
+    timestamps = np.zeros(frame_count, dtype=np.int64)
+    image_index = np.zeros(frame_count, dtype=np.int32)
+
+    euler_rows = []
+    euler_angles = []
+    image_name_lookup = {}
+
+    for i, pose in enumerate(frames):
+        if "rotation" not in pose or "location" not in pose or "imagefile" not in pose:
+            continue
+
+        rotation = pose["rotation"]
+        if len(rotation) == 4:
+            # Assume we have a quaternion
+            quaternions[i] = rotation
+        elif len(rotation) == 3:
+            # Assume we have Euler angles
+            euler_rows.append(i)
+            euler_angles.append(rotation)
+
+        if "fovy" not in pose:
+            print(f"Pose {i} has no 'fovy' property!")
+            raise ValueError(f"Pose {i} has no 'fovy' property!")
+
+        pose_fovy = pose["fovy"]
+        if isinstance(pose_fovy, list):
+            pose_fovy = pose_fovy[0]
+
+        if not isinstance(pose_fovy, (int, float)):
+            print(f"Pose {i} has no numeric 'fovy' property!")
+            raise ValueError(f"Pose {i} has no numeric 'fovy' property!")
+
+        valid[i] = True
+        fovy[i] = pose_fovy
+        json_locations[i] = pose["location"]
+        image_index[i] = image_name_lookup.setdefault(pose["imagefile"], len(image_name_lookup))
+
+        if "timestamp" in pose:
+            timestamps[i] = parse_timestamp_ns(pose["timestamp"])
+
+    if euler_rows:
+        euler_angles = np.array(euler_angles, dtype=np.float64)
+        # IMPORTANT: very likely needs to be changed
+        euler_angles[:, 1] += 180 # hot fix ---------------------------------------<<<
+        euler_angles[:, 2] -= 90 # hot fix ---------------------------------------<<<
+        quaternions[euler_rows] = euler_xyz_to_quaternions(euler_angles)
+
+    # 0 = X, 1 = Y, 2 = Z
+    # blender uses XZY
+    locations = np.empty_like(json_locations)
+    locations[:, 0] = json_locations[:, 0]
+    locations[:, 1] = json_locations[:, 2] * -1
+    locations[:, 2] = json_locations[:, 1]
+
+    image_names = np.array(list(image_name_lookup.keys()) or [""], dtype=str)
+    table = PoseTable(locations, quaternions.astype(np.float32), fovy, timestamps, image_index, image_names)
+    return table, valid
+
+def get_pose_cache_path(posesUrl):
+    return posesUrl + POSE_CACHE_SUFFIX
+
+def save_pose_cache(cache_path, table, valid, source_stat):
+    # written next to the cache and moved into place, a concurrent reader never sees a partial file
+    temp_path = cache_path + ".tmp"
+    with open(temp_path, 'wb') as file:
+        np.savez(file,
+                 cache_version=np.int64(POSE_CACHE_VERSION),
+                 source_mtime_ns=np.int64(source_stat.st_mtime_ns),
+                 source_size=np.int64(source_stat.st_size),
+                 valid=valid,
+                 locations=table.locations,
+                 quaternions=table.quaternions,
+                 fovy=table.fovy,
+                 timestamps=table.timestamps,
+                 image_index=table.image_index,
+                 image_names=table.image_names)
+    os.replace(temp_path, cache_path)
+
+def load_npz_memmapped(npz_path):
+    # np.load ignores mmap_mode for .npz archives, uncompressed members can still be mapped directly
+    arrays = {}
+    with zipfile.ZipFile(npz_path) as archive, open(npz_path, 'rb') as file:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.load(member)
+                continue
+
+            file.seek(info.header_offset)
+            local_header = file.read(30)
+            name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+            file.seek(info.header_offset + 30 + name_length + extra_length)
+
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+
+            if len(shape) == 0 or 0 in shape:
+                arrays[name] = np.fromfile(file, dtype=dtype, count=1 if len(shape) == 0 else 0).reshape(shape)
+                continue
+
+            arrays[name] = np.memmap(npz_path, dtype=dtype, mode='r', offset=file.tell(), shape=shape,
+                                     order='F' if fortran_order else 'C')
+    return arrays
+
+def load_pose_cache(cache_path, source_stat):
+    if not os.path.isfile(cache_path):
+        return None
+
+    try:
+        arrays = load_npz_memmapped(cache_path)
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        print(f"Ignoring unreadable pose cache {cache_path}: {e}")
+        return None
+
+    if (int(arrays.get("cache_version", -1)) != POSE_CACHE_VERSION or
+        int(arrays["source_mtime_ns"]) != source_stat.st_mtime_ns or
+        int(arrays["source_size"]) != source_stat.st_size):
+        return None
+
+    table = PoseTable(arrays["locations"], arrays["quaternions"], arrays["fovy"],
+                      arrays["timestamps"], arrays["image_index"], arrays["image_names"])
+    return table, arrays["valid"]
+
+def load_pose_table(posesUrl, nth_frame):
+    source_stat = os.stat(posesUrl)
+    cache_path = get_pose_cache_path(posesUrl)
+
+    cached = load_pose_cache(cache_path, source_stat)
+    if cached is None:
+        cached = parse_pose_json(posesUrl)
+        if cached is None:
+            return None
+
+        try:
+            save_pose_cache(cache_path, cached[0], cached[1], source_stat)
+        except OSError as e:
+            print(f"Could not write pose cache {cache_path}: {e}")
+
+    table, valid = cached
+    if valid.all():
+        return table.take(slice(0, len(table), nth_frame))
+
+    indices = np.arange(0, len(table), nth_frame)
+    return table.take(indices[valid[indices]])
+
+# ---- per scene pose store
+# the table lives in memory per scene and is kept in the .blend as a single base64 blob (lfr_properties.pose_blob)
+
+scene_pose_tables = {}
+
+def get_scene_key(lfr_prp):
+    return lfr_prp.id_data.as_pointer()
+
+def pose_table_to_blob(table):
+    buffer = io.BytesIO()
+    np.savez(buffer,
+             locations=table.locations,
+             quaternions=table.quaternions,
+             fovy=table.fovy,
+             timestamps=table.timestamps,
+             image_index=table.image_index,
+             image_names=table.image_names)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+def pose_table_from_blob(blob):
+    arrays = np.load(io.BytesIO(base64.b64decode(blob)))
+    return PoseTable(arrays["locations"], arrays["quaternions"], arrays["fovy"],
+                     arrays["timestamps"], arrays["image_index"], arrays["image_names"])
+
+def get_pose_table(lfr_prp):
+    key = get_scene_key(lfr_prp)
+    table = scene_pose_tables.get(key)
+
+    if table is None:
+        # e.g. after opening a saved .blend file
+        table = pose_table_from_blob(lfr_prp.pose_blob) if lfr_prp.pose_blob else PoseTable.empty()
+        scene_pose_tables[key] = table
+
+    return table
+
+def set_pose_table(lfr_prp, table):
+    scene_pose_tables[get_scene_key(lfr_prp)] = table
+    lfr_prp.pose_blob = pose_table_to_blob(table)
+
+def clear_scene_pose_tables():
+    # scenes of another file (or of an undo step) can reuse the address of a cached scene,
+    # the tables get rebuilt from their pose_blob on the next access
+    scene_pose_tables.clear()
+
+def clear_pose_table(lfr_prp):
+    scene_pose_tables[get_scene_key(lfr_prp)] = PoseTable.empty()
+    lfr_prp.pose_blob = ""
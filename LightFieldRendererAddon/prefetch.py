@@ -0,0 +1,179 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import bpy
+import numpy as np
+from . image_cache import image_cache
+from . poses import get_pose_table
+from . trace import traced
+from . proxies import get_view_image_path
+
+# Decodes the images of upcoming frames on worker threads, so that the frame change handler
+# only has to copy finished pixel buffers into image datablocks.
+# bpy is not thread safe, the workers therefore decode with OpenImageIO (bundled with newer
+# Blender versions) or Pillow. Without either of them frames are loaded synchronously as before.
+# The workers also convert the pixels to the float buffer foreach_set expects, the amount of
+# pending frames is limited by the space that is left in the image cache budget.
+
+try:
+    import OpenImageIO as oiio
+except ImportError:
+    oiio = None
+
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    PILImage = None
+
+def has_decoder():
+    return oiio is not None or PILImage is not None
+
+def to_blender_pixel_layout(pixels):
+    # top-down (height, width, channels) uint8 -> flat bottom-up float32 RGBA like bpy image pixels
+    height, width, channels = pixels.shape
+    rgba = np.full((height, width, 4), 255, dtype=np.uint8)
+    if channels >= 3:
+        rgba[:, :, :3] = pixels[:, :, :3]
+    else:
+        rgba[:, :, :3] = pixels[:, :, :1]
+    if channels == 4:
+        rgba[:, :, 3] = pixels[:, :, 3]
+
+    return rgba[::-1].reshape(-1).astype(np.float32) * np.float32(1.0 / 255.0)
+
+@traced("decode_image")
+def decode_image(img_path):
+    if oiio is not None:
+        image_input = oiio.ImageInput.open(img_path)
+        if image_input is None:
+            raise IOError(f"Could not open image {img_path}: {oiio.geterror()}")
+        pixels = image_input.read_image(format=oiio.UINT8)
+        image_input.close()
+    elif PILImage is not None:
+        with PILImage.open(img_path) as pil_image:
+            pixels = np.asarray(pil_image.convert("RGBA"), dtype=np.uint8)
+    else:
+        raise ImportError("No image decoder available for prefetching (OpenImageIO or Pillow).")
+
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, None]
+
+    height, width = pixels.shape[0], pixels.shape[1]
+    return width, height, to_blender_pixel_layout(pixels)
+
+def image_from_pixels(img_path, width, height, pixels):
+    img = bpy.data.images.new(name=os.path.basename(img_path), width=width, height=height, alpha=True)
+    img.pixels.foreach_set(pixels)
+    img.update()
+    return img
+
+class FramePrefetcher:
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.executor = None
+        self.pending = {} # image path -> future of (width, height, float32 pixels)
+        self.frame_bytes = None # size of a decoded frame, known after the first one finished
+        self.last_frame = None
+        self.direction = 1
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="LFRPrefetch")
+        return self.executor
+
+    def predict_frames(self, lfr_prp, current_frame_number, lookahead):
+        if self.last_frame is not None and current_frame_number != self.last_frame:
+            self.direction = 1 if current_frame_number > self.last_frame else -1
+        self.last_frame = current_frame_number
+
+        # the range window starts at the frame itself, so every predicted frame brings its window along
+        window = len(lfr_prp.range_objects) if lfr_prp.view_range_of_images else 1
+        camera_count = len(get_pose_table(lfr_prp))
+
+        frames = []
+        seen = set()
+        for step in range(1, lookahead + 1):
+            frame = current_frame_number + self.direction * step
+            for offset in range(window):
+                index = frame + offset
+                if 0 <= index < camera_count and index not in seen:
+                    seen.add(index)
+                    frames.append(index)
+
+        return frames
+
+    def schedule(self, lfr_prp, current_frame_number, use_proxies=False):
+        lookahead = lfr_prp.prefetch_frames
+        if lookahead <= 0 or not has_decoder():
+            return
+
+        poses = get_pose_table(lfr_prp)
+        wanted_paths = {}
+        for index in self.predict_frames(lfr_prp, current_frame_number, lookahead):
+            wanted_paths[get_view_image_path(lfr_prp, poses.image_file(index), use_proxies)] = None # keeps the order
+
+        # drop buffers of frames that are not upcoming anymore (e.g. playback direction changed)
+        for img_path in list(self.pending.keys()):
+            if img_path not in wanted_paths:
+                self.pending.pop(img_path).cancel()
+
+        executor = self.get_executor()
+        for img_path in wanted_paths:
+            if img_path in self.pending or img_path in image_cache.entries:
+                continue
+            if not self.fits_budget():
+                break
+            self.pending[img_path] = executor.submit(decode_image, img_path)
+
+    def fits_budget(self):
+        # one more pending frame has to fit into what is left of the image cache budget
+        if self.frame_bytes is None:
+            for future in self.pending.values():
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    self.frame_bytes = future.result()[2].nbytes
+                    break
+        if self.frame_bytes is None:
+            return len(self.pending) == 0 # the first decode tells the frame size
+
+        free_bytes = image_cache.budget_bytes - image_cache.used_bytes
+        return (len(self.pending) + 1) * self.frame_bytes <= free_bytes
+
+    def take(self, img_path):
+        # never blocks the main thread, unfinished frames are loaded the usual way
+        future = self.pending.get(img_path)
+        if future is None or not future.done():
+            return None
+
+        del self.pending[img_path]
+        if future.cancelled() or future.exception() is not None:
+            return None
+
+        width, height, pixels = future.result()
+        self.frame_bytes = pixels.nbytes
+        return width, height, pixels
+
+    def clear(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.last_frame = None
+        self.direction = 1
+
+    def shutdown(self):
+        self.clear()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+frame_prefetcher = FramePrefetcher()
+
+def get_frame_image(img_path):
+    img = image_cache.lookup(img_path)
+    if img is not None:
+        return img
+
+    decoded = frame_prefetcher.take(img_path)
+    if decoded is not None:
+        width, height, pixels = decoded
+        return image_cache.insert(img_path, image_from_pixels(img_path, width, height, pixels))
+
+    return image_cache.insert(img_path, bpy.data.images.load(img_path, check_existing=False))
@@ -5,6 +5,10 @@ from mathutils import *
 from . cameras import create_main_camera, set_current_camera_rendering_resolution
 from . util import *
 from . lightfields import *
+from . image_cache import on_image_cache_budget_change
+from . frame_updates import apply_frame_update, frame_update_scheduler
+from . poses import get_pose_table
+from . trace import traced, on_trace_enabled_change
 
 D = bpy.data
 C = bpy.context
@@ -17,6 +21,7 @@ class RangeMeshPropertyGroup(bpy.types.PropertyGroup):
     proj_cam: bpy.props.PointerProperty(type=bpy.types.Object)
     view_dir_obj: bpy.props.PointerProperty(type=bpy.types.Object)
     view_origin_obj: bpy.props.PointerProperty(type=bpy.types.Object)
+    material: bpy.props.PointerProperty(type=bpy.types.Material)
     original_location: bpy.props.FloatVectorProperty(
         name="Original Location",
         default=(0.0, 0.0, 0.0),
@@ -24,38 +29,13 @@ class RangeMeshPropertyGroup(bpy.types.PropertyGroup):
         size=3,  # Size of the vector (3 for XYZ)
     )
 
-class CameraDataPropertyGroup(bpy.types.PropertyGroup):
-    fovy: bpy.props.FloatProperty(name="Field of View")
-    aspect: bpy.props.FloatProperty(name="Aspect Ratio")
-    near: bpy.props.FloatProperty(name="Near")
-    far: bpy.props.FloatProperty(name="Far")
-
-    location: bpy.props.FloatVectorProperty(
-        name="Position",
-        default=(0.0, 0.0, 0.0),
-        size=3,
-    )
-    quaternion: bpy.props.FloatVectorProperty(
-        name="Quaternion",
-        default=(0.0, 0.0, 0.0, 1.0),
-        size=4,
-    )
-    image_file: bpy.props.StringProperty(
-        name="Image File",
-        default="",
-    )
-    timestamp: bpy.props.StringProperty(
-        name="Timestamp",
-        default="",
-    )
-
 def on_view_range_of_images_value_change(self, context):
     lfr_prp = context.scene.lfr_properties
     view_range_of_images = lfr_prp.view_range_of_images
     current_frame_number = context.scene.frame_current
 
     if view_range_of_images: 
-        apply_images_and_positions_to_planes_from_range(lfr_prp, current_frame_number)
+        apply_images_and_positions_to_planes_from_range(lfr_prp, current_frame_number, use_proxies=True)
     else:
         delete_temp_objects_of_range_rendering(lfr_prp)
         delete_rendered_images_data(lfr_prp)
@@ -80,45 +60,41 @@ def on_focus_value_change(self, context):
     lfr_prp = context.scene.lfr_properties
     offset_proj_cameras_with_focus(lfr_prp, current_frame_number)
 
-def offset_proj_cameras_with_focus(lfr_prp, current_frame_number):
+def offset_proj_cameras_with_focus(lfr_prp, current_frame_number, focus=None):
     projection_objects = lfr_prp.range_objects
+    if focus is None:
+        focus = lfr_prp.focus
 
     #main camera
-    orig_main_cam_location = lfr_prp.cameras[current_frame_number].location
-    new_location = (orig_main_cam_location[0], orig_main_cam_location[1] + lfr_prp.focus, orig_main_cam_location[2])
+    orig_main_cam_location = get_pose_table(lfr_prp).locations[current_frame_number]
+    new_location = (orig_main_cam_location[0], orig_main_cam_location[1] + focus, orig_main_cam_location[2])
     lfr_prp.cam_obj.location = new_location
 
     for entry in projection_objects:
-        new_location = (entry.original_location.x, entry.original_location.y + lfr_prp.focus, entry.original_location.z)
+        new_location = (entry.original_location.x, entry.original_location.y + focus, entry.original_location.z)
         entry.proj_cam.location = new_location
 
+@traced("pre_frame_change_handler")
 def pre_frame_change_handler(scene): 
     current_frame_number = scene.frame_current
-    lfr_prp = scene.lfr_properties
-
-    if current_frame_number >= 1 and current_frame_number < len(lfr_prp.cameras):
-        
-        if (lfr_prp.cam_obj):
-            bpy.ops.object.transform_apply(location=True)
-
-        if lfr_prp.projection_mesh_obj:
-            #img_tex = applyImagesAndPositionsToPlanesFromRange(lfr_prp, current_frame_number)
-            img_tex = get_image_depending_on_frame(lfr_prp, current_frame_number)
-            update_projection_material_tex(lfr_prp.projection_mesh_obj.data.materials[0], img_tex)
 
-            if lfr_prp.view_range_of_images:
-                move_range_of_projections_and_apply_new_images(lfr_prp, current_frame_number)
-
-        else:
-            lfr_prp.projection_mesh_obj = create_giant_projection_plane(lfr_prp.dem_mesh_obj)
+    if frame_update_scheduler.is_synchronous():
+        apply_frame_update(scene, current_frame_number)
+    else:
+        frame_update_scheduler.request(scene, current_frame_number) # latest request wins, see frame_updates.py
 
 class LFRProperties(bpy.types.PropertyGroup):
-    cameras: bpy.props.CollectionProperty(type=CameraDataPropertyGroup)
+    # poses are kept in a columnar table (see poses.get_pose_table), this is its serialized form
+    pose_blob: bpy.props.StringProperty(
+        default="",
+        options={'HIDDEN'}
+    )
     dem_mesh_obj: bpy.props.PointerProperty(type=bpy.types.Object)
     cam_obj: bpy.props.PointerProperty(type=bpy.types.Object)
     pinhole_frame_obj: bpy.props.PointerProperty(type=bpy.types.Object) 
     projection_mesh_obj: bpy.props.PointerProperty(type=bpy.types.Object) 
     range_objects: bpy.props.CollectionProperty(type=RangeMeshPropertyGroup)
+    pooled_range_objects: bpy.props.CollectionProperty(type=RangeMeshPropertyGroup) # hidden, ready to be reused
     range_render_cam: bpy.props.PointerProperty(type=bpy.types.Object)
     rendered_images: bpy.props.CollectionProperty(type=ImagePropertyGroup)
     
@@ -151,6 +127,41 @@ class LFRProperties(bpy.types.PropertyGroup):
         update=on_focus_value_change #triggered when changing focus
     )  
 
+    #focus range of the focal stack (see render_focal_stack)
+    focal_stack_start: bpy.props.FloatProperty(
+        name="Focal Stack Start",
+        default=-10.0
+    )
+
+    focal_stack_end: bpy.props.FloatProperty(
+        name="Focal Stack End",
+        default=10.0
+    )
+
+    focal_stack_steps: bpy.props.IntProperty(
+        name="Focal Stack Steps",
+        description="Amount of integral images between start and end focus (both included)",
+        default=11,
+        min=1,
+        max=500
+    )
+
+    #auto focus searches between focal_stack_start and focal_stack_end (see autofocus.py)
+    autofocus_use_roi: bpy.props.BoolProperty(
+        name="Auto Focus Region",
+        description="Only score the sharpness inside of the region instead of the whole integral image",
+        default=False
+    )
+
+    autofocus_roi: bpy.props.FloatVectorProperty(
+        name="Auto Focus Region",
+        description="Min X, min Y, max X, max Y relative to the rendering resolution (origin bottom-left)",
+        size=4,
+        min=0.0,
+        max=1.0,
+        default=(0.25, 0.25, 0.75, 0.75)
+    )
+
     folder_path: bpy.props.StringProperty(
         name="Fold path",
         subtype="DIR_PATH"
@@ -193,6 +204,118 @@ class LFRProperties(bpy.types.PropertyGroup):
         default=False
     ) 
 
+    image_cache_budget_mb: bpy.props.IntProperty(
+        name="Image Cache Budget (MB)",
+        description="Memory that loaded recording images may use before the least recently used ones get removed",
+        default=2048,
+        min=64,
+        update=on_image_cache_budget_change
+    )
+
+    prefetch_frames: bpy.props.IntProperty(
+        name="Prefetch Frames",
+        description="Amount of upcoming frames that get decoded in the background (0 disables prefetching)",
+        default=8,
+        min=0,
+        max=64
+    )
+
+    render_workers: bpy.props.IntProperty(
+        name="Render Workers",
+        description="Background Blender processes that render the image sequence in parallel (1 renders in this Blender instance)",
+        default=1,
+        min=1,
+        max=64
+    )
+
+    tiled_integration: bpy.props.BoolProperty(
+        name="Tiled Integration",
+        description="Render the range of images tile by tile and write the tiles straight to disk (for very large resolutions)",
+        default=False
+    )
+
+    tile_size: bpy.props.IntProperty(
+        name="Tile Size",
+        description="Edge length of the tiles in pixels (multiple of 16)",
+        default=2048,
+        min=256,
+        step=16
+    )
+
+    proxy_resolution: bpy.props.EnumProperty(
+        name="Viewport Image Resolution",
+        description="Downscaled proxy images used while viewing the recording, renders always use the full resolution",
+        items=[
+            ('AUTO', "Auto", "Smallest proxy that still matches the size of the 3D viewport"),
+            ('1', "Full", "Always use the full resolution images"),
+            ('2', "1/2", "Half resolution proxies"),
+            ('4', "1/4", "Quarter resolution proxies"),
+            ('8', "1/8", "Eighth resolution proxies"),
+        ],
+        default='AUTO'
+    )
+
+    proxy_cache_path: bpy.props.StringProperty(
+        name="Proxy Cache Folder",
+        description="Folder for the proxy images (default: Data/proxies/<recording> next to the DEM folder)",
+        subtype="DIR_PATH"
+    )
+
+    trace_enabled: bpy.props.BoolProperty(
+        name="Record Trace",
+        description="Record timed spans of loading, frame changes and rendering (see the Tracing panel)",
+        default=False,
+        update=on_trace_enabled_change
+    )
+
+    integration_engine: bpy.props.EnumProperty(
+        name="Integration Engine",
+        description="How the range of images gets merged into the integral image",
+        items=[
+            ('RENDER', "Blender Render", "Render every projection of the range and average the results"),
+            ('NUMPY', "NumPy (CPU)", "Cast rays onto the DEM and average the projected source images on the CPU"),
+            ('MULTIVIEW', "Single-Pass Material", "One generated material samples all images of the range, rendered once"),
+        ],
+        default='RENDER'
+    )
+
+    #see time_index.py
+    time_target: bpy.props.StringProperty(
+        name="Time",
+        description="Date and time (UTC if no zone is given) or seconds since the start of the recording",
+        default="0"
+    )
+
+    time_window_seconds: bpy.props.FloatProperty(
+        name="Time Window",
+        description="Length of the window centered on the time in seconds",
+        default=30.0,
+        min=0.0
+    )
+
+    sliding_window_integral: bpy.props.BoolProperty(
+        name="Sliding Window Integral",
+        description="Render the integral image of every frame's range from the fixed manual rendering camera, every view is only rendered once",
+        default=False
+    )
+
+    view_selection: bpy.props.EnumProperty(
+        name="View Selection",
+        description="Which views of the recording make up the range of images",
+        items=[
+            ('CONSECUTIVE', "Consecutive Frames", "The frames following the current keyframe"),
+            ('NEAREST', "Nearest Views", "The views closest to the render camera (or the current keyframe), found with a kd-tree"),
+        ],
+        default='CONSECUTIVE'
+    )
+
+    view_direction_weight: bpy.props.FloatProperty(
+        name="View Direction Weight",
+        description="Nearest views: extra distance in meters per unit of view direction difference (1 - cos angle)",
+        default=0.0,
+        min=0.0
+    )
+
     rend_res_x: bpy.props.IntProperty(
         name="Pixel Width",
         description="Enter the pixel width",
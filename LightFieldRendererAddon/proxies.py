@@ -0,0 +1,181 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import bpy
+from . poses import get_pose_table
+from . trace import traced
+
+# Downscaled copies (1/2, 1/4, 1/8) of the recording images for the interactive viewport.
+# They are built on first use for the whole recording on worker threads, until a proxy exists
+# the full resolution image is used. Final output (combine_images, the sequence renderer and
+# the other integration engines) always reads the full resolution images.
+
+try:
+    import OpenImageIO as oiio
+except ImportError:
+    oiio = None
+
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    PILImage = None
+
+PROXY_SCALES = (2, 4, 8)
+
+def get_proxy_cache_path(lfr_prp):
+    if lfr_prp.proxy_cache_path.strip():
+        return os.path.join(bpy.path.abspath(lfr_prp.proxy_cache_path), "")
+
+    # next to the DEM: <root>/Data/proxies/<recording folder name>/
+    recording_path = os.path.normpath(lfr_prp.cameras_path)
+    return os.path.join(os.path.dirname(recording_path), "Data", "proxies", os.path.basename(recording_path), "")
+
+def get_proxy_path(cache_path, image_file, scale):
+    return os.path.join(cache_path, str(scale), image_file)
+
+def read_image_size(img_path):
+    # only reads the header
+    if PILImage is not None:
+        with PILImage.open(img_path) as pil_image:
+            return pil_image.size
+    if oiio is not None:
+        image_input = oiio.ImageInput.open(img_path)
+        if image_input is None:
+            return None
+        spec = image_input.spec()
+        image_input.close()
+        return spec.width, spec.height
+    return None
+
+def get_viewport_size():
+    # largest 3D viewport (in pixels) of all open windows
+    size = 0
+    window_manager = bpy.context.window_manager
+    if window_manager is None:
+        return 0
+
+    for window in window_manager.windows:
+        for area in window.screen.areas:
+            if area.type != 'VIEW_3D':
+                continue
+            for region in area.regions:
+                if region.type == 'WINDOW':
+                    size = max(size, region.width, region.height)
+    return size
+
+@traced("build_proxy_levels")
+def build_proxy_levels(img_path, cache_path, image_file):
+    # decodes the source once and halves it repeatedly, files are renamed into place when complete
+    targets = [get_proxy_path(cache_path, image_file, scale) for scale in PROXY_SCALES]
+    if all(os.path.isfile(target) for target in targets):
+        return
+
+    for target in targets:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+
+    if PILImage is not None:
+        with PILImage.open(img_path) as pil_image:
+            level = pil_image.convert("RGBA" if "A" in pil_image.getbands() else "RGB")
+            for target in targets:
+                level = level.reduce(2) # box filter
+                temp_path = target + ".tmp"
+                level.save(temp_path, format=pil_image.format or "PNG")
+                os.replace(temp_path, target)
+        return
+
+    source = oiio.ImageBuf(img_path)
+    level = source
+    for target in targets:
+        spec = level.spec()
+        roi = oiio.ROI(0, max(1, spec.width // 2), 0, max(1, spec.height // 2), 0, 1, 0, spec.nchannels)
+        level = oiio.ImageBufAlgo.resize(level, roi=roi)
+        temp_path = target + ".tmp" + os.path.splitext(target)[1] # oiio picks the format by extension
+        if not level.write(temp_path):
+            raise IOError(f"Could not write proxy {target}: {level.geterror()}")
+        os.replace(temp_path, target)
+
+class ProxyBuilder:
+    def __init__(self):
+        self.executor = None
+        self.futures = {} # proxy cache path -> futures of all images of the recording
+        self.source_sizes = {} # cameras path -> (width, height) of the recording images
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="LFRProxy")
+        return self.executor
+
+    def ensure_built(self, lfr_prp, cache_path):
+        # starts building the proxies of the whole recording once
+        if cache_path in self.futures or (PILImage is None and oiio is None):
+            return
+
+        poses = get_pose_table(lfr_prp)
+        executor = self.get_executor()
+        image_files = dict.fromkeys(str(name) for name in poses.image_names if str(name))
+        self.futures[cache_path] = [executor.submit(build_proxy_levels, lfr_prp.cameras_path + image_file, cache_path, image_file)
+                                    for image_file in image_files]
+
+    def progress(self, cache_path):
+        futures = self.futures.get(cache_path, [])
+        return sum(1 for future in futures if future.done()), len(futures)
+
+    def get_source_size(self, lfr_prp):
+        cameras_path = lfr_prp.cameras_path
+        if cameras_path not in self.source_sizes:
+            poses = get_pose_table(lfr_prp)
+            size = None
+            if len(poses) > 0:
+                try:
+                    size = read_image_size(cameras_path + poses.image_file(0))
+                except OSError:
+                    size = None
+            self.source_sizes[cameras_path] = size
+        return self.source_sizes[cameras_path]
+
+    def cancel(self):
+        for futures in self.futures.values():
+            for future in futures:
+                future.cancel()
+        self.futures.clear()
+        self.source_sizes.clear()
+
+    def shutdown(self):
+        self.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+proxy_builder = ProxyBuilder()
+
+def get_proxy_scale(lfr_prp):
+    if lfr_prp.proxy_resolution != 'AUTO':
+        return int(lfr_prp.proxy_resolution)
+
+    # smallest proxy that still has at least as many pixels as the viewport
+    source_size = proxy_builder.get_source_size(lfr_prp)
+    viewport_size = get_viewport_size()
+    if source_size is None or viewport_size <= 0:
+        return 1
+
+    source_max = max(source_size)
+    for scale in reversed(PROXY_SCALES):
+        if source_max / scale >= viewport_size:
+            return scale
+    return 1
+
+def get_view_image_path(lfr_prp, image_file, use_proxies):
+    full_path = lfr_prp.cameras_path + image_file
+    if not use_proxies:
+        return full_path
+
+    scale = get_proxy_scale(lfr_prp)
+    if scale == 1:
+        return full_path
+
+    cache_path = get_proxy_cache_path(lfr_prp)
+    proxy_path = get_proxy_path(cache_path, image_file, scale)
+    if os.path.isfile(proxy_path):
+        return proxy_path
+
+    proxy_builder.ensure_built(lfr_prp, cache_path)
+    return full_path
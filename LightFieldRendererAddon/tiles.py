@@ -0,0 +1,93 @@
+import os
+import numpy as np
+
+# Tile helpers for integral images that don't fit into memory (see combine_images_tiled).
+# Tiles are given in blender pixel coordinates (origin bottom-left), finished tiles are written
+# straight into a tiled TIFF with OpenImageIO, or into a memory mapped .npy file without it.
+
+try:
+    import OpenImageIO as oiio
+except ImportError:
+    oiio = None
+
+def get_tiles(width, height, tile_size):
+    # (x0, y0, x1, y1) per tile, end exclusive. The grid starts at the top-left corner like the
+    # tiles of image files, so every tile maps to exactly one file tile
+    tiles = []
+    for top in range(0, height, tile_size):
+        y1 = height - top
+        y0 = max(0, y1 - tile_size)
+        for x0 in range(0, width, tile_size):
+            tiles.append((x0, y0, min(x0 + tile_size, width), y1))
+    return tiles
+
+def border_fraction(pixel, size):
+    # the border is stored as float and blender converts it back with (int)(border * size)
+    # in float precision, returns the smallest float that maps back to exactly this pixel
+    size32 = np.float32(size)
+    value = np.float32(pixel / size)
+    while int(value * size32) < pixel:
+        value = np.nextafter(value, np.float32(2.0))
+    while value > 0.0 and int(np.nextafter(value, np.float32(0.0)) * size32) >= pixel:
+        value = np.nextafter(value, np.float32(0.0))
+    return float(value)
+
+def set_render_border(render_settings, width, height, x0, y0, x1, y1):
+    render_settings.border_min_x = border_fraction(x0, width)
+    render_settings.border_max_x = border_fraction(x1, width)
+    render_settings.border_min_y = border_fraction(y0, height)
+    render_settings.border_max_y = border_fraction(y1, height)
+
+def check_tile_size(width, height, tile_width, tile_height):
+    if width != tile_width or height != tile_height:
+        raise ValueError(f"Rendered tile is {width}x{height} instead of {tile_width}x{tile_height}.")
+
+def to_rgba8_rows(pixels, width, height):
+    # flat bottom-up float RGBA (0..1) -> top-down 8 bit rows
+    rows = pixels.reshape((height, width, 4))[::-1]
+    return (np.clip(rows, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+class TiledImageWriter:
+    def __init__(self, filepath, width, height, tile_size):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.output = None
+        self.memmap = None
+
+        if oiio is not None:
+            self.filepath = os.path.splitext(filepath)[0] + ".tif"
+            spec = oiio.ImageSpec(width, height, 4, oiio.UINT8)
+            spec.tile_width = tile_size # TIFF tiles have to be multiples of 16
+            spec.tile_height = tile_size
+            spec.attribute("compression", "zip")
+            self.output = oiio.ImageOutput.create(self.filepath)
+            if self.output is None or not self.output.open(self.filepath, spec):
+                raise IOError(f"Could not open {self.filepath} for writing: {oiio.geterror()}")
+        else:
+            self.filepath = os.path.splitext(filepath)[0] + ".npy"
+            self.memmap = np.lib.format.open_memmap(self.filepath, mode='w+', dtype=np.uint8, shape=(height, width, 4))
+
+    def write_tile(self, x0, y0, x1, y1, pixels):
+        tile_width = x1 - x0
+        tile_height = y1 - y0
+        rows = to_rgba8_rows(pixels, tile_width, tile_height)
+        top = self.height - y1 # file rows are top-down
+
+        if self.memmap is not None:
+            self.memmap[top:top + tile_height, x0:x1] = rows
+            return
+
+        # edge tiles are written with their full size, OpenImageIO clips them to the image
+        buffer = np.zeros((self.tile_size, self.tile_size, 4), dtype=np.uint8)
+        buffer[:tile_height, :tile_width] = rows
+        if not self.output.write_tile(x0, top, 0, buffer):
+            raise IOError(f"Could not write tile ({x0}, {top}) to {self.filepath}: {self.output.geterror()}")
+
+    def close(self):
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+        if self.memmap is not None:
+            self.memmap.flush()
+            self.memmap = None
@@ -0,0 +1,85 @@
+import numpy as np
+from . poses import get_pose_table, get_scene_key, parse_timestamp_ns, timestamp_ns_to_iso
+from . trace import traced
+
+# Sorted view of the pose table timestamps (epoch nanoseconds), lookups are binary searches.
+# Frames without a timestamp in the json (0) are not part of the index.
+# Pose index == blender frame number (see pre_frame_change_handler).
+
+class TimestampIndex:
+    @traced("TimestampIndex.build")
+    def __init__(self, poses):
+        self.poses = poses
+        timestamps = np.asarray(poses.timestamps, dtype=np.int64)
+        frames = np.nonzero(timestamps != 0)[0]
+        order = np.argsort(timestamps[frames], kind='stable')
+        self.frames = frames[order]
+        self.sorted_timestamps = timestamps[self.frames]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def start_time(self):
+        return int(self.sorted_timestamps[0]) if len(self) else None
+
+    def end_time(self):
+        return int(self.sorted_timestamps[-1]) if len(self) else None
+
+    def find_nearest_frame(self, timestamp_ns):
+        if len(self) == 0:
+            return None
+
+        position = int(np.searchsorted(self.sorted_timestamps, timestamp_ns))
+        if position == len(self):
+            return int(self.frames[-1])
+        if position > 0 and timestamp_ns - self.sorted_timestamps[position - 1] <= self.sorted_timestamps[position] - timestamp_ns:
+            position -= 1
+        return int(self.frames[position])
+
+    def frames_in_window(self, start_ns, end_ns):
+        # frames with start_ns <= timestamp <= end_ns, in frame order
+        first = np.searchsorted(self.sorted_timestamps, start_ns, side='left')
+        last = np.searchsorted(self.sorted_timestamps, end_ns, side='right')
+        return np.sort(self.frames[first:last]).tolist()
+
+timestamp_indices = {} # scene key -> TimestampIndex
+
+def get_timestamp_index(lfr_prp):
+    poses = get_pose_table(lfr_prp)
+    key = get_scene_key(lfr_prp)
+    index = timestamp_indices.get(key)
+
+    if index is None or index.poses is not poses:
+        index = TimestampIndex(poses)
+        timestamp_indices[key] = index
+
+    return index
+
+def parse_time_input(text, index):
+    # a date/time (iso or anything dateutil understands, UTC if no zone is given)
+    # or a plain number of seconds since the start of the recording
+    text = text.strip()
+    if not text:
+        raise ValueError("No time given.")
+
+    try:
+        seconds = float(text)
+    except ValueError:
+        return parse_timestamp_ns(text)
+
+    if len(index) == 0:
+        raise ValueError("The recording has no timestamps.")
+    return index.start_time() + int(round(seconds * 1e9))
+
+def get_time_window_frames(lfr_prp, text, window_seconds):
+    # frames of the window of window_seconds centered on the given time
+    index = get_timestamp_index(lfr_prp)
+    center_ns = parse_time_input(text, index)
+    half_window_ns = int(round(window_seconds * 0.5 * 1e9))
+    return index.frames_in_window(center_ns - half_window_ns, center_ns + half_window_ns)
+
+def get_frame_time_label(lfr_prp, frame):
+    poses = get_pose_table(lfr_prp)
+    if frame < 0 or frame >= len(poses) or poses.timestamps[frame] == 0:
+        return ""
+    return timestamp_ns_to_iso(poses.timestamps[frame])
@@ -0,0 +1,119 @@
+import functools
+import json
+import os
+import threading
+import time
+import numpy as np
+
+# Timed spans of the add-on's hot paths. Finished spans go into a fixed size ring buffer,
+# the oldest ones get overwritten. While tracing is disabled a span is a shared no-op object
+# and traced functions are called directly.
+# The spans can be exported as Chrome trace events (chrome://tracing, ui.perfetto.dev).
+
+TRACE_CAPACITY = 65536
+
+class Tracer:
+    def __init__(self, capacity=TRACE_CAPACITY):
+        self.enabled = False
+        self.capacity = capacity
+        self.events = [None] * capacity # (name, start ns, duration ns, thread id)
+        self.event_count = 0 # total amount of recorded spans, including overwritten ones
+        self.lock = threading.Lock() # the prefetch workers record spans as well
+
+    def record(self, name, start_ns, end_ns):
+        with self.lock:
+            self.events[self.event_count % self.capacity] = (name, start_ns, end_ns - start_ns, threading.get_ident())
+            self.event_count += 1
+
+    def recorded_events(self):
+        # oldest first
+        with self.lock:
+            if self.event_count <= self.capacity:
+                return self.events[:self.event_count]
+            start = self.event_count % self.capacity
+            return self.events[start:] + self.events[:start]
+
+    def clear(self):
+        with self.lock:
+            self.events = [None] * self.capacity
+            self.event_count = 0
+
+    def summary(self):
+        # name -> (count, p50 ms, p95 ms, total ms), sorted by total time
+        durations = {}
+        for name, start_ns, duration_ns, thread_id in self.recorded_events():
+            durations.setdefault(name, []).append(duration_ns)
+
+        rows = {}
+        for name, values in durations.items():
+            values = np.array(values, dtype=np.float64) / 1e6
+            p50, p95 = np.percentile(values, (50, 95))
+            rows[name] = (len(values), float(p50), float(p95), float(values.sum()))
+
+        return dict(sorted(rows.items(), key=lambda item: item[1][3], reverse=True))
+
+    def export_chrome_trace(self, filepath):
+        pid = os.getpid()
+        trace_events = []
+        for name, start_ns, duration_ns, thread_id in self.recorded_events():
+            trace_events.append({
+                "name": name,
+                "cat": "lfr",
+                "ph": "X", # complete event
+                "ts": start_ns / 1000.0, # microseconds
+                "dur": duration_ns / 1000.0,
+                "pid": pid,
+                "tid": thread_id,
+            })
+
+        with open(filepath, 'w') as file:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, file)
+        return len(trace_events)
+
+tracer = Tracer()
+
+class Span:
+    __slots__ = ("name", "start_ns")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        tracer.record(self.name, self.start_ns, time.perf_counter_ns())
+        return False
+
+class NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+NO_SPAN = NoSpan()
+
+def span(name):
+    return Span(name) if tracer.enabled else NO_SPAN
+
+def traced(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+
+            start_ns = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                tracer.record(name, start_ns, time.perf_counter_ns())
+        return wrapper
+    return decorator
+
+def on_trace_enabled_change(self, context):
+    tracer.enabled = self.trace_enabled
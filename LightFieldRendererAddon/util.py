@@ -3,6 +3,9 @@ import json
 import bpy
 from mathutils import *
 import os
+from . image_cache import image_cache
+from . prefetch import frame_prefetcher
+from . poses import clear_pose_table
 
 D = bpy.data
 C = bpy.context
@@ -52,20 +55,44 @@ def getValueFromJSON(json_path, key, sub_key):
 
 def purge_all_addon_property_data(context):
     lfr_props = context.scene.lfr_properties
-    # Iterate over the collection and remove all items
-    for item in lfr_props.cameras:
-        lfr_props.cameras.remove(0)
+    clear_pose_table(lfr_props) # releases all poses at once
 
     delete_temp_objects_of_range_rendering(lfr_props)
+    clear_range_object_pool(lfr_props)
     delete_rendered_images_data(lfr_props)
+    frame_prefetcher.clear()
+    image_cache.clear()
+    image_cache.reset_stats()
 
 def delete_rendered_images_data(lfr_prp):
     for item in lfr_prp.rendered_images:
         lfr_prp.rendered_images.remove(0)
 
+RANGE_OBJECT_POINTERS = ("mesh", "proj_cam", "view_dir_obj", "view_origin_obj", "material")
+
+def copy_range_object_entry(source, target):
+    for attribute in RANGE_OBJECT_POINTERS:
+        setattr(target, attribute, getattr(source, attribute))
+    target.original_location = source.original_location
+
+def set_range_object_hidden(entry, hidden):
+    for obj in (entry.mesh, entry.proj_cam, entry.view_dir_obj, entry.view_origin_obj):
+        if obj:
+            obj.hide_viewport = hidden
+            obj.hide_render = hidden
+
 def delete_temp_objects_of_range_rendering(lfr_prp):
-    # Iterate through each RangeMeshPropertyGroup in the collection
+    # projection groups are not deleted but hidden and kept in the pool,
+    # the next range only has to rebind them to new poses and images (see acquire_pooled_range_object)
     for entry in lfr_prp.range_objects:
+        set_range_object_hidden(entry, True)
+        copy_range_object_entry(entry, lfr_prp.pooled_range_objects.add())
+
+    lfr_prp.range_objects.clear()
+
+def clear_range_object_pool(lfr_prp):
+    # Iterate through each RangeMeshPropertyGroup in the pool
+    for entry in lfr_prp.pooled_range_objects:
 
         if entry.mesh: # Delete the mesh object
             bpy.data.objects.remove(entry.mesh, do_unlink=True)
@@ -79,8 +106,10 @@ def delete_temp_objects_of_range_rendering(lfr_prp):
         if entry.view_origin_obj: # Delete the view origin object
             bpy.data.objects.remove(entry.view_origin_obj, do_unlink=True)
 
-    for item in lfr_prp.range_objects:
-        lfr_prp.range_objects.remove(0)
+        if entry.material and entry.material.users == 0:
+            bpy.data.materials.remove(entry.material, do_unlink=True)
+
+    lfr_prp.pooled_range_objects.clear()
 
     for collection in bpy.data.collections:
         # Check if the collection is empty
@@ -150,6 +179,9 @@ def save_image_to_disk(absolute_folder_path, file_name, image, view_with_image_v
 
 def find_first_file(folder_path, file_extension):
     folder_path_fix = folder_path.replace('\\', '/')
+    if not os.path.isdir(folder_path_fix):
+        return None
+
     for filename in os.listdir(folder_path_fix):
         if filename.endswith(file_extension):
             return os.path.join(folder_path_fix, filename)
@@ -187,33 +219,32 @@ def correctly_set_or_overwrite_path_strings(lfr_prp):
         raise ValueError(f"No Folder Path set! Please specify a folder with images, mask and json file inside!")
     
     if lfr_prp.folder_path.startswith('//'):
-        lfr_prp.folder_path = lfr_prp.folder_path.lstrip('/').replace('/', '\\')
+        lfr_prp.folder_path = bpy.path.abspath(lfr_prp.folder_path) # relative to the .blend file
 
     lfr_prp.folder_path = os.path.abspath(lfr_prp.folder_path) # get the absolute path with drive letter in the beginning
-    lfr_prp.folder_path = lfr_prp.folder_path + "\\" # add a \ at the end
+    lfr_prp.folder_path = os.path.join(lfr_prp.folder_path, "") # add a separator at the end (image files get appended)
 
-    lfr_prp.json_path = lfr_prp.folder_path + "\matched_poses.json" # default json file
+    lfr_prp.json_path = os.path.join(lfr_prp.folder_path, "matched_poses.json") # default json file
     absolute_data_path_root = os.path.abspath(os.path.join(lfr_prp.folder_path, ".."))
 
-    absolute_data_path_dem_folder = absolute_data_path_root + "\Data\dem"
+    absolute_data_path_dem_folder = os.path.join(absolute_data_path_root, "Data", "dem")
     absolute_data_path_dem_file = find_first_file(absolute_data_path_dem_folder, ".glb")
     absolute_data_path_mask = find_file_by_partial_name(lfr_prp.folder_path, "mask")
 
     lfr_prp.cameras_path = lfr_prp.folder_path
-    lfr_prp.dem_path = absolute_data_path_dem_file
-    lfr_prp.img_mask = absolute_data_path_mask
+    lfr_prp.dem_path = absolute_data_path_dem_file or "" # can still be set manually (man_dem_path)
+    lfr_prp.img_mask = absolute_data_path_mask or ""
 
     render_path = ""
     if is_not_empty_or_whitespace(lfr_prp.man_render_path):
         if lfr_prp.man_render_path.startswith('//'):
-            lfr_prp.man_render_path = lfr_prp.man_render_path.lstrip('\\')
-            lfr_prp.man_render_path = os.path.abspath(lfr_prp.man_render_path)
+            lfr_prp.man_render_path = bpy.path.abspath(lfr_prp.man_render_path)
 
-        render_path = lfr_prp.man_render_path
+        render_path = os.path.join(lfr_prp.man_render_path, "") # file names get appended
     else:    
         #use local addon folder "Pics"
         # warning: depends on the location of the file the function is stored in!
-        render_path = set_render_path("Pics\\") #here the path render path in blender gets set
+        render_path = set_render_path(os.path.join("Pics", "")) #here the path render path in blender gets set
         print("render_path:", render_path)
 
     lfr_prp.render_path = render_path #lfr_prp.render_path is only used as a reference if later needed
@@ -224,16 +255,14 @@ def correctly_set_or_overwrite_path_strings(lfr_prp):
 
     if is_not_empty_or_whitespace(lfr_prp.man_dem_path):
         if lfr_prp.man_dem_path.startswith('//'):
-            lfr_prp.man_dem_path = lfr_prp.man_dem_path.lstrip('\\')
-            lfr_prp.man_dem_path = os.path.abspath(lfr_prp.man_dem_path)
+            lfr_prp.man_dem_path = bpy.path.abspath(lfr_prp.man_dem_path)
             
         lfr_prp.dem_path = lfr_prp.man_dem_path #overwrite the default dem path
 
 
     if is_not_empty_or_whitespace(lfr_prp.man_json_path):
         if lfr_prp.man_json_path.startswith('//'):
-            lfr_prp.man_json_path = lfr_prp.man_json_path.lstrip('\\')
-            lfr_prp.man_json_path = os.path.abspath(lfr_prp.man_json_path)
+            lfr_prp.man_json_path = bpy.path.abspath(lfr_prp.man_json_path)
     
         lfr_prp.json_path = lfr_prp.man_json_path #overwrite the default json path
 
@@ -0,0 +1,92 @@
+import numpy as np
+from mathutils import Vector, kdtree
+from . poses import get_pose_table, get_scene_key
+from . trace import traced
+
+# Spatial index over the camera positions of the pose table for view_selection 'NEAREST'.
+# The kd-tree returns the closest views to a target camera, optionally re-ranked by how much their
+# view direction differs from the target's (lawnmower patterns have close views from both strips).
+# The index is built once per pose table and rebuilt when the table changes.
+
+NEAREST_OVERSAMPLING = 4 # candidates per requested view that get re-ranked by view direction
+
+def get_view_directions(quaternions):
+    # vectorized Quaternion(q) @ Vector((0, 0, -1)), the quaternions are read like mathutils reads them
+    w, x, y, z = quaternions[:, 0], quaternions[:, 1], quaternions[:, 2], quaternions[:, 3]
+    norm = np.sqrt(w * w + x * x + y * y + z * z)
+    norm[norm == 0] = 1.0
+    w, x, y, z = w / norm, x / norm, y / norm, z / norm
+
+    return -np.stack((
+        2.0 * (x * z + w * y),
+        2.0 * (y * z - w * x),
+        1.0 - 2.0 * (x * x + y * y),
+    ), axis=1).astype(np.float64)
+
+class ViewIndex:
+    @traced("ViewIndex.build")
+    def __init__(self, poses):
+        self.poses = poses
+        self.directions = get_view_directions(np.asarray(poses.quaternions, dtype=np.float64))
+        self.tree = kdtree.KDTree(len(poses))
+        for index, location in enumerate(poses.locations):
+            self.tree.insert(location, index)
+        self.tree.balance()
+
+    def find_nearest(self, location, direction, count, direction_weight=0.0):
+        # frame indices of the closest views, closest first
+        count = min(count, len(self.poses))
+        if count <= 0:
+            return []
+
+        candidate_count = count if direction_weight <= 0.0 else min(len(self.poses), count * NEAREST_OVERSAMPLING)
+        candidates = self.tree.find_n(Vector(location), candidate_count)
+        if direction_weight <= 0.0:
+            return [index for co, index, distance in candidates]
+
+        # distance in meters plus direction_weight meters per unit of (1 - cos angle)
+        indices = np.array([index for co, index, distance in candidates], dtype=np.int64)
+        distances = np.array([distance for co, index, distance in candidates])
+        target_direction = np.asarray(direction, dtype=np.float64)
+        target_direction = target_direction / max(np.linalg.norm(target_direction), 1e-12)
+        costs = distances + direction_weight * (1.0 - self.directions[indices] @ target_direction)
+        return indices[np.argsort(costs, kind='stable')[:count]].tolist()
+
+view_indices = {} # scene key -> ViewIndex
+
+def get_view_index(lfr_prp):
+    poses = get_pose_table(lfr_prp)
+    key = get_scene_key(lfr_prp)
+    index = view_indices.get(key)
+
+    if index is None or index.poses is not poses:
+        index = ViewIndex(poses)
+        view_indices[key] = index
+
+    return index
+
+def get_target_view(lfr_prp, keyframe_index):
+    # the manually defined render camera if there is one, otherwise the view of the keyframe
+    if lfr_prp.man_rend_cam is not None:
+        matrix = lfr_prp.man_rend_cam.matrix_world
+        return tuple(matrix.translation), tuple(matrix.to_quaternion() @ Vector((0.0, 0.0, -1.0)))
+
+    view_index = get_view_index(lfr_prp)
+    return tuple(view_index.poses.locations[keyframe_index]), tuple(view_index.directions[keyframe_index])
+
+def get_nearest_frame_indices(lfr_prp, keyframe_index, count):
+    poses = get_pose_table(lfr_prp)
+    if len(poses) == 0:
+        return []
+
+    keyframe_index = min(max(keyframe_index, 0), len(poses) - 1)
+    location, direction = get_target_view(lfr_prp, keyframe_index)
+    nearest = get_view_index(lfr_prp).find_nearest(location, direction, count, lfr_prp.view_direction_weight)
+    if len(nearest) == 0:
+        return []
+
+    # in frame order like the consecutive ranges, the closest view goes to the middle where
+    # the range render camera and the integration camera are placed (half index)
+    frame_indices = sorted(nearest[1:])
+    frame_indices.insert(len(nearest) // 2, nearest[0])
+    return frame_indices
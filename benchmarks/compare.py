@@ -0,0 +1,62 @@
+import argparse
+import json
+import sys
+
+# Compares two benchmark result files of run_benchmarks.py, e.g. of two commits:
+#
+#   python benchmarks/compare.py baseline.json current.json
+#
+# Exits with 1 if a timing got slower than the threshold.
+
+def flatten_timings(results, prefix=""):
+    # {"a": {"b": {"median": x}}} -> {"a/b": x}, uses the median (or the single measurement)
+    timings = {}
+    for key, value in results.items():
+        name = f"{prefix}/{key}" if prefix else key
+        if not isinstance(value, dict):
+            continue
+        if "median" in value:
+            timings[name] = value["median"]
+        elif "seconds" in value:
+            timings[name] = value["seconds"]
+        else:
+            timings.update(flatten_timings(value, name))
+    return timings
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    arg_parser.add_argument("baseline")
+    arg_parser.add_argument("current")
+    arg_parser.add_argument("--threshold", type=float, default=1.1, help="ratio from which a timing counts as regression")
+    args = arg_parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+
+    baseline_timings = flatten_timings(baseline["results"])
+    current_timings = flatten_timings(current["results"])
+
+    print(f"{'benchmark':60} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    regressions = 0
+    for name in sorted(set(baseline_timings) & set(current_timings)):
+        before = baseline_timings[name]
+        after = current_timings[name]
+        ratio = after / before if before > 0 else float('inf')
+        marker = " <-- slower" if ratio > args.threshold else ""
+        regressions += 1 if marker else 0
+        print(f"{name:60} {before:10.4f} {after:10.4f} {ratio:7.2f}{marker}")
+
+    print(f"peak RSS: {baseline.get('peak_rss_mb')} MB -> {current.get('peak_rss_mb')} MB")
+    baseline_rss = baseline.get("peak_rss_mb_after_benchmark", {})
+    current_rss = current.get("peak_rss_mb_after_benchmark", {})
+    for name in current_rss:
+        print(f"  peak RSS after {name}: {baseline_rss.get(name)} MB -> {current_rss[name]} MB")
+
+    if regressions:
+        print(f"{regressions} benchmark(s) slower than {args.threshold}x")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import bpy
+import numpy as np
+
+# Benchmarks of the add-on's hot paths, run headless inside Blender:
+#
+#   blender -b -P benchmarks/run_benchmarks.py -- --folder /data/recording/ --output results.json
+#
+# The results (seconds, peak RSS in MB) are written as JSON, compare two runs with benchmarks/compare.py.
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "LightFieldRendererAddon"))
+import headless # sits next to the add-on and imports it by its folder name
+
+try:
+    import resource
+except ImportError:
+    resource = None # Windows
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+DEFAULT_RANGE_SIZES = (1, 10, 50, 200)
+
+def create_arg_parser():
+    arg_parser = argparse.ArgumentParser(prog="blender -b -P benchmarks/run_benchmarks.py --", description="Light field renderer benchmarks")
+    arg_parser.add_argument("--folder", required=True, help="recording folder (see tools/generate_recording.py for synthetic ones)")
+    arg_parser.add_argument("--output", default="benchmark_results.json")
+    arg_parser.add_argument("--every-nth", type=int, default=1)
+    arg_parser.add_argument("--repeat", type=int, default=3, help="repetitions of the cheap benchmarks")
+    arg_parser.add_argument("--frames", type=int, default=100, help="frames for the frame change latency")
+    arg_parser.add_argument("--range-sizes", type=int, nargs="+", default=list(DEFAULT_RANGE_SIZES))
+    arg_parser.add_argument("--res-x", type=int, default=512)
+    arg_parser.add_argument("--res-y", type=int, default=512)
+    arg_parser.add_argument("--engine", choices=("RENDER", "NUMPY", "MULTIVIEW"), default="RENDER")
+    return arg_parser
+
+def peak_rss_mb():
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024 # bytes on macOS, KB on Linux
+    if psutil is not None:
+        memory_info = psutil.Process().memory_info()
+        return getattr(memory_info, "peak_wset", memory_info.rss) / (1024 * 1024)
+    return None
+
+def summarize(durations):
+    durations = sorted(durations)
+    return {
+        "count": len(durations),
+        "min": durations[0],
+        "median": statistics.median(durations),
+        "mean": statistics.fmean(durations),
+        "p95": durations[min(len(durations) - 1, int(round(0.95 * (len(durations) - 1))))],
+        "max": durations[-1],
+    }
+
+def time_call(function, repeat=1, setup=None):
+    durations = []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+def get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def addon_module(addon, name):
+    return importlib.import_module(addon.__name__ + "." + name)
+
+def bench_load(addon, lfr_prp, repeat):
+    return time_call(lambda: bpy.ops.wm.load_data(), repeat)
+
+def bench_parse_poses(addon, lfr_prp, repeat):
+    cameras = addon_module(addon, "cameras")
+    poses = addon_module(addon, "poses")
+    cache_path = poses.get_pose_cache_path(lfr_prp.json_path)
+
+    def remove_pose_cache():
+        if os.path.isfile(cache_path):
+            os.remove(cache_path)
+
+    return {
+        "cold": time_call(lambda: cameras.parse_poses(lfr_prp.json_path, lfr_prp.every_nth_frame), repeat, remove_pose_cache),
+        "cached": time_call(lambda: cameras.parse_poses(lfr_prp.json_path, lfr_prp.every_nth_frame), repeat),
+    }
+
+def bench_curve_and_keyframes(addon, lfr_prp, repeat):
+    cameras = addon_module(addon, "cameras")
+    existing_objects = set(bpy.data.objects)
+
+    def remove_new_paths():
+        # every call adds a path object with its own curve and material, the repeats would time a growing scene
+        for obj in [obj for obj in bpy.data.objects if obj not in existing_objects and obj.type == 'CURVE']:
+            curve_data = obj.data
+            materials = [material for material in curve_data.materials if material is not None]
+            bpy.data.objects.remove(obj, do_unlink=True)
+            bpy.data.curves.remove(curve_data, do_unlink=True)
+            for material in materials:
+                if material.users == 0:
+                    bpy.data.materials.remove(material, do_unlink=True)
+
+    result = time_call(lambda: cameras.create_curve_data_and_key_frames(lfr_prp), repeat, remove_new_paths)
+    remove_new_paths()
+    return result
+
+def bench_frame_change(addon, lfr_prp, frame_count):
+    properties = addon_module(addon, "properties")
+    scene = bpy.context.scene
+    pose_count = len(properties.get_pose_table(lfr_prp))
+    frames = range(1, max(2, min(frame_count + 1, pose_count)))
+
+    def handler_latencies():
+        durations = []
+        for frame in frames:
+            scene.frame_current = frame # does not run the handlers by itself
+            start = time.perf_counter()
+            properties.pre_frame_change_handler(scene)
+            durations.append(time.perf_counter() - start)
+        return summarize(durations)
+
+    results = {}
+    lfr_prp.view_range_of_images = False
+    results["single_image"] = handler_latencies()
+    lfr_prp.range_to_interpolate = 10
+    lfr_prp.view_range_of_images = True
+    results["range_10"] = handler_latencies()
+    lfr_prp.view_range_of_images = False
+    return results
+
+def bench_combine_images(addon, lfr_prp, range_sizes):
+    pipeline = addon_module(addon, "pipeline")
+    properties = addon_module(addon, "properties")
+    pose_count = len(properties.get_pose_table(lfr_prp))
+
+    results = {}
+    for range_size in range_sizes:
+        if range_size > pose_count - 1:
+            print(f"skipping range {range_size}, the recording only has {pose_count} poses")
+            continue
+
+        lfr_prp.range_to_interpolate = range_size
+        bpy.context.scene.frame_set(1)
+        start = time.perf_counter()
+        result_image = pipeline.render_range_integral_image(bpy.context, 0)
+        results[str(range_size)] = {"seconds": time.perf_counter() - start, "engine": lfr_prp.integration_engine}
+        bpy.data.images.remove(result_image, do_unlink=True)
+    return results
+
+def bench_blend_images(addon, width, height, repeat):
+    lightfields = addon_module(addon, "lightfields")
+    rng = np.random.default_rng(0)
+
+    results = {}
+    for image_count in (10, 50):
+        images = []
+        for i in range(image_count):
+            img = bpy.data.images.new(name=f"BenchmarkImage_{i}", width=width, height=height, alpha=True)
+            img.pixels.foreach_set(rng.random(width * height * 4, dtype=np.float32))
+            images.append(img)
+
+        blended = []
+        results[str(image_count)] = time_call(lambda: blended.append(lightfields.blend_images(images, True)), repeat)
+
+        for img in images + blended:
+            bpy.data.images.remove(img, do_unlink=True)
+    return results
+
+def run(args):
+    addon = headless.import_addon()
+
+    lfr_prp = bpy.context.scene.lfr_properties
+    lfr_prp.folder_path = args.folder
+    lfr_prp.every_nth_frame = args.every_nth
+    lfr_prp.rend_res_x = args.res_x
+    lfr_prp.rend_res_y = args.res_y
+    lfr_prp.integration_engine = args.engine
+    lfr_prp.save_rend_images = False
+
+    benchmarks = [
+        ("load_lfr_data", lambda: bench_load(addon, lfr_prp, 1)),
+        ("parse_poses", lambda: bench_parse_poses(addon, lfr_prp, args.repeat)),
+        ("create_curve_data_and_key_frames", lambda: bench_curve_and_keyframes(addon, lfr_prp, args.repeat)),
+        ("pre_frame_change_handler", lambda: bench_frame_change(addon, lfr_prp, args.frames)),
+        ("combine_images", lambda: bench_combine_images(addon, lfr_prp, args.range_sizes)),
+        ("blend_images", lambda: bench_blend_images(addon, args.res_x, args.res_y, args.repeat)),
+    ]
+
+    results = {}
+    benchmark_peak_rss = {} # the peak only grows, a benchmark raised it if it is above the previous one's
+    for name, benchmark in benchmarks:
+        print(f"benchmark: {name}")
+        results[name] = benchmark()
+        benchmark_peak_rss[name] = peak_rss_mb()
+
+    report = {
+        "commit": get_commit(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "blender_version": bpy.app.version_string,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "recording": {"folder": args.folder, "every_nth_frame": args.every_nth, "poses": len(addon_module(addon, "poses").get_pose_table(lfr_prp))},
+        "resolution": [args.res_x, args.res_y],
+        "results": results,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_mb_after_benchmark": benchmark_peak_rss,
+    }
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"benchmark results written to {args.output}")
+
+def main():
+    run(create_arg_parser().parse_args(headless.get_script_args(sys.argv)))
+
+if __name__ == "__main__":
+    main()
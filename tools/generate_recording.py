@@ -0,0 +1,332 @@
+import argparse
+import json
+import math
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+# Writes a synthetic light-field recording in the layout the add-on expects
+# (see correctly_set_or_overwrite_path_strings):
+#
+#   <output>/<name>/matched_poses.json
+#   <output>/<name>/frame_000000.jpg ...
+#   <output>/<name>/mask.png
+#   <output>/Data/dem/dem.glb
+#
+#   python tools/generate_recording.py --output /tmp/lfr --frames 1000
+#   blender -b -P tools/generate_recording.py -- --output /tmp/lfr --frames 1000 (without Pillow)
+#
+# Coordinates follow the recordings: json/glTF space with z as terrain height, the add-on maps
+# (x, y, z) to blender (x, -z, y). Every image is a pinhole view (lens = fovy in mm on a 36 mm
+# sensor, like the add-on's cameras) of a procedural ground texture draped over the DEM,
+# so the views line up when focusing on the terrain.
+
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    PILImage = None
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+SENSOR_WIDTH = 36.0
+EULER_HOT_FIX = np.array((0.0, 180.0, -90.0)) # added by the add-on to Euler rotations (poses.parse_pose_json)
+
+def get_script_args(argv):
+    # inside blender everything after "--" belongs to the script
+    if bpy is not None:
+        return argv[argv.index("--") + 1:] if "--" in argv else []
+    return argv[1:]
+
+def create_arg_parser():
+    arg_parser = argparse.ArgumentParser(description="Synthetic light-field recording generator")
+    arg_parser.add_argument("--output", required=True, help="root folder, gets <name>/ and Data/dem/")
+    arg_parser.add_argument("--name", default="recording", help="name of the recording folder")
+    arg_parser.add_argument("--frames", type=int, default=1000)
+    arg_parser.add_argument("--res-x", type=int, default=512)
+    arg_parser.add_argument("--res-y", type=int, default=512)
+    arg_parser.add_argument("--fovy", type=float, default=50.0, help="written fovy, used as focal length in mm by the add-on")
+    arg_parser.add_argument("--pattern", choices=("line", "lawnmower", "orbit"), default="lawnmower")
+    arg_parser.add_argument("--altitude", type=float, default=35.0, help="flight height above the base terrain height")
+    arg_parser.add_argument("--speed", type=float, default=5.0, help="meters per second")
+    arg_parser.add_argument("--fps", type=float, default=10.0, help="frames per second of the recording (timestamps)")
+    arg_parser.add_argument("--area", type=float, default=200.0, help="edge length of the square area in meters")
+    arg_parser.add_argument("--dem-resolution", type=int, default=128, help="DEM vertices per edge")
+    arg_parser.add_argument("--terrain-height", type=float, default=5.0, help="amplitude of the terrain hills")
+    arg_parser.add_argument("--rotation", choices=("quaternion", "euler"), default="quaternion")
+    arg_parser.add_argument("--key", choices=("images", "frames"), default="images", help="top level key of the poses file")
+    arg_parser.add_argument("--no-images", action="store_true", help="only write the poses, mask and DEM")
+    arg_parser.add_argument("--jpeg-quality", type=int, default=90)
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes writing images (Pillow only)")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    return arg_parser
+
+# ---- terrain
+
+def terrain_height(x, y, amplitude):
+    return (amplitude * np.sin(x * 0.03) * np.cos(y * 0.025)
+            + amplitude * 0.5 * np.sin(x * 0.011 + y * 0.017))
+
+def ground_color(x, y):
+    # checkerboard with colored blobs, distinct enough to see misaligned views
+    checker = ((np.floor(x / 4.0) + np.floor(y / 4.0)) % 2).astype(np.float32)
+    base = 0.35 + 0.3 * checker
+    r = base + 0.35 * np.maximum(0, np.sin(x * 0.05) * np.sin(y * 0.07))
+    g = base + 0.35 * np.maximum(0, np.cos(x * 0.04 + 1.0) * np.sin(y * 0.05))
+    b = base + 0.35 * np.maximum(0, np.sin(x * 0.06 + y * 0.03))
+    return np.clip(np.stack((r, g, b), axis=-1), 0.0, 1.0)
+
+def write_dem_glb(path, area, resolution, amplitude):
+    # grid mesh in glTF space (z = height), a single mesh primitive with positions and indices
+    coords = np.linspace(-area * 0.75, area * 0.75, resolution, dtype=np.float32)
+    gx, gy = np.meshgrid(coords, coords)
+    gz = terrain_height(gx, gy, amplitude).astype(np.float32)
+    positions = np.stack((gx, gy, gz), axis=-1).reshape(-1, 3).astype(np.float32)
+
+    rows = np.arange(resolution - 1)
+    a = (rows[:, None] * resolution + rows[None, :]).reshape(-1)
+    b = a + 1
+    c = a + resolution
+    d = c + 1
+    indices = np.stack((a, c, b, b, c, d), axis=-1).reshape(-1).astype(np.uint32)
+
+    position_bytes = positions.tobytes()
+    index_bytes = indices.tobytes()
+    binary = position_bytes + index_bytes
+    binary += b"\0" * (-len(binary) % 4)
+
+    gltf = {
+        "asset": {"version": "2.0", "generator": "LFR synthetic recording generator"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0, "name": "DEM"}],
+        "meshes": [{"name": "DEM", "primitives": [{"attributes": {"POSITION": 0}, "indices": 1}]}],
+        "buffers": [{"byteLength": len(binary)}],
+        "bufferViews": [
+            {"buffer": 0, "byteOffset": 0, "byteLength": len(position_bytes), "target": 34962},
+            {"buffer": 0, "byteOffset": len(position_bytes), "byteLength": len(index_bytes), "target": 34963},
+        ],
+        "accessors": [
+            {"bufferView": 0, "componentType": 5126, "count": len(positions), "type": "VEC3",
+             "min": positions.min(axis=0).tolist(), "max": positions.max(axis=0).tolist()},
+            {"bufferView": 1, "componentType": 5125, "count": len(indices), "type": "SCALAR"},
+        ],
+    }
+    json_chunk = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+    json_chunk += b" " * (-len(json_chunk) % 4)
+
+    with open(path, "wb") as file:
+        file.write(struct.pack("<III", 0x46546C67, 2, 12 + 8 + len(json_chunk) + 8 + len(binary)))
+        file.write(struct.pack("<II", len(json_chunk), 0x4E4F534A))
+        file.write(json_chunk)
+        file.write(struct.pack("<II", len(binary), 0x004E4942))
+        file.write(binary)
+
+# ---- flight
+
+def flight_path(pattern, frame_count, area, speed, fps, seed):
+    # json space positions (x, y) and headings (radians) along the path
+    distance = np.arange(frame_count) * (speed / fps)
+    half = area * 0.5
+
+    if pattern == "line":
+        x = -half + distance % area
+        y = np.zeros(frame_count)
+        heading = np.zeros(frame_count)
+    elif pattern == "orbit":
+        radius = half * 0.6
+        angle = distance / radius
+        x = radius * np.cos(angle)
+        y = radius * np.sin(angle)
+        heading = angle + math.pi * 0.5
+    else:
+        # lawnmower: parallel strips 20 m apart, turning at the area border
+        strip_spacing = 20.0
+        strip_count = max(1, int(area // strip_spacing))
+        strip = (distance // area).astype(np.int64) % strip_count
+        along = distance % area
+        forward = strip % 2 == 0
+        x = np.where(forward, -half + along, half - along)
+        y = -half + strip * strip_spacing
+        heading = np.where(forward, 0.0, math.pi)
+
+    jitter = np.random.default_rng(seed).normal(0.0, 0.05, (frame_count, 2)) # GPS noise
+    return x + jitter[:, 0], y + jitter[:, 1], heading
+
+def quaternion_multiply(a, b):
+    aw, ax, ay, az = a
+    bw, bx, by, bz = b
+    return np.stack((
+        aw * bw - ax * bx - ay * by - az * bz,
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw,
+    ))
+
+def downward_camera_quaternions(heading):
+    # blender space w, x, y, z: camera looking straight down (+Y is down in the add-on's scenes),
+    # turned around the vertical (Y) axis by the heading
+    half = np.full_like(heading, math.pi * 0.25)
+    look_down = np.stack((np.cos(half), np.sin(half), np.zeros_like(half), np.zeros_like(half)))
+    yaw = np.stack((np.cos(heading * 0.5), np.zeros_like(heading), np.sin(heading * 0.5), np.zeros_like(heading)))
+    return quaternion_multiply(yaw, look_down).T
+
+def quaternion_to_matrices(q):
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    return np.stack((
+        np.stack((1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)), axis=-1),
+        np.stack((2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)), axis=-1),
+        np.stack((2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)), axis=-1),
+    ), axis=1)
+
+def matrices_to_euler_xyz(m):
+    # inverse of Euler(..., 'XYZ').to_matrix() (R = Rz * Ry * Rx), degrees
+    y = np.arcsin(np.clip(-m[:, 2, 0], -1.0, 1.0))
+    x = np.arctan2(m[:, 2, 1], m[:, 2, 2])
+    z = np.arctan2(m[:, 1, 0], m[:, 0, 0])
+    return np.degrees(np.stack((x, y, z), axis=-1))
+
+def to_json_rotations(blender_quaternions, rotation_format):
+    # the add-on passes the stored x, y, z, w values on to blender in w, x, y, z order,
+    # so the blender quaternion (w, x, y, z) is written as is
+    if rotation_format == "quaternion":
+        return blender_quaternions
+
+    # Euler rotations are converted to a quaternion (x, y, z, w) that goes through the same reordering,
+    # so the Euler angles have to describe the quaternion (w=z, x=w, y=x, z=y) minus the hot fix
+    reordered = blender_quaternions[:, [3, 0, 1, 2]]
+    return matrices_to_euler_xyz(quaternion_to_matrices(reordered)) - EULER_HOT_FIX
+
+# ---- images
+
+def render_view(location, quaternion, fovy, width, height, amplitude):
+    # top-down 8 bit RGB view of the textured terrain, blender space camera
+    focal_px = fovy / SENSOR_WIDTH * max(width, height)
+    px = (np.arange(width) + 0.5 - width * 0.5) / focal_px
+    py = (height * 0.5 - (np.arange(height) + 0.5)) / focal_px
+    local_x, local_y = np.meshgrid(px, py)
+    local = np.stack((local_x, local_y, -np.ones_like(local_x)), axis=-1)
+    directions = local @ quaternion_to_matrices(quaternion[None])[0].T
+
+    # fixed point iteration onto the terrain: height = -blender y, json (x, y) = blender (x, z)
+    dir_y = np.where(directions[..., 1] > 1e-6, directions[..., 1], 1e-6)
+    t = -location[1] / dir_y
+    for i in range(6):
+        ground_x = location[0] + directions[..., 0] * t
+        ground_y = location[2] + directions[..., 2] * t
+        t = (-terrain_height(ground_x, ground_y, amplitude) - location[1]) / dir_y
+
+    ground_x = location[0] + directions[..., 0] * t
+    ground_y = location[2] + directions[..., 2] * t
+    return (ground_color(ground_x, ground_y) * 255.0 + 0.5).astype(np.uint8)
+
+def write_view(args_tuple):
+    path, location, quaternion, fovy, width, height, amplitude, quality = args_tuple
+    PILImage.fromarray(render_view(location, quaternion, fovy, width, height, amplitude)).save(path, quality=quality)
+
+def write_image_with_bpy(path, rgb, quality):
+    height, width = rgb.shape[0], rgb.shape[1]
+    rgba = np.ones((height, width, 4), dtype=np.float32)
+    rgba[..., :3] = rgb[..., :3] / 255.0
+    img = bpy.data.images.new(name=os.path.basename(path), width=width, height=height, alpha=False)
+    img.pixels.foreach_set(rgba[::-1].reshape(-1)) # blender pixels are bottom-up
+    img.filepath_raw = path
+    img.file_format = 'JPEG'
+    bpy.context.scene.render.image_settings.quality = quality
+    img.save()
+    bpy.data.images.remove(img)
+
+def write_gray_png(path, gray):
+    # minimal 8 bit grayscale PNG writer, needs neither Pillow nor bpy
+    def chunk(chunk_type, data):
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+
+    height, width = gray.shape
+    raw_rows = np.hstack((np.zeros((height, 1), dtype=np.uint8), gray)).tobytes() # filter type 0 per row
+    with open(path, "wb") as file:
+        file.write(b"\x89PNG\r\n\x1a\n")
+        file.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)))
+        file.write(chunk(b"IDAT", zlib.compress(raw_rows, 6)))
+        file.write(chunk(b"IEND", b""))
+
+def write_mask(path, width, height):
+    # white inside, fading to black at the border (vignetting of the real masks)
+    u = np.abs(np.linspace(-1, 1, width))[None, :]
+    v = np.abs(np.linspace(-1, 1, height))[:, None]
+    edge = np.maximum(u, v)
+    write_gray_png(path, (np.clip((0.95 - edge) / 0.1, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8))
+
+# ---- main
+
+def generate(args):
+    if PILImage is None and bpy is None and not args.no_images:
+        print("Pillow is not installed, run the generator with blender -b -P or pass --no-images.")
+        raise ValueError("Pillow is not installed, run the generator with blender -b -P or pass --no-images.")
+
+    recording_path = os.path.join(args.output, args.name)
+    dem_folder = os.path.join(args.output, "Data", "dem")
+    os.makedirs(recording_path, exist_ok=True)
+    os.makedirs(dem_folder, exist_ok=True)
+
+    print(f"writing DEM ({args.dem_resolution}x{args.dem_resolution})")
+    write_dem_glb(os.path.join(dem_folder, "dem.glb"), args.area, args.dem_resolution, args.terrain_height)
+    write_mask(os.path.join(recording_path, "mask.png"), args.res_x, args.res_y)
+
+    x, y, heading = flight_path(args.pattern, args.frames, args.area, args.speed, args.fps, args.seed)
+    z = np.full(args.frames, args.altitude)
+    json_locations = np.stack((x, y, z), axis=-1)
+    blender_locations = np.stack((x, -z, y), axis=-1)
+    blender_quaternions = downward_camera_quaternions(heading)
+    rotations = to_json_rotations(blender_quaternions, args.rotation)
+
+    start_time = datetime(2024, 6, 1, 10, 0, 0, tzinfo=timezone.utc)
+    image_names = [f"frame_{i:06d}.jpg" for i in range(args.frames)]
+    frames = []
+    for i in range(args.frames):
+        frames.append({
+            "imagefile": image_names[i],
+            "location": json_locations[i].round(4).tolist(),
+            "rotation": rotations[i].round(7).tolist(),
+            "fovy": args.fovy,
+            "timestamp": (start_time + timedelta(seconds=i / args.fps)).isoformat(),
+        })
+
+    with open(os.path.join(recording_path, "matched_poses.json"), "w") as file:
+        json.dump({args.key: frames}, file)
+    print(f"wrote {args.frames} poses ({args.pattern}, {args.rotation})")
+
+    if args.no_images:
+        return recording_path
+
+    jobs = ((os.path.join(recording_path, image_names[i]), blender_locations[i], blender_quaternions[i],
+             args.fovy, args.res_x, args.res_y, args.terrain_height, args.jpeg_quality) for i in range(args.frames))
+
+    if PILImage is not None and args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            for done, _ in enumerate(executor.map(write_view, jobs, chunksize=16), start=1):
+                if done % 500 == 0:
+                    print(f"{done}/{args.frames} images")
+    else:
+        for done, job in enumerate(jobs, start=1):
+            if PILImage is not None:
+                write_view(job)
+            else:
+                path, location, quaternion, fovy, width, height, amplitude, quality = job
+                write_image_with_bpy(path, render_view(location, quaternion, fovy, width, height, amplitude), quality)
+            if done % 500 == 0:
+                print(f"{done}/{args.frames} images")
+
+    print(f"recording written to {recording_path}")
+    return recording_path
+
+def main():
+    generate(create_arg_parser().parse_args(get_script_args(sys.argv)))
+
+if __name__ == "__main__":
+    main()